@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+事件循环外的阻塞 I/O。
+
+bot.py 中读取数据文件、查询 SQLite、解析页面等阻塞操作都通过 run_blocking() 交给
+一个专用的有界线程池执行，不占用 asyncio 默认的线程池，磁盘变慢时也不会卡住更新处理。
+用户数据的写盘仍由 storage.UserDataStore 自己的单线程写入器负责（保证写入顺序）。
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import Gauge, Histogram
+
+IO_WORKERS = int(os.environ.get("BOT_IO_WORKERS", "4"))
+
+IO_SECONDS = Histogram("bot_io_seconds", "线程池中阻塞 I/O 的耗时（含排队）", ("op",))
+IO_IN_FLIGHT = Gauge("bot_io_in_flight", "线程池中排队和执行中的 I/O 操作数")
+
+_executor: ThreadPoolExecutor | None = None
+_lock = threading.Lock()
+_in_flight = 0
+
+
+def executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+            IO_IN_FLIGHT.set_function(lambda: _in_flight)
+        return _executor
+
+
+async def run_blocking(func, *args, op: str = "other", **kwargs):
+    """在 I/O 线程池中执行 func(*args, **kwargs) 并等待结果。"""
+    global _in_flight
+    loop = asyncio.get_running_loop()
+    _in_flight += 1
+    try:
+        with IO_SECONDS.time(op=op):
+            return await loop.run_in_executor(executor(), functools.partial(func, *args, **kwargs))
+    finally:
+        _in_flight -= 1
+
+
+def shutdown(wait: bool = True) -> None:
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+bot.py 整体基准测试：用合成的 user_data 驱动后台任务、命令处理和存储，
+消息发给 fake_bot.FakeBot（可模拟网络延迟和 429），结果以 JSON 输出，便于部署前后对比。
+
+每种用户规模在单独的子进程中运行（bot.py 在导入时加载数据，峰值 RSS 也按进程统计），
+数据文件放在临时目录中，不会碰到项目目录下的 user_data.json / user_data.db。
+
+测量的操作:
+- load_user_data / save_user_data（全量写盘、单用户写盘）
+- 全量写盘期间的事件循环延迟（在事件循环中一次拍完快照 vs. flush_async 分批拍快照）
+- check_expirations_job（入队耗时）以及发完全部提醒的吞吐量、send_message 延迟
+- check_datacenters_job（快照变化时，包含给订阅用户入队提醒）
+- fetch_datacenter_stats（数据文件未变化时）
+- info_command
+
+用法（在项目根目录执行）:
+    python benchmarks/bench_bot.py [--users 1000 10000 100000] [--machines 2] [--storage sqlite]
+                                   [--due-ratio 0.3] [--monitor-ratio 0.5] [--latency 0.02] [--retry-after-ratio 0.01]
+    python benchmarks/bench_bot.py --users 10000 --output report.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def generate_user_data(users: int, machines: int, due_ratio: float, monitor_ratio: float, seed: int) -> dict:
+    """
+    生成 user_data.json 格式的数据。
+    due_ratio 是"两天内到期、需要提醒"的机器比例，其余机器的到期时间在 3~5 天之后。
+    """
+    from models import TZ_GMT7
+
+    rng = random.Random(seed)
+    today = datetime.now(TZ_GMT7).date()
+    data = {}
+    for i in range(users):
+        user_machines = []
+        for j in range(machines):
+            host_type, days = ("hax", 5) if rng.random() < 0.5 else ("woiden", 3)
+            if rng.random() < due_ratio:
+                expires_in = rng.randint(1, 2)   # 明天或后天 0 点到期
+            else:
+                expires_in = rng.randint(3, days)
+            event_date = today + timedelta(days=expires_in - days)
+            user_machines.append({
+                "uuid": f"bench-{i}-{j}",
+                "remark": f"machine-{i}-{j}",
+                "host_type": host_type,
+                "renewal_days": days,
+                "last_event_date": event_date.isoformat(),
+                "last_hourly_reminder_sent": None,
+            })
+        u_data = {"machines": user_machines}
+        if rng.random() < monitor_ratio:
+            u_data["dc_monitor_enabled"] = True
+        elif rng.random() < monitor_ratio:
+            u_data["dc_subscriptions"] = [{"provider": "hax", "name": "US-Bench", "kind": "change"}]
+        data[str(100000000 + i)] = u_data
+    return data
+
+
+def write_snapshot(path: str, seq: int, total: int) -> None:
+    snapshot = {
+        "version": 1,
+        "seq": seq,
+        "ok": True,
+        "fetched_at": datetime.now().isoformat(timespec="seconds"),
+        "datacenters": {"US-Bench": total // 2, "EU-Bench": total - total // 2},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    # 保证每次写入的 mtime 不同，读取方才会重新解析
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + seq))
+
+
+def summarize(samples: list[float], count: int | None = None) -> dict:
+    """samples 为每次操作的耗时（秒）。"""
+    count = len(samples) if count is None else count
+    total = sum(samples)
+    ordered = sorted(samples)
+    return {
+        "count": count,
+        "total_s": round(total, 4),
+        "throughput_per_s": round(count / total, 1) if total else None,
+        "p50_ms": round(statistics.median(ordered) * 1000, 3) if ordered else None,
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3) if ordered else None,
+    }
+
+
+async def measure_loop_lag(operation, interval: float = 0.001) -> dict:
+    """执行 await operation() 的同时每隔 interval 秒醒来一次，统计事件循环被阻塞的时间。"""
+    loop = asyncio.get_running_loop()
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, loop.time() - start - interval))
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await operation()
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    lags.sort()
+    return {
+        "seconds": round(elapsed, 4),
+        "max_loop_lag_ms": round(lags[-1] * 1000, 3) if lags else None,
+        "p99_loop_lag_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000, 3) if lags else None,
+    }
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+async def run_benchmark(args, workdir: str) -> dict:
+    import bot
+    from fake_bot import FakeBot
+
+    logging.getLogger().setLevel(logging.ERROR)
+    report = {"users": args.run_one, "machines_per_user": args.machines, "storage": args.storage, "ops": {}}
+    ops = report["ops"]
+    rng = random.Random(args.seed)
+    user_ids = list(bot.user_data)
+
+    # 存储：全量加载、全量写盘、单用户写盘
+    start = time.perf_counter()
+    bot.user_data = bot.load_user_data()
+    ops["load_user_data"] = summarize([time.perf_counter() - start])
+    report["rss_after_load_mb"] = peak_rss_mb()
+
+    start = time.perf_counter()
+    bot.storage.store.save(bot.user_data).result()  # 与 save_user_data(user_data) 写盘的内容相同，但等待写入完成
+    ops["save_user_data_all"] = summarize([time.perf_counter() - start])
+
+    samples = []
+    for uid in rng.sample(user_ids, min(args.iterations, len(user_ids))):
+        start = time.perf_counter()
+        bot.save_user_data(bot.user_data, uid)
+        bot.storage.flush().result()
+        samples.append(time.perf_counter() - start)
+    ops["save_user_data_one"] = summarize(samples)
+
+    async def flush_blocking():
+        await asyncio.wrap_future(bot.storage.store.save(bot.user_data))
+
+    async def flush_async():
+        await asyncio.wrap_future(await bot.storage.store.save_async(bot.user_data))
+
+    ops["loop_lag_full_flush_blocking"] = await measure_loop_lag(flush_blocking)
+    ops["loop_lag_full_flush_async"] = await measure_loop_lag(flush_async)
+
+    fake = FakeBot(latency=args.latency, jitter=args.latency, retry_after_ratio=args.retry_after_ratio, seed=args.seed)
+    await bot.notifier.start(fake)
+    bot.rebuild_reminder_schedule()
+    bot.rebuild_subscription_index()
+
+    # 提醒：一轮任务把所有到期提醒放入队列，然后等待全部发完
+    start = time.perf_counter()
+    await bot.check_expirations_job(None)
+    enqueue_s = time.perf_counter() - start
+    await bot.notifier.join()
+    drain_s = time.perf_counter() - start
+    reminders = fake.sent
+    ops["check_expirations_job"] = summarize([enqueue_s])
+    ops["reminder_delivery"] = {
+        "sent": reminders,
+        "seconds": round(drain_s, 3),
+        "throughput_per_s": round(reminders / drain_s, 1) if drain_s else None,
+    }
+    samples = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        await bot.check_expirations_job(None)
+        samples.append(time.perf_counter() - start)
+    ops["check_expirations_job_idle"] = summarize(samples)
+
+    # 数据中心：每轮写出总数不同的快照，触发给订阅者的提醒
+    snapshot_path = os.path.join(workdir, bot.DATA_SNAPSHOT_FILE)
+    samples = []
+    sent_before = fake.sent
+    for seq in range(1, args.dc_rounds + 1):
+        write_snapshot(snapshot_path, seq, 10 + seq)
+        start = time.perf_counter()
+        await bot.check_datacenters_job(None)
+        samples.append(time.perf_counter() - start)
+    ops["check_datacenters_job"] = summarize(samples)
+    start = time.perf_counter()
+    await bot.notifier.join()
+    ops["datacenter_alert_delivery"] = {
+        "sent": fake.sent - sent_before,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+    samples = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        await bot.fetch_datacenter_stats()
+        samples.append(time.perf_counter() - start)
+    ops["fetch_datacenter_stats_unchanged"] = summarize(samples)
+
+    # /info：只替换 reply_text，其余走真实的处理函数
+    async def reply_text(text, **kwargs):
+        return None
+
+    samples = []
+    for uid in rng.sample(user_ids, min(args.iterations, len(user_ids))):
+        update = SimpleNamespace(
+            effective_user=SimpleNamespace(id=int(uid)),
+            message=SimpleNamespace(reply_text=reply_text),
+        )
+        start = time.perf_counter()
+        await bot.info_command(update, None)
+        samples.append(time.perf_counter() - start)
+    ops["info_command"] = summarize(samples)
+
+    ops["send_message"] = {**summarize(fake.send_latencies), "rate_limited": fake.rate_limited}
+    await bot.notifier.stop()
+    bot.storage.close()
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def run_one(args) -> None:
+    """子进程：在临时目录中生成数据，导入 bot 并运行一次基准。"""
+    with tempfile.TemporaryDirectory(prefix="bench-bot-") as workdir:
+        data = generate_user_data(args.run_one, args.machines, args.due_ratio, args.monitor_ratio, args.seed)
+        with open(os.path.join(workdir, "user_data.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        del data
+        write_snapshot(os.path.join(workdir, "HaxDataCenter.json"), 0, 10)
+
+        os.chdir(workdir)
+        os.environ.update({
+            "BOT_STORAGE": args.storage,
+            "BOT_SEND_RATE": str(args.send_rate),
+            "BOT_SEND_CHAT_RATE": str(args.send_rate),
+            "BOT_SEND_WORKERS": str(args.workers),
+            "BOT_SEND_QUEUE_SIZE": str(args.queue_size),
+        })
+        report = asyncio.run(run_benchmark(args, workdir))
+    print(json.dumps(report))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--machines", type=int, default=2, help="每个用户的机器数")
+    parser.add_argument("--due-ratio", type=float, default=0.3, help="两天内到期的机器比例")
+    parser.add_argument("--monitor-ratio", type=float, default=0.5, help="开启数据中心监控的用户比例（其余用户中同样比例单独订阅一个数据中心）")
+    parser.add_argument("--storage", choices=["sqlite", "json"], default="sqlite")
+    parser.add_argument("--latency", type=float, default=0.0, help="FakeBot 单次发送的基础延迟（秒），另加同样大小的随机抖动")
+    parser.add_argument("--retry-after-ratio", type=float, default=0.0, help="FakeBot 返回 429 的概率")
+    parser.add_argument("--send-rate", type=float, default=1e6, help="通知发送的全局速率上限（默认不限速，只测 bot 自身）")
+    parser.add_argument("--workers", type=int, default=8, help="通知发送 worker 数")
+    parser.add_argument("--queue-size", type=int, default=1000000, help="通知队列长度上限，默认足够容纳全部消息")
+    parser.add_argument("--iterations", type=int, default=200, help="单次操作类测量的重复次数")
+    parser.add_argument("--dc-rounds", type=int, default=5, help="数据中心快照变化的轮数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="同时把报告写入该文件")
+    parser.add_argument("--run-one", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        run_one(args)
+        return
+
+    reports = []
+    for users in args.users:
+        cmd = [sys.executable, os.path.abspath(__file__), "--run-one", str(users)] + _forward_args(args)
+        result = subprocess.run(cmd, capture_output=True, text=True, cwd=ROOT)
+        if result.returncode != 0:
+            sys.stderr.write(result.stderr)
+            raise SystemExit(f"{users} 个用户的基准运行失败")
+        reports.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    output = json.dumps({"generated_at": datetime.now().isoformat(timespec="seconds"), "runs": reports}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+def _forward_args(args) -> list[str]:
+    return [
+        "--machines", str(args.machines),
+        "--due-ratio", str(args.due_ratio),
+        "--monitor-ratio", str(args.monitor_ratio),
+        "--storage", args.storage,
+        "--latency", str(args.latency),
+        "--retry-after-ratio", str(args.retry_after_ratio),
+        "--send-rate", str(args.send_rate),
+        "--workers", str(args.workers),
+        "--queue-size", str(args.queue_size),
+        "--iterations", str(args.iterations),
+        "--dc-rounds", str(args.dc_rounds),
+        "--seed", str(args.seed),
+    ]
+
+
+if __name__ == "__main__":
+    main()
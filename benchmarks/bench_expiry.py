@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+比较续期提醒任务每一轮（tick）的 CPU 耗时。
+
+- legacy:    旧版做法，每轮对所有机器执行 strptime + ZoneInfo + fromisoformat；
+- records:   Machine 记录，每轮只比较预先算好的整数 expires_at / last_reminder_at；
+- scheduler: 提醒队列，每轮只弹出已到期的条目。
+
+用法（在项目根目录执行）:
+    python benchmarks/bench_expiry.py [--machines 100000] [--ticks 5]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import TZ_GMT7, Machine  # noqa: E402
+from scheduler import REMIND_INTERVAL, REMIND_WINDOW, ReminderScheduler  # noqa: E402
+
+
+def legacy_calculate_expiration_time(machine_info: dict) -> datetime:
+    # 旧版 bot.py 中的实现
+    tz = ZoneInfo("Asia/Bangkok")
+    event_date = datetime.strptime(machine_info["last_event_date"], "%Y-%m-%d")
+    event_date = event_date.replace(tzinfo=tz)
+    expire_date = event_date + timedelta(days=machine_info["renewal_days"])
+    return expire_date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def legacy_tick(machines: list[dict], now: datetime) -> int:
+    due = 0
+    for machine in machines:
+        time_left = legacy_calculate_expiration_time(machine) - now
+        if timedelta(0) < time_left <= timedelta(days=2):
+            last_sent = machine.get("last_hourly_reminder_sent")
+            if last_sent is None or (now - datetime.fromisoformat(last_sent) >= timedelta(hours=1)):
+                due += 1
+    return due
+
+
+def records_tick(machines: list[Machine], now_ts: int) -> int:
+    due = 0
+    for machine in machines:
+        seconds_left = machine.expires_at - now_ts
+        if 0 < seconds_left <= REMIND_WINDOW:
+            if machine.last_reminder_at is None or now_ts - machine.last_reminder_at >= REMIND_INTERVAL:
+                due += 1
+    return due
+
+
+def generate(count: int, now: datetime) -> list[dict]:
+    rng = random.Random(42)
+    machines = []
+    for i in range(count):
+        event = now - timedelta(days=rng.randint(0, 6))
+        last_sent = now - timedelta(minutes=rng.randint(0, 180)) if rng.random() < 0.3 else None
+        machines.append({
+            "uuid": f"m{i}",
+            "remark": f"machine-{i}",
+            "host_type": "hax" if i % 2 else "woiden",
+            "renewal_days": 5 if i % 2 else 3,
+            "last_event_date": event.strftime("%Y-%m-%d"),
+            "last_hourly_reminder_sent": last_sent.isoformat() if last_sent else None,
+        })
+    return machines
+
+
+def cpu_per_tick(fn, ticks: int) -> tuple[float, int]:
+    result = 0
+    start = time.process_time()
+    for _ in range(ticks):
+        result = fn()
+    return (time.process_time() - start) / ticks * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--machines", type=int, default=100000)
+    parser.add_argument("--ticks", type=int, default=5)
+    args = parser.parse_args()
+
+    now = datetime.now(TZ_GMT7)
+    now_ts = int(now.timestamp())
+    dicts = generate(args.machines, now)
+    records = [Machine.from_dict(m) for m in dicts]
+
+    scheduler = ReminderScheduler()
+    for m in records:
+        scheduler.schedule("u", m.uuid, m.expires_at, m.last_reminder_at, now_ts)
+
+    legacy_ms, legacy_due = cpu_per_tick(lambda: legacy_tick(dicts, now), args.ticks)
+    records_ms, records_due = cpu_per_tick(lambda: records_tick(records, now_ts), args.ticks)
+    # 队列弹出后条目就被移除，只有第一轮有实际工作，因此单独计时一次
+    start = time.process_time()
+    scheduler_due = len(scheduler.pop_due(now_ts))
+    scheduler_ms = (time.process_time() - start) * 1000
+
+    print(json.dumps({
+        "machines": args.machines,
+        "ticks": args.ticks,
+        "due": {"legacy": legacy_due, "records": records_due, "scheduler": scheduler_due},
+        "cpu_ms_per_tick": {
+            "legacy": round(legacy_ms, 2),
+            "records": round(records_ms, 2),
+            "scheduler": round(scheduler_ms, 2),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+对比 hax.py 两种页面解析方式的耗时和内存。
+
+用法（在项目根目录执行）:
+    python benchmarks/bench_parser.py [--rounds 200] [--fixture benchmarks/fixtures/hax_data_center.html]
+
+内存为 tracemalloc 统计的 Python 侧峰值，lxml 在 C 层分配的内存不计入。
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hax  # noqa: E402
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "hax_data_center.html")
+
+
+def measure(parse, html, rounds):
+    parse(html)  # 预热
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        parse(html)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    tracemalloc.start()
+    parse(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "mean_ms": round(sum(timings) / rounds * 1000, 3),
+        "p50_ms": round(timings[rounds // 2] * 1000, 3),
+        "p99_ms": round(timings[min(rounds - 1, int(rounds * 0.99))] * 1000, 3),
+        "python_peak_kb": round(peak / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--fixture", default=DEFAULT_FIXTURE)
+    args = parser.parse_args()
+
+    with open(args.fixture, "r", encoding="utf-8") as f:
+        html = f.read()
+
+    fast = hax._parse_fast(html)
+    soup = hax._parse_with_soup(html)["datacenters"]
+    if fast != soup:
+        sys.exit(f"两种解析方式的结果不一致:\nfast={fast}\nsoup={soup}")
+
+    report = {
+        "fixture": os.path.relpath(args.fixture),
+        "bytes": len(html.encode("utf-8")),
+        "datacenters": len(fast),
+        "rounds": args.rounds,
+        "fast": measure(hax._parse_fast, html, args.rounds),
+        "soup": measure(hax._parse_with_soup, html, args.rounds),
+    }
+    report["speedup"] = round(report["soup"]["mean_ms"] / report["fast"]["mean_ms"], 1)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+冷启动基准：从启动 Python 进程到处理完第一条更新（/start）的耗时，结果以 JSON 输出。
+
+每种用户规模在临时目录中生成 user_data.json（格式同 bench_bot.py），先由存储后端加载一次
+（SQLite 时完成迁移），再分别在子进程中启动两次:
+- backend:  没有状态快照，从存储后端完整加载；退出时写出快照（close_s 即写快照的耗时）；
+- snapshot: 从上一次写出的状态快照加载。
+子进程中导入 bot，用 fake_bot.FakeRequest 代替网络层创建完整的 Application，
+initialize（getMe）后投递 benchmarks/fixtures/updates/start.json，记录 bot.py 自己统计的各阶段耗时。
+
+另外以 python -X importtime 导入 bot，按顶层包汇总导入耗时（self 时间之和），找出拖慢启动的依赖。
+
+用法（在项目根目录执行）:
+    python benchmarks/bench_startup.py [--users 1000 10000 100000] [--machines 2] [--storage sqlite]
+    python benchmarks/bench_startup.py --users 100000 --output startup.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_bot import generate_user_data, peak_rss_mb, write_snapshot  # noqa: E402
+
+START_UPDATE = os.path.join(ROOT, "benchmarks", "fixtures", "updates", "start.json")
+STATE_FILE = "user_data.state"
+
+
+async def first_update(spawned_at: float) -> dict:
+    """子进程：导入 bot，离线启动 Application 并处理一条 /start。"""
+    import bot
+    import startup
+    from fake_bot import FakeRequest
+    from telegram import Update
+
+    imported_at = time.time()
+    request = FakeRequest()
+    application = bot.build_application("123456:BENCH", request=request)
+    startup.mark("注册处理器和任务")
+    await application.initialize()
+    await bot.on_startup(application)
+    with open(START_UPDATE, "r", encoding="utf-8") as f:
+        update = Update.de_json(json.load(f), application.bot)
+    await application.process_update(update)
+    handled_at = time.time()
+
+    await bot.on_shutdown(application)
+    await application.shutdown()
+    started = time.perf_counter()
+    bot.storage.close()
+    return {
+        "loaded_from": bot.storage.loaded_from,
+        "users": len(bot.user_data),
+        "import_bot_s": round(imported_at - spawned_at, 3),
+        "first_update_s": round(handled_at - spawned_at, 3),
+        "close_s": round(time.perf_counter() - started, 3),
+        "api_calls": request.calls,
+        "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in startup.phases.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def import_breakdown(env: dict, cwd: str, top: int) -> dict:
+    """python -X importtime -c "import bot"，按顶层包汇总 self 耗时（毫秒）。"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {ROOT!r}); import bot"],
+        capture_output=True, text=True, cwd=cwd, env=env,
+    )
+    packages = defaultdict(float)
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        ms = int(self_us) / 1000
+        packages[name.strip().split(".")[0]] += ms
+        total += ms
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {"total_ms": round(total, 1), "packages_ms": {name: round(ms, 1) for name, ms in ranked}}
+
+
+def run_child(args, workdir: str, env: dict, mode: str) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--run-one", mode, "--spawned-at", repr(time.time())]
+    result = subprocess.run(cmd, capture_output=True, text=True, cwd=workdir, env=env)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"{mode} 启动失败")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_users(args, users: int) -> dict:
+    from storage import open_storage
+
+    with tempfile.TemporaryDirectory(prefix="bench-startup-") as workdir:
+        data = generate_user_data(users, args.machines, args.due_ratio, args.monitor_ratio, args.seed)
+        with open(os.path.join(workdir, "user_data.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        del data
+        write_snapshot(os.path.join(workdir, "HaxDataCenter.json"), 0, 10)
+        # 先加载一次：SQLite 在这里完成从 JSON 的迁移，不计入后面的启动时间
+        store = open_storage(args.storage, os.path.join(workdir, "user_data.json"), os.path.join(workdir, "user_data.db"))
+        store.load()
+        store.close()
+
+        env = {
+            **os.environ,
+            "BOT_TOKEN": "123456:BENCH",
+            "BOT_STORAGE": args.storage,
+            "BOT_STATE_SNAPSHOT": STATE_FILE,
+            "HAX_HISTORY_DB": "",
+        }
+        report = {"users": users, "machines_per_user": args.machines, "storage": args.storage, "runs": {}}
+        report["runs"]["backend"] = run_child(args, workdir, env, "backend")
+        report["state_file_mb"] = round(os.path.getsize(os.path.join(workdir, STATE_FILE)) / 1e6, 2)
+        report["runs"]["snapshot"] = run_child(args, workdir, env, "snapshot")
+        if args.importtime:
+            report["imports"] = import_breakdown(env, workdir, args.top)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--machines", type=int, default=2, help="每个用户的机器数")
+    parser.add_argument("--due-ratio", type=float, default=0.3, help="两天内到期的机器比例")
+    parser.add_argument("--monitor-ratio", type=float, default=0.5, help="开启数据中心监控的用户比例")
+    parser.add_argument("--storage", choices=["sqlite", "json"], default="sqlite")
+    parser.add_argument("--no-importtime", dest="importtime", action="store_false", help="不统计导入耗时")
+    parser.add_argument("--top", type=int, default=15, help="导入耗时只列出前 N 个包")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="同时把报告写入该文件")
+    parser.add_argument("--run-one", choices=["backend", "snapshot"], help=argparse.SUPPRESS)
+    parser.add_argument("--spawned-at", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        print(json.dumps(asyncio.run(first_update(args.spawned_at))))
+        return
+
+    reports = [run_users(args, users) for users in args.users]
+    output = json.dumps({"generated_at": datetime.now().isoformat(timespec="seconds"), "runs": reports}, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,17 @@
+import startup  # 最先导入：从这里开始统计启动各阶段的耗时
 import logging
 import json
 import uuid
 from datetime import datetime, timedelta
 import os
 import asyncio
-from zoneinfo import ZoneInfo
+import functools
+import gc
+import signal
+import time
 
 from telegram import Update, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, Bot
 
-from telegram.error import Forbidden
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -17,8 +20,26 @@ from telegram.ext import (
     ContextTypes,
     ConversationHandler,
     CallbackQueryHandler,
+    TypeHandler,
 )
 
+import aio
+from aio import run_blocking
+from datacenter import AsyncDataCenterScraper, DatacenterSnapshot, SnapshotBus, SnapshotFileReader, normalize_stats
+from filewatch import FileWatcher
+from history import HistoryStore
+from info_pages import MachinePages, short_remark
+from machine_index import MachineIndex
+from metrics import Counter, Gauge, Histogram, monitor_loop_lag, start_http_server
+from models import TZ_BEIJING, TZ_GMT7, Machine
+from notifier import NotificationDispatcher
+from scheduler import ReminderScheduler
+from sharding import REPORT_PREFIX, ShardSupervisor, format_report, shard_of
+from storage import StateSnapshot, WriteBehindCache, open_storage
+from subscriptions import MAX_SUBSCRIPTIONS, MONITOR_ALL, SubscriptionIndex, alert_text, diff_snapshots, parse_subscription, user_subscriptions
+
+startup.mark("导入依赖")
+
 # --- 基本配置 ---
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
@@ -27,8 +48,55 @@ logger = logging.getLogger(__name__)
 
 # --- 文件名常量 ---
 USER_DATA_FILE = "user_data.json"
+USER_DB_FILE = "user_data.db"
 TOKEN_FILE = "token.txt"
-DATA_SOURCE_FILE = "HaxDataCenter.txt" # 数据源文件
+DATA_SOURCE_FILE = "HaxDataCenter.txt" # 数据源文件（兼容旧版 hax.py 的文本格式）
+DATA_SNAPSHOT_FILE = "HaxDataCenter.json" # hax.py 写出的 JSON 快照，存在时优先读取
+DC_BASELINE_FILE = "dc_baseline.json" # 上次推送时的数据中心快照，重启后作为对比基准
+DC_HISTORY_FILE = os.environ.get("HAX_HISTORY_DB", "dc_history.db") # 数据中心数量历史（history.py），供 /trend 查询
+STATE_SNAPSHOT_FILE = os.environ.get("BOT_STATE_SNAPSHOT", "user_data.state") # 退出时写出的二进制状态快照，加快下次启动；设为空字符串时不使用
+
+# --- 数据中心数据来源: "file"（默认，读取独立运行的 hax.py 写出的文件）或 "inprocess"（在 bot 进程内直接抓取） ---
+DC_SOURCE = os.environ.get("BOT_DC_SOURCE", "file")
+SCRAPE_INTERVAL = float(os.environ.get("BOT_SCRAPE_INTERVAL", "60"))
+# 文件模式下何时读取数据文件: "poll"（默认，每 60 秒一次）或 "watch"（文件写完后立即读取）
+DC_TRIGGER = os.environ.get("BOT_DC_TRIGGER", "poll")
+DC_WATCH_DEBOUNCE = float(os.environ.get("BOT_DC_WATCH_DEBOUNCE", "0.5"))
+TREND_MAX_HOURS = 24 * 30  # /trend 最多查询 30 天
+
+# --- 存储后端: "sqlite"（默认，首次启动自动从 user_data.json 迁移）或 "json" ---
+STORAGE_BACKEND = os.environ.get("BOT_STORAGE", "sqlite")
+# 写回缓存：最多每隔 FLUSH_INTERVAL 秒写一次盘，脏用户数达到 FLUSH_MAX_DIRTY 时立即写盘
+FLUSH_INTERVAL = float(os.environ.get("BOT_FLUSH_INTERVAL", "5"))
+FLUSH_MAX_DIRTY = int(os.environ.get("BOT_FLUSH_MAX_DIRTY", "500"))
+
+# --- 通知发送：并发 worker 数、全局每秒消息数、单个聊天每秒消息数 ---
+SEND_WORKERS = int(os.environ.get("BOT_SEND_WORKERS", "8"))
+SEND_GLOBAL_RATE = float(os.environ.get("BOT_SEND_RATE", "25"))
+SEND_CHAT_RATE = float(os.environ.get("BOT_SEND_CHAT_RATE", "1"))
+SEND_QUEUE_SIZE = int(os.environ.get("BOT_SEND_QUEUE_SIZE", "10000"))
+
+# --- 接收更新的方式: "polling"（默认）或 "webhook"（内嵌 HTTP 服务，见 webhook.py） ---
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+WEBHOOK_LISTEN = os.environ.get("BOT_WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("BOT_WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.environ.get("BOT_WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.environ.get("BOT_WEBHOOK_URL")  # 对外地址（不含路径）；未设置时不调用 setWebhook
+WEBHOOK_SECRET = os.environ.get("BOT_WEBHOOK_SECRET")
+UPDATE_QUEUE_SIZE = int(os.environ.get("BOT_UPDATE_QUEUE_SIZE", "1000"))
+CONCURRENT_UPDATES = int(os.environ.get("BOT_CONCURRENT_UPDATES", "1"))
+
+# --- 指标: 设置 BOT_METRICS_PORT 后在该端口提供 /metrics；分片 worker 依次使用后面的端口 ---
+METRICS_PORT = int(os.environ["BOT_METRICS_PORT"]) if os.environ.get("BOT_METRICS_PORT") else None
+METRICS_ADDR = os.environ.get("BOT_METRICS_ADDR", "127.0.0.1")
+
+# --- 分片: BOT_SHARDS > 0 时后台任务交给 N 个 worker 子进程，本进程只处理命令（需要 sqlite 存储） ---
+SHARD_COUNT = int(os.environ.get("BOT_SHARDS", "0"))
+SHARD_INDEX = int(os.environ["BOT_SHARD_INDEX"]) if os.environ.get("BOT_SHARD_INDEX") else None
+SHARD_TICK = float(os.environ.get("BOT_SHARD_TICK", "60"))
+SHARD_SYNC_INTERVAL = float(os.environ.get("BOT_SHARD_SYNC_INTERVAL", "10"))
+USE_FAKE_BOT = os.environ.get("BOT_FAKE_BOT") == "1"  # worker 使用 fake_bot.FakeBot，只打印不发送
+IS_SHARD_FRONT = SHARD_COUNT > 0 and SHARD_INDEX is None
 
 # --- 主机类型和续期周期 ---
 HOST_TYPES = {
@@ -36,42 +104,149 @@ HOST_TYPES = {
     "woiden": {"name": "Woiden主机", "days": 3},
 }
 
+# --- 指标 ---
+JOB_SECONDS = Histogram("bot_job_duration_seconds", "后台任务每轮耗时", ("job",))
+REMINDERS_ENQUEUED = Counter("bot_reminders_enqueued_total", "放入发送队列的续期提醒数")
+DC_ALERTS_ENQUEUED = Counter("bot_datacenter_alerts_enqueued_total", "放入发送队列的数据中心提醒数")
+LOOP_LAG = Histogram("bot_event_loop_lag_seconds", "事件循环延迟", buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+LOOP_LAG_LAST = Gauge("bot_event_loop_lag_last_seconds", "最近一次测得的事件循环延迟")
+DC_SNAPSHOT_AGE = Gauge("bot_datacenter_snapshot_age_seconds", "当前数据中心快照的年龄")
+DC_SUBSCRIPTIONS = Gauge("bot_datacenter_subscriptions", "数据中心订阅数（含 /monitor）")
+REMINDERS_SCHEDULED = Gauge("bot_reminders_scheduled", "提醒队列中的机器数")
+STARTUP_SECONDS = Gauge("bot_startup_seconds", "启动各阶段的耗时", ("phase",))
+
+def timed_job(name: str):
+    """记录后台任务每一轮的耗时；未启用指标时直接调用原函数。"""
+    def decorator(func):
+        if METRICS_PORT is None:
+            return func
+        @functools.wraps(func)
+        async def wrapper(context):
+            with JOB_SECONDS.time(job=name):
+                return await func(context)
+        return wrapper
+    return decorator
+
+loop_lag_task: asyncio.Task | None = None
+
+def start_metrics(port: int) -> None:
+    start_http_server(port, METRICS_ADDR)
+    DC_SNAPSHOT_AGE.set_function(lambda: time.time() - snapshot_bus.latest.taken_at if snapshot_bus.latest else None)
+    DC_SUBSCRIPTIONS.set_function(lambda: len(dc_subscriptions))
+    REMINDERS_SCHEDULED.set_function(lambda: len(reminder_scheduler))
+
+def start_loop_lag_monitor() -> None:
+    global loop_lag_task
+    if METRICS_PORT is not None:
+        loop_lag_task = asyncio.create_task(monitor_loop_lag(LOOP_LAG, LOOP_LAG_LAST))
+
+async def stop_loop_lag_monitor() -> None:
+    if loop_lag_task is not None:
+        loop_lag_task.cancel()
+        await asyncio.gather(loop_lag_task, return_exceptions=True)
+
+
 # --- Conversation Handler 状态定义 ---
 ASK_REMARK, ASK_HOST_TYPE, ASK_CREATION_DATE = range(3)
 DEL_AWAIT_NUMBER = range(3, 4)
+IMPORT_AWAIT_FILE = 4
+
+# --- 机器导入/导出 ---
+IMPORT_MAX_BYTES = 1024 * 1024
+IMPORT_MAX_MACHINES = 500
+IMPORT_MAX_RENEWAL_DAYS = 3650
+DELETE_BUTTONS_MAX = 30  # /delmachine 最多列出前 30 台机器（附删除按钮），其余可按 /info 中的序号输入删除；消息不会超过 4096 字符
 
 
 # --- 数据持久化函数 ---
+storage = WriteBehindCache(
+    open_storage(
+        STORAGE_BACKEND,
+        json_path=USER_DATA_FILE,
+        db_path=USER_DB_FILE,
+        writer_id="front" if SHARD_INDEX is None else f"shard-{SHARD_INDEX}",
+        # worker 手中的用户数据可能落后于前台进程（续期、删除、订阅），只写回提醒时间和屏蔽标记
+        owned_fields_only=SHARD_INDEX is not None,
+    ),
+    flush_interval=FLUSH_INTERVAL,
+    max_dirty=FLUSH_MAX_DIRTY,
+    # 分片 worker 只持有部分用户，只读取快照，由前台进程在退出时写出
+    snapshot=StateSnapshot(STATE_SNAPSHOT_FILE, readonly=SHARD_INDEX is not None) if STATE_SNAPSHOT_FILE else None,
+)
+
 def load_user_data() -> dict:
-    try:
-        with open(USER_DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+    return storage.load()
+
+def save_user_data(data: dict, *user_ids: str) -> None:
+    """标记指定用户（不传则为全部用户）需要保存，由写回缓存合并后批量写盘。"""
+    storage.mark_dirty(data, user_ids or None)
+
+@timed_job("flush")
+async def flush_user_data_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await storage.maybe_flush_async()
+
+async def sync_user_data() -> list[str]:
+    """分片模式：读取其它进程写入的用户；worker 只接收属于自己分片的用户。"""
+    accept = None if SHARD_INDEX is None else (lambda uid: shard_of(uid, SHARD_COUNT) == SHARD_INDEX)
+    updated = await storage.sync_async(user_data, accept)
+    for uid in updated:
+        # 同步来的用户数据是新对象，两种进程都要更新 uuid 索引和 /info 缓存，否则按钮会操作旧对象
+        machine_index.set_user(uid, user_data[uid].get("machines", []))
+        info_pages.invalidate(uid)
+        if SHARD_INDEX is not None:
+            if user_data[uid].get("is_blocked"):
+                for machine in user_data[uid].get("machines", []):
+                    reminder_scheduler.discard(machine.uuid)
+            else:
+                schedule_user_reminders(uid)
+            update_user_subscriptions(uid)
+    return updated
 
-def save_user_data(data: dict) -> None:
-    try:
-        with open(USER_DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        logger.error(f"保存用户数据失败: {e}")
+@timed_job("sync")
+async def sync_user_data_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await sync_user_data()
 
+# 加载用户数据、建立索引期间暂停 GC：一次性创建的大量对象都会长期存活，分代回收只会反复白白扫描它们
+gc.disable()
 user_data = load_user_data()
+machine_index = MachineIndex()
+machine_index.rebuild(user_data)
+gc.enable()
+# 启动时加载的用户数据会一直存活，移出 GC 的分代扫描范围，避免每次完整回收都遍历一遍而卡住事件循环
+gc.freeze()
+logger.info(f"已加载 {len(user_data)} 个用户（来源: {storage.loaded_from}），耗时 {startup.mark('加载用户数据'):.2f}s。")
+reminder_scheduler = ReminderScheduler()
+dc_subscriptions = SubscriptionIndex()
 
 
 # --- 用户屏蔽处理 ---
 def unblock_user(user_id: str):
     if user_data.get(user_id, {}).get("is_blocked"):
         user_data[user_id]["is_blocked"] = False
-        save_user_data(user_data)
+        save_user_data(user_data, user_id)
+        schedule_user_reminders(user_id)
         logger.info(f"用户 {user_id} 已重新互动，移除屏蔽标记。")
 
 def block_user(user_id: str):
-    user_data.setdefault(user_id, {})["is_blocked"] = True
-    save_user_data(user_data)
+    u_data = user_data.setdefault(user_id, {})
+    if u_data.get("is_blocked"):
+        return
+    u_data["is_blocked"] = True
+    save_user_data(user_data, user_id)
+    for machine in u_data.get("machines", []):
+        reminder_scheduler.discard(machine.uuid)
     logger.info(f"用户 {user_id} 已屏蔽机器人，标记为'blocked'。")
 
 
+notifier = NotificationDispatcher(
+    workers=SEND_WORKERS,
+    global_rate=SEND_GLOBAL_RATE,
+    per_chat_rate=SEND_CHAT_RATE,
+    queue_size=SEND_QUEUE_SIZE,
+    on_forbidden=block_user,
+)
+
+
 # --- Token 管理 ---
 def save_token_to_file(token: str) -> None:
     try:
@@ -103,59 +278,200 @@ def get_bot_token() -> str | None:
 
 
 # --- 辅助计算函数 ---
-def calculate_expiration_time(machine_info: dict) -> datetime:
-    tz = ZoneInfo("Asia/Bangkok")  # GMT+7
-    event_date = datetime.strptime(machine_info["last_event_date"], "%Y-%m-%d")
-    event_date = event_date.replace(tzinfo=tz)
-    expire_date = event_date + timedelta(days=machine_info["renewal_days"])
-    return expire_date.replace(hour=0, minute=0, second=0, microsecond=0)
-
-
 def format_timedelta(delta: timedelta) -> str:
     if delta.total_seconds() < 0: return "已过期"
     return f"{delta.days}天{delta.seconds // 3600}小时"
 
 
-# --- 数据中心监控 (从文件读取) ---
-async def fetch_datacenter_stats() -> tuple[dict | None, int | None]:
+def find_machine(user_id: str, machine_uuid: str) -> Machine | None:
+    return machine_index.find(user_id, machine_uuid)
+
+# /info 的分页缓存，添加/删除/续期机器后调用 info_pages.invalidate(user_id)
+info_pages = MachinePages(format_timedelta)
+
+
+# --- 机器增删改 ---
+# 以下函数同时维护 user_data、uuid 索引、提醒队列和 /info 缓存，每个操作只标记一次写盘
+def machines_changed(user_id: str) -> None:
+    save_user_data(user_data, user_id)
+    info_pages.invalidate(user_id)
+
+def add_machine(user_id: str, machine: Machine) -> None:
+    user_data.setdefault(user_id, {"machines": []}).setdefault("machines", []).append(machine)
+    machine_index.add(user_id, machine)
+    schedule_machine_reminder(user_id, machine)
+    machines_changed(user_id)
+
+# 按钮通过 uuid 索引定位机器；其它进程同步来的数据在 sync_user_data 中重建该用户的索引，索引中不会留下旧对象
+def delete_machine(user_id: str, machine_uuid: str) -> Machine | None:
+    machine = machine_index.find(user_id, machine_uuid)
+    if machine is None:
+        return None
+    user_data[user_id]["machines"].remove(machine)  # 列表保持用户添加的顺序（/delmachine 的序号），只能按对象移除
+    machine_index.remove(machine_uuid)
+    reminder_scheduler.discard(machine_uuid)
+    machines_changed(user_id)
+    return machine
+
+def renew_machines(user_id: str, machines: list[Machine], event_date: str) -> None:
+    for machine in machines:
+        machine.renew(event_date)
+        schedule_machine_reminder(user_id, machine)
+    machines_changed(user_id)
+
+def import_machines(user_id: str, machines: list[Machine]) -> tuple[int, int]:
     """
-    [重写] 根据用户提供的最新格式，从本地 HaxDataCenter.txt 文件读取数据。
+    按 uuid 合并导入的机器：本用户已有的替换，其余追加（uuid 已被其它用户使用或在文件中重复时重新生成）。
+    不规范的 uuid 已在 parse_import 中换成新的。
+    返回 (新增数, 更新数)。
     """
+    existing = user_data.setdefault(user_id, {"machines": []}).setdefault("machines", [])
+    positions = {m.uuid: i for i, m in enumerate(existing)}
+    seen = set()
+    added = updated = 0
+    for machine in machines:
+        if machine.uuid in positions and machine.uuid not in seen:
+            existing[positions[machine.uuid]] = machine
+            updated += 1
+        else:
+            if machine.uuid in seen or machine_index.owner(machine.uuid) is not None:
+                machine.uuid = str(uuid.uuid4())
+            existing.append(machine)
+            added += 1
+        seen.add(machine.uuid)
+    machine_index.set_user(user_id, existing)
+    schedule_user_reminders(user_id)
+    machines_changed(user_id)
+    return added, updated
+
+def parse_import(raw: bytes) -> list[Machine]:
+    """解析 /export 导出的 JSON（机器字典的列表），格式不对时抛出 ValueError（消息可直接回复给用户）。"""
     try:
-        with open(DATA_SOURCE_FILE, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-
-        if not lines: return {}, 0
-
-        stats, total_vps = {}, 0
-        for line in lines:
-            line = line.strip()
-            if not line.startswith("✅ 数据中心:") or "VPS 数量:" not in line:
-                continue
-            
-            if "Number of VPS Online" in line:
-                continue
-
-            try:
-                name_part = line.split("✅ 数据中心:")[1].split(",")[0].strip()
-                count_part = line.split("VPS 数量:")[1].strip().split(" ")[0]
-                
-                name = name_part.replace("./", "")
-                count = int(count_part)
-                
-                stats[name] = count
-                total_vps += count
-            except (IndexError, ValueError):
-                logger.warning(f"无法解析行: '{line}' in {DATA_SOURCE_FILE}。已跳过。")
-                continue
-        
-        return stats, total_vps
-    except FileNotFoundError:
-        logger.warning(f"数据文件 '{DATA_SOURCE_FILE}' 未找到。")
-        return None, None
-    except Exception as e:
-        logger.error(f"读取或解析 '{DATA_SOURCE_FILE}' 时出错: {e}")
-        return None, None
+        records = json.loads(raw)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("无法解析 JSON，请发送 /export 导出的文件。")
+    if isinstance(records, dict):
+        records = records.get("machines")
+    if not isinstance(records, list):
+        raise ValueError("JSON 内容应为机器列表。")
+    if len(records) > IMPORT_MAX_MACHINES:
+        raise ValueError(f"一次最多导入 {IMPORT_MAX_MACHINES} 台机器。")
+    machines = []
+    for i, record in enumerate(records, 1):
+        try:
+            if not isinstance(record, dict):
+                raise TypeError
+            machine = Machine.from_dict(record if is_canonical_uuid(record.get("uuid")) else {**record, "uuid": str(uuid.uuid4())})
+            if not isinstance(machine.remark, str):
+                raise TypeError
+        except (KeyError, TypeError, ValueError, OverflowError):
+            raise ValueError(f"第 {i} 台机器缺少字段或格式错误（需要 remark、renewal_days、last_event_date）。")
+        days = machine.renewal_days
+        if isinstance(days, bool) or not isinstance(days, int) or not 1 <= days <= IMPORT_MAX_RENEWAL_DAYS:
+            raise ValueError(f"第 {i} 台机器的 renewal_days 应为 1 到 {IMPORT_MAX_RENEWAL_DAYS} 之间的整数。")
+        machines.append(machine)
+    return machines
+
+def is_canonical_uuid(value) -> bool:
+    """uuid 会放进按钮的 callback_data（最多 64 字节），只接受标准格式的 uuid 字符串。"""
+    try:
+        return str(uuid.UUID(value)) == value
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+
+# --- 提醒调度 ---
+def schedule_machine_reminder(user_id: str, machine: Machine) -> None:
+    """根据机器当前的到期时间和上次提醒时间，更新它在提醒队列中的位置。"""
+    reminder_scheduler.schedule(user_id, machine.uuid, machine.expires_at, machine.last_reminder_at)
+
+def schedule_user_reminders(user_id: str) -> None:
+    for machine in user_data.get(user_id, {}).get("machines", []):
+        schedule_machine_reminder(user_id, machine)
+
+def rebuild_reminder_schedule() -> None:
+    """启动时根据 user_data 全量构建提醒队列，之后只做增量更新。"""
+    reminder_scheduler.clear()
+    for uid, u_data in user_data.items():
+        if not u_data.get("is_blocked"):
+            schedule_user_reminders(uid)
+    logger.info(f"提醒队列已构建，共 {len(reminder_scheduler)} 台机器待提醒。")
+
+
+# --- 数据中心监控 ---
+# 快照内容变化时发布到 snapshot_bus，由 notify_datacenter_subscribers 与上一份快照比较后推送；
+# 内容未变化时复用上一次的快照对象（连同已渲染好的消息文本）。
+snapshot_bus = SnapshotBus(DC_BASELINE_FILE)
+snapshot_bus.restore()
+datacenter_reader = SnapshotFileReader(DATA_SNAPSHOT_FILE, DATA_SOURCE_FILE)
+datacenter_scraper = AsyncDataCenterScraper()  # 数据源见 hax.SOURCES / HAX_SOURCES
+# 由负责抓取的进程（单进程模式或分片模式的前台进程）记录历史，否则只读 hax.py 写出的数据库
+dc_history = None
+if DC_HISTORY_FILE and DC_SOURCE == "inprocess" and SHARD_INDEX is None:
+    dc_history = HistoryStore(DC_HISTORY_FILE)
+datacenter_watcher = FileWatcher([DATA_SNAPSHOT_FILE, DATA_SOURCE_FILE], lambda: fetch_datacenter_stats(), debounce=DC_WATCH_DEBOUNCE)
+
+async def fetch_datacenter_stats() -> DatacenterSnapshot | None:
+    """
+    读取 hax.py 写出的数据（优先 JSON 快照，其次 HaxDataCenter.txt）。
+    文件未变化时不会重新解析，直接复用上一次的快照。
+    """
+    stats = await datacenter_reader.read_async()
+    if stats is None:
+        return None
+    return await snapshot_bus.publish(stats)
+
+async def scrape_datacenter_stats() -> DatacenterSnapshot | None:
+    """
+    单进程模式：在事件循环中并发抓取所有数据源；页面都未变化时返回最新快照。
+    某个数据源失败时沿用最新快照中它的数据，全部失败时返回 None。
+    分片模式下只有前台进程抓取，结果写成 JSON 快照，由各 worker 通过 check_datacenters_job 读取。
+    """
+    results = await datacenter_scraper.fetch()
+    if dc_history is not None:
+        fresh = {p: normalize_stats(r["datacenters"]) for p, r in results.items() if r["error"] is None}
+        await run_blocking(dc_history.record, fresh, op="history_record")
+    latest = snapshot_bus.latest
+    if latest is not None and all(r["unchanged"] for r in results.values()):
+        return latest
+    if IS_SHARD_FRONT:
+        await run_blocking(write_snapshot_file, results, op="write_snapshot_file")
+    providers = {}
+    for provider, result in results.items():
+        if result["error"] is None:
+            providers[provider] = normalize_stats(result["datacenters"])
+            continue
+        logger.warning(f"抓取 {provider} 数据中心页面失败: {result['error']}")
+        if latest is not None and provider in latest.providers:
+            providers[provider] = latest.providers[provider]
+    if not providers:
+        return None
+    return await snapshot_bus.publish(providers)
+
+def write_snapshot_file(results: dict[str, dict]) -> None:
+    """按 hax.py 的格式写出 JSON 快照（序号接着文件中已有的快照递增），内容不变时不写。"""
+    import hax
+    previous = hax.read_last_snapshot(DATA_SNAPSHOT_FILE)
+    snapshot = hax.build_snapshot(results, int(previous.get("seq", 0)) + 1, previous)
+    if snapshot["providers"] != previous.get("providers"):
+        hax.atomic_write(DATA_SNAPSHOT_FILE, json.dumps(snapshot, ensure_ascii=False))
+
+async def refresh_datacenter_stats() -> DatacenterSnapshot | None:
+    if DC_SOURCE == "inprocess":
+        return await scrape_datacenter_stats()
+    return await fetch_datacenter_stats()
+
+def update_user_subscriptions(user_id: str) -> None:
+    """用户的订阅或 /monitor 开关变化后更新倒排索引。"""
+    u_data = user_data.get(user_id)
+    if u_data is None:
+        dc_subscriptions.remove_user(user_id)
+    else:
+        dc_subscriptions.set_user(user_id, user_subscriptions(u_data))
+
+def rebuild_subscription_index() -> None:
+    dc_subscriptions.rebuild(user_data)
+    logger.info(f"数据中心订阅索引已构建，共 {len(dc_subscriptions)} 个订阅。")
 
 async def monitor_command(update: Update | CallbackQuery, context: ContextTypes.DEFAULT_TYPE) -> None:
     # 根据是 message 还是 query 判断用户和回复方式
@@ -170,11 +486,14 @@ async def monitor_command(update: Update | CallbackQuery, context: ContextTypes.
     u_data = user_data.setdefault(user_id, {"machines": []})
     is_enabled = u_data.get("dc_monitor_enabled", False)
 
+    subs = u_data.get("dc_subscriptions", [])
     text = (
         f"📊 **数据中心数量监控**\n\n"
         f"当前状态: **{'✅ 已开启' if is_enabled else '❌ 已关闭'}**\n"
-        f"上次记录的总服务器数: **{u_data.get('last_dc_total_count', 'N/A')}**"
+        f"单独订阅的数据中心: **{len(subs)}** 个（/subscriptions 查看）"
     )
+    if snapshot_bus.latest is not None:
+        text += f"\n{snapshot_bus.latest.summary_text}"
     keyboard = [
         [InlineKeyboardButton(f"{'❌ 关闭' if is_enabled else '✅ 开启'}监控", callback_data="toggle_dc_monitor")],
         [InlineKeyboardButton("🔄 手动刷新", callback_data="dc_manual_refresh")]
@@ -189,7 +508,8 @@ async def toggle_dc_monitor_callback(update: Update, context: ContextTypes.DEFAU
     u_data = user_data.setdefault(user_id, {"machines": []})
     is_enabled = u_data.get("dc_monitor_enabled", False)
     u_data["dc_monitor_enabled"] = not is_enabled
-    save_user_data(user_data)
+    save_user_data(user_data, user_id)
+    update_user_subscriptions(user_id)
     await monitor_command(query, context)
 
 async def manual_refresh_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -198,98 +518,212 @@ async def manual_refresh_callback(update: Update, context: ContextTypes.DEFAULT_
     user_id = str(query.from_user.id)
     unblock_user(user_id)
     
-    stats, total_count = await fetch_datacenter_stats()
+    snapshot = await refresh_datacenter_stats()
     
-    if total_count is not None:
-        user_data[user_id]["last_dc_total_count"] = total_count
-        save_user_data(user_data)
-        details = "\n".join([f"- {name}: **{count}**" for name, count in stats.items()]) if stats else "未能解析出任何数据中心的详情。"
-        message = f"🔄 **手动刷新成功**\n\n当前服务器总数: **{total_count}**\n\n**详情:**\n{details}"
-        await query.message.reply_text(text=message, parse_mode='Markdown')
+    if snapshot is not None:
+        await query.message.reply_text(text=snapshot.manual_refresh_text, parse_mode='Markdown')
+    elif DC_SOURCE == "inprocess":
+        await query.message.reply_text("❌ 刷新失败，暂时无法获取数据中心页面，请稍后再试。")
     else:
-        await query.message.reply_text(f"❌ 刷新失败，请检查服务器上是否存在 `{DATA_SOURCE_FILE}` 文件。")
+        await query.message.reply_text(f"❌ 刷新失败，请检查服务器上是否存在 `{DATA_SNAPSHOT_FILE}` 或 `{DATA_SOURCE_FILE}` 文件。")
+
+def get_history() -> HistoryStore | None:
+    """/trend 使用的历史库：本进程负责记录时直接复用，否则在数据库出现后以只读方式打开。"""
+    global dc_history
+    if dc_history is None and DC_HISTORY_FILE and os.path.exists(DC_HISTORY_FILE):
+        try:
+            dc_history = HistoryStore(DC_HISTORY_FILE, readonly=True)
+        except Exception as e:
+            logger.error(f"打开历史数据库 '{DC_HISTORY_FILE}' 时出错: {e}")
+    return dc_history
+
+def trend_text(hours: float, provider: str | None, name: str | None) -> str | None:
+    history = get_history()
+    return history.trend_text(hours, provider, name) if history is not None else None
+
+async def trend_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/trend [数据中心] [小时数]：各数据中心最近的数量走势（默认 24 小时）。"""
+    user_id = str(update.effective_user.id)
+    unblock_user(user_id)
+    args = list(context.args or [])
+    hours = 24.0
+    if args and args[-1].replace(".", "", 1).isdigit():
+        hours = min(float(args.pop()), TREND_MAX_HOURS)
+    provider = name = None
+    if args:
+        provider, _, name = args[0].rpartition("/")
+        provider = provider.lower() or None
+
+    text = await run_blocking(trend_text, hours, provider, name, op="history_trend") if hours > 0 else None
+    if text is None:
+        await update.message.reply_text("暂无历史数据。用法: /trend [数据中心] [小时数]，例如 /trend US-1 72")
+        return
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/subscribe <数据中心> [below|above 数量]：订阅单个数据中心的数量变化或阈值。"""
+    user_id = str(update.effective_user.id)
+    unblock_user(user_id)
+    try:
+        sub = parse_subscription(context.args or [], snapshot_bus.latest)
+    except ValueError as e:
+        await update.message.reply_text(str(e))
+        return
+
+    u_data = user_data.setdefault(user_id, {"machines": []})
+    subs = u_data.setdefault("dc_subscriptions", [])
+    # 同一个数据中心只保留一条订阅，新的阈值覆盖旧的
+    subs[:] = [d for d in subs if (d["provider"], d["name"]) != (sub.provider, sub.name)]
+    if len(subs) >= MAX_SUBSCRIPTIONS:
+        await update.message.reply_text(f"最多只能订阅 {MAX_SUBSCRIPTIONS} 个数据中心，请先用 /unsubscribe 取消一些。")
+        return
+    subs.append(sub.to_dict())
+    save_user_data(user_data, user_id)
+    update_user_subscriptions(user_id)
+    await update.message.reply_text(f"✅ 已订阅 {sub.describe()}")
+
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/unsubscribe <数据中心>|all"""
+    user_id = str(update.effective_user.id)
+    unblock_user(user_id)
+    subs = user_data.get(user_id, {}).get("dc_subscriptions", [])
+    if not context.args:
+        await update.message.reply_text("用法: /unsubscribe <数据中心> 或 /unsubscribe all")
+        return
+
+    target = context.args[0]
+    if target.lower() == "all":
+        remaining = []
+    elif "/" in target:
+        provider, name = target.split("/", 1)
+        remaining = [d for d in subs if (d["provider"], d["name"]) != (provider.lower(), name)]
+    else:
+        remaining = [d for d in subs if d["name"] != target]
+    if len(remaining) == len(subs):
+        await update.message.reply_text("没有找到对应的订阅。使用 /subscriptions 查看已有的订阅。")
+        return
+    user_data[user_id]["dc_subscriptions"] = remaining
+    save_user_data(user_data, user_id)
+    update_user_subscriptions(user_id)
+    await update.message.reply_text(f"已取消 {len(subs) - len(remaining)} 个订阅。")
+
+async def subscriptions_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = str(update.effective_user.id)
+    unblock_user(user_id)
+    u_data = user_data.get(user_id, {})
+    subs = user_subscriptions(u_data)
+    if not subs:
+        await update.message.reply_text("您还没有订阅任何数据中心。\n例如: /subscribe US-1 below 50")
+        return
+    lines = ["🔔 您的数据中心订阅：\n"]
+    lines.extend("- 所有服务商总数：数量变化（/monitor）" if sub == MONITOR_ALL else f"- {sub.describe()}" for sub in subs)
+    await update.message.reply_text("\n".join(lines))
 
 
 # --- 后台任务 ---
+@timed_job("datacenters")
 async def check_datacenters_job(context: ContextTypes.DEFAULT_TYPE) -> None:
-    users_to_check = [ (uid, u_data) for uid, u_data in user_data.items() if u_data.get("dc_monitor_enabled") and not u_data.get("is_blocked")]
-    if not users_to_check: return
-
-    stats, total_count = await fetch_datacenter_stats()
-    if total_count is None: return
-
-    changed = False
-    for user_id, u_data in users_to_check:
-        last_count = u_data.get("last_dc_total_count")
-        if last_count is None or last_count != total_count:
-            if last_count is not None:
-                details = "\n".join([f"- {name}: **{count}**" for name, count in stats.items()]) if stats else "未能解析出任何数据中心的详情。"
-                message = (f"🚨 **数据中心数量变化提醒** 🚨\n\n"
-                           f"服务器总数从 **{last_count}** 变为 **{total_count}**！\n\n**详情:**\n{details}")
-                try:
-                    await context.bot.send_message(chat_id=user_id, text=message, parse_mode='Markdown')
-                except Forbidden: block_user(user_id)
-                except Exception as e: logger.error(f"发送监控通知给 {user_id} 失败: {e}")
-            u_data["last_dc_total_count"] = total_count
-            changed = True
-    if changed: save_user_data(user_data)
-
-from zoneinfo import ZoneInfo
+    """读取数据文件；内容有变化时快照会发布到 snapshot_bus，由订阅者推送提醒。"""
+    await fetch_datacenter_stats()
 
+@timed_job("scrape")
+async def scrape_datacenters_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """单进程模式下代替 hax.py 的抓取循环。"""
+    await scrape_datacenter_stats()
+
+async def notify_datacenter_subscribers(snapshot: DatacenterSnapshot) -> None:
+    """
+    与共享的上一份快照比较一次，只查找发生变化的数据中心的订阅者；
+    触发的订阅相同的用户共用同一条消息文本。
+    """
+    if IS_SHARD_FRONT: return  # 分片模式下由各 worker 推送给自己分片的用户
+    previous = snapshot_bus.previous
+    if previous is None: return  # 第一份快照只作为对比基准
+    changes = diff_snapshots(previous, snapshot)
+    if not changes: return
+
+    messages = {}
+    enqueued = 0
+    for user_id, hits in dc_subscriptions.match(changes).items():
+        if user_data.get(user_id, {}).get("is_blocked"):
+            continue
+        key = tuple(hits)
+        message = messages.get(key)
+        if message is None:
+            message = messages[key] = alert_text(snapshot, hits, changes)
+        notifier.enqueue(user_id, message, parse_mode='Markdown')
+        enqueued += 1
+    DC_ALERTS_ENQUEUED.inc(enqueued)
+
+snapshot_bus.subscribe(notify_datacenter_subscribers)
+
+@timed_job("expirations")
 async def check_expirations_job(context: ContextTypes.DEFAULT_TYPE) -> None:
-    now = datetime.now(ZoneInfo("Asia/Bangkok"))  # 当前时间基于服务器所在时区 GMT+7
-    changed = False
+    """只处理提醒队列中已到期的机器，不再遍历全部用户和机器；消息交给 notifier 发送。"""
+    now = datetime.now(TZ_GMT7)  # 当前时间基于服务器所在时区 GMT+7
+    now_ts = now.timestamp()
 
-    for uid, u_data in user_data.items():
-        if u_data.get("is_blocked"):
+    for uid, machine_uuid in reminder_scheduler.pop_due(now_ts):
+        if user_data.get(uid, {}).get("is_blocked"):
+            continue
+        machine = find_machine(uid, machine_uuid)
+        if machine is None:
             continue
 
-        for machine in u_data.get("machines", []):
-            exp_dt = calculate_expiration_time(machine)
-            time_left = exp_dt - now
-
-            # 在两天内即将过期
-            if timedelta(0) < time_left <= timedelta(days=2):
-                last_sent = machine.get("last_hourly_reminder_sent")
-                if last_sent is None or (now - datetime.fromisoformat(last_sent) >= timedelta(hours=1)):
-                    exp_dt_beijing = exp_dt.astimezone(ZoneInfo("Asia/Shanghai"))
-
-                    # 获取续期链接
-                    host_type = machine.get("host_type")
-                    if host_type == "hax":
-                        renew_url = "https://hax.co.id/vps-renew/"
-                    elif host_type == "woiden":
-                        renew_url = "https://woiden.id/vps-renew/"
-                    else:
-                        renew_url = None
-
-                    msg = (
-                        f"⏳ 您的机器「{machine['remark']}」还剩 {format_timedelta(time_left)} 过期。\n"
-                        f"📅 到期时间: {exp_dt_beijing:%Y-%m-%d %H:%M}（北京时间）"
-                    )
-
-                    if renew_url:
-                        msg += f"\n🔗 续期地址: [点击前往]({renew_url})"
-
-                    btns = [[InlineKeyboardButton("✅ 我已续期", callback_data=f"renew_{machine['uuid']}")]]
-
-                    try:
-                        await context.bot.send_message(
-                            int(uid),
-                            msg,
-                            reply_markup=InlineKeyboardMarkup(btns),
-                            parse_mode='Markdown'
-                        )
-                        machine["last_hourly_reminder_sent"] = now.isoformat()
-                        changed = True
-                    except Forbidden:
-                        block_user(uid)
-                        break
-                    except Exception as e:
-                        logger.error(f"发送续期提醒给 {uid} 失败: {e}")
-
-    if changed:
-        save_user_data(user_data)
+        # 在两天内即将过期；否则（例如任务延迟导致已过期）只重新计算其位置
+        seconds_left = machine.expires_at - now_ts
+        if not (0 < seconds_left <= 2 * 24 * 3600):
+            schedule_machine_reminder(uid, machine)
+            continue
+
+        exp_dt = machine.expires_dt
+        time_left = exp_dt - now
+        exp_dt_beijing = exp_dt.astimezone(TZ_BEIJING)
+
+        # 获取续期链接
+        host_type = machine.host_type
+        if host_type == "hax":
+            renew_url = "https://hax.co.id/vps-renew/"
+        elif host_type == "woiden":
+            renew_url = "https://woiden.id/vps-renew/"
+        else:
+            renew_url = None
+
+        msg = (
+            f"⏳ 您的机器「{machine.remark}」还剩 {format_timedelta(time_left)} 过期。\n"
+            f"📅 到期时间: {exp_dt_beijing:%Y-%m-%d %H:%M}（北京时间）"
+        )
+
+        if renew_url:
+            msg += f"\n🔗 续期地址: [点击前往]({renew_url})"
+
+        btns = [[InlineKeyboardButton("✅ 我已续期", callback_data=f"renew_{machine.uuid}")]]
+
+        notifier.enqueue(
+            int(uid),
+            msg,
+            reply_markup=InlineKeyboardMarkup(btns),
+            parse_mode='Markdown',
+            on_sent=_reminder_sent_callback(uid, machine),
+            on_failed=_reminder_failed_callback(uid, machine),
+        )
+        REMINDERS_ENQUEUED.inc()
+
+
+def _reminder_sent_callback(uid: str, machine: Machine):
+    def on_sent() -> None:
+        # 发送成功：记录时间，一小时后再提醒
+        machine.last_reminder_at = int(time.time())
+        save_user_data(user_data, uid)
+        schedule_machine_reminder(uid, machine)
+    return on_sent
+
+def _reminder_failed_callback(uid: str, machine: Machine):
+    def on_failed(error: Exception) -> None:
+        # 发送失败：下一轮重试；用户已屏蔽机器人时不再提醒
+        if not user_data.get(uid, {}).get("is_blocked"):
+            schedule_machine_reminder(uid, machine)
+    return on_failed
 
 
 
@@ -301,8 +735,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "欢迎使用续期提醒与监控机器人!\n"
         "使用 /new 添加新机器。\n"
         "使用 /info 查看机器列表。\n"
-        "使用 /delmachine 删除机器。\n"
+        "使用 /delmachine 删除机器，/renewall 全部续期。\n"
+        "使用 /export 导出机器列表，/import 导入。\n"
         "使用 /monitor 设置数据中心监控。\n"
+        "使用 /subscribe 订阅单个数据中心，例如 /subscribe US-1 below 50。\n"
+        "使用 /subscriptions 查看订阅，/unsubscribe 取消订阅。\n"
+        "使用 /trend 查看数据中心数量走势。\n"
         "使用 /cancel 取消当前操作。")
 
 async def info_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -313,20 +751,28 @@ async def info_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.message.reply_text("您还没有机器。使用 /new 添加。")
         return
 
-    now = datetime.now(ZoneInfo("Asia/Bangkok"))
-    lines = ["🗂️ 您的机器列表：\n"]
-
-    for i, m in enumerate(user_data[user_id]["machines"]):
-        exp_dt = calculate_expiration_time(m)
-        time_left = exp_dt - now
-        lines.append(
-            f"{i+1}. 🖥️ 机器名称: 「{m['remark']}」\n"
-            f"   ⏳ 剩余时间: {format_timedelta(time_left)}\n"
-            f"   📅 到期时间: {exp_dt:%Y-%m-%d %H:%M}（GMT+7）\n"
-        )
+    text, markup = render_info_page(user_id, 0)
+    await update.message.reply_text(text, reply_markup=markup)
 
-    await update.message.reply_text("\n".join(lines))
+def render_info_page(user_id: str, page: int) -> tuple[str, InlineKeyboardMarkup | None]:
+    text, page, total = info_pages.render(user_id, user_data[user_id]["machines"], page, datetime.now(TZ_GMT7))
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️ 上一页", callback_data=f"info_page_{page - 1}"))
+    if page < total - 1:
+        buttons.append(InlineKeyboardButton("下一页 ➡️", callback_data=f"info_page_{page + 1}"))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
 
+async def info_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    user_id = str(query.from_user.id)
+    unblock_user(user_id)
+    if not user_data.get(user_id, {}).get("machines"):
+        await query.edit_message_text("您还没有机器。使用 /new 添加。")
+        return
+    text, markup = render_info_page(user_id, int(query.data.rsplit("_", 1)[1]))
+    await query.edit_message_text(text, reply_markup=markup)
 
 
 async def new_machine_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -357,13 +803,11 @@ async def received_creation_date(update: Update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text("日期格式错误，请重新输入 MM-DD 或 /cancel。"); return ASK_CREATION_DATE
     user_id = str(update.effective_user.id)
     host_type = context.user_data['host_type']
-    new_machine = { "uuid": str(uuid.uuid4()), "remark": context.user_data['remark'],
-                    "host_type": host_type, "renewal_days": HOST_TYPES[host_type]["days"],
-                    "last_event_date": creation_date.strftime("%Y-%m-%d"), "last_hourly_reminder_sent": None }
-    user_data[user_id]["machines"].append(new_machine)
-    save_user_data(user_data)
-    exp_dt = calculate_expiration_time(new_machine)
-    await update.message.reply_text(f"✅ 机器「{new_machine['remark']}」添加成功！\n首次过期: {exp_dt:%Y-%m-%d %H:%M} \n到期时间(GMT+7)： {exp_dt:%Y-%m-%d %H:%M}\n\n您可以使用 /info 查看机器列表，或 /delmachine 删除机器。")
+    new_machine = Machine(str(uuid.uuid4()), context.user_data['remark'], host_type,
+                          HOST_TYPES[host_type]["days"], creation_date.strftime("%Y-%m-%d"))
+    add_machine(user_id, new_machine)
+    exp_dt = new_machine.expires_dt
+    await update.message.reply_text(f"✅ 机器「{new_machine.remark}」添加成功！\n首次过期: {exp_dt:%Y-%m-%d %H:%M} \n到期时间(GMT+7)： {exp_dt:%Y-%m-%d %H:%M}\n\n您可以使用 /info 查看机器列表，或 /delmachine 删除机器。")
     context.user_data.clear()
     return ConversationHandler.END
 
@@ -373,8 +817,18 @@ async def delete_machine_command(update: Update, context: ContextTypes.DEFAULT_T
     machines = user_data.get(user_id, {}).get("machines", [])
     if not machines:
         await update.message.reply_text("您没有可删除的机器。"); return ConversationHandler.END
-    lines = ["请选择要删除的机器序号：\n"] + [f"{i+1}. 「{m['remark']}」" for i, m in enumerate(machines)]
-    await update.message.reply_text("\n".join(lines) + "\n\n请输入序号，或 /cancel 取消。")
+    shown = machines[:DELETE_BUTTONS_MAX]
+    lines = ["请选择要删除的机器序号：\n"] + [f"{i+1}. 「{short_remark(m.remark)}」" for i, m in enumerate(shown)]
+    if len(machines) > len(shown):
+        lines.append(f"……共 {len(machines)} 台机器，其余机器的序号请用 /info 查看。")
+    buttons = [
+        [InlineKeyboardButton(f"🗑️ {i+1}. {short_remark(m.remark)}", callback_data=f"del_{m.uuid}")]
+        for i, m in enumerate(shown)
+    ]
+    await update.message.reply_text(
+        "\n".join(lines) + "\n\n请点击按钮或输入序号，或 /cancel 取消。",
+        reply_markup=InlineKeyboardMarkup(buttons),
+    )
     return DEL_AWAIT_NUMBER
 
 async def received_delete_number(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -382,14 +836,90 @@ async def received_delete_number(update: Update, context: ContextTypes.DEFAULT_T
     try:
         idx = int(update.message.text) - 1
         if 0 <= idx < len(user_data[user_id]["machines"]):
-            deleted_m = user_data[user_id]["machines"].pop(idx)
-            save_user_data(user_data)
-            await update.message.reply_text(f"🗑️ 机器「{deleted_m['remark']}」已删除。")
+            deleted_m = delete_machine(user_id, user_data[user_id]["machines"][idx].uuid)
+            if deleted_m is None:
+                await update.message.reply_text("❌ 未找到对应机器，可能已被删除。")
+            else:
+                await update.message.reply_text(f"🗑️ 机器「{deleted_m.remark}」已删除。")
             return ConversationHandler.END
         else: raise ValueError
     except (ValueError, IndexError):
         await update.message.reply_text("无效序号。请重新输入或 /cancel。"); return DEL_AWAIT_NUMBER
 
+async def delete_button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """/delmachine 列表中的删除按钮；对话结束后按钮仍然有效。"""
+    query = update.callback_query
+    await query.answer()
+    user_id = str(query.from_user.id)
+    unblock_user(user_id)
+    deleted_m = delete_machine(user_id, query.data.split("_", 1)[1])
+    if deleted_m is None:
+        await query.edit_message_text("❌ 未找到对应机器，可能已被删除。")
+    else:
+        await query.edit_message_text(f"🗑️ 机器「{deleted_m.remark}」已删除。")
+    return ConversationHandler.END
+
+async def renew_all_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = str(update.effective_user.id)
+    unblock_user(user_id)
+    machines = user_data.get(user_id, {}).get("machines", [])
+    if not machines:
+        await update.message.reply_text("您还没有机器。使用 /new 添加。")
+        return
+    keyboard = [[InlineKeyboardButton("✅ 确认全部续期", callback_data="renewall_confirm")]]
+    await update.message.reply_text(
+        f"确认将全部 {len(machines)} 台机器标记为今天已续期？", reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def renew_all_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    user_id = str(query.from_user.id)
+    unblock_user(user_id)
+    machines = user_data.get(user_id, {}).get("machines", [])
+    if not machines:
+        await query.edit_message_text("您还没有机器。使用 /new 添加。")
+        return
+    renew_machines(user_id, machines, datetime.now(TZ_GMT7).strftime("%Y-%m-%d"))
+    await query.edit_message_text(f"✅ 已将 {len(machines)} 台机器全部续期，使用 /info 查看新的到期时间。")
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = str(update.effective_user.id)
+    unblock_user(user_id)
+    machines = user_data.get(user_id, {}).get("machines", [])
+    if not machines:
+        await update.message.reply_text("您还没有机器。使用 /new 添加。")
+        return
+    payload = json.dumps([m.to_dict() for m in machines], ensure_ascii=False, indent=2).encode("utf-8")
+    await update.message.reply_document(
+        document=payload,
+        filename=f"machines_{user_id}.json",
+        caption=f"共 {len(machines)} 台机器，可以用 /import 导入。",
+    )
+
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    user_id = str(update.effective_user.id)
+    unblock_user(user_id)
+    await update.message.reply_text("请发送 /export 导出的 JSON 文件（或直接粘贴 JSON 内容），或 /cancel 取消。\n相同 uuid 的机器会被覆盖，其余机器追加到列表中。")
+    return IMPORT_AWAIT_FILE
+
+async def received_import(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    user_id = str(update.effective_user.id)
+    document = update.message.document
+    if document is not None:
+        if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+            await update.message.reply_text("文件过大，请重新发送或 /cancel。"); return IMPORT_AWAIT_FILE
+        raw = bytes(await (await document.get_file()).download_as_bytearray())
+    else:
+        raw = update.message.text.encode("utf-8")
+    try:
+        machines = parse_import(raw)
+    except ValueError as e:
+        await update.message.reply_text(f"{e}\n请重新发送或 /cancel。"); return IMPORT_AWAIT_FILE
+    added, updated = import_machines(user_id, machines)
+    await update.message.reply_text(f"✅ 导入完成：新增 {added} 台，更新 {updated} 台。使用 /info 查看。")
+    return ConversationHandler.END
+
 async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data.clear()
     await update.message.reply_text("操作已取消。")
@@ -402,38 +932,156 @@ async def renew_button_callback(update: Update, context: ContextTypes.DEFAULT_TY
     unblock_user(user_id)
     _, machine_uuid = query.data.split("_", 1)
 
-    for machine in user_data.get(user_id, {}).get("machines", []):
-        if machine["uuid"] == machine_uuid:
-            # 更新续期日期为当前时间（GMT+7）
-            now = datetime.now(ZoneInfo("Asia/Bangkok"))
-            machine["last_event_date"] = now.strftime("%Y-%m-%d")
-            machine["last_hourly_reminder_sent"] = None
-            save_user_data(user_data)
+    machine = find_machine(user_id, machine_uuid)
+    if machine is None:
+        await query.edit_message_text("❌ 未找到对应机器。")
+        return
 
-            # 计算新的过期时间（GMT+7）→ 转为北京时间展示
-            exp_dt = calculate_expiration_time(machine)
-            exp_dt_beijing = exp_dt.astimezone(ZoneInfo("Asia/Shanghai"))
-            time_left = exp_dt - now
+    # 更新续期日期为当前时间（GMT+7）
+    now = datetime.now(TZ_GMT7)
+    renew_machines(user_id, [machine], now.strftime("%Y-%m-%d"))
 
-            msg = (
-                f"✅ 机器「{machine['remark']}」已续期！\n\n"
-                f"📅 新过期时间: {exp_dt_beijing:%Y-%m-%d %H:%M}（北京时间）\n"
-                f"🕓 剩余时间: {format_timedelta(time_left)}"
-            )
-            await query.edit_message_text(msg)
-            return
+    # 计算新的过期时间（GMT+7）→ 转为北京时间展示
+    exp_dt = machine.expires_dt
+    exp_dt_beijing = exp_dt.astimezone(TZ_BEIJING)
+    time_left = exp_dt - now
 
-    await query.edit_message_text("❌ 未找到对应机器。")
+    msg = (
+        f"✅ 机器「{machine.remark}」已续期！\n\n"
+        f"📅 新过期时间: {exp_dt_beijing:%Y-%m-%d %H:%M}（北京时间）\n"
+        f"🕓 剩余时间: {format_timedelta(time_left)}"
+    )
+    await query.edit_message_text(msg)
+
+
+# --- 生命周期 ---
+async def on_startup(application: Application) -> None:
+    startup.mark("连接 Telegram")
+    await notifier.start(application.bot)
+    start_loop_lag_monitor()
+    if DC_SOURCE == "file" and DC_TRIGGER == "watch":
+        await datacenter_watcher.start()
+        await fetch_datacenter_stats()
+    startup.mark("启动后台服务")
+    startup.export(STARTUP_SECONDS)
+    logger.info(f"启动完成，耗时 {startup.summary()}")
+
+first_update_handled = False
+
+async def first_update_callback(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """注册在所有处理器之后（group 1），记录处理完第一条更新的时间。"""
+    global first_update_handled
+    if first_update_handled:
+        return
+    first_update_handled = True
+    startup.mark("第一条更新")
+    startup.export(STARTUP_SECONDS)
+    logger.info(f"已处理第一条更新，距启动 {startup.summary()}")
 
+async def on_shutdown(application: Application) -> None:
+    await stop_loop_lag_monitor()
+    await datacenter_watcher.stop()
+    await notifier.stop()
+    await datacenter_scraper.aclose()
+    aio.shutdown()
 
-# --- 主函数 (最终稳定版) ---
-def main() -> None:
-    """主函数，完全同步构建，最后启动，避免所有事件循环冲突。"""
-    bot_token = get_bot_token()
-    if not bot_token:
-        logger.critical("未能获取Token，程序退出。"); return
 
-    application = Application.builder().token(bot_token).build()
+# --- 分片 worker ---
+async def run_shard_worker() -> None:
+    """
+    分片 worker 进程：只保留属于本分片的用户，按 SHARD_TICK 周期执行提醒和数据中心检查，
+    每一轮把耗时以 JSON 行的形式写到标准输出，由前台进程汇总。
+    """
+    for uid in [uid for uid in user_data if shard_of(uid, SHARD_COUNT) != SHARD_INDEX]:
+        del user_data[uid]
+    machine_index.rebuild(user_data)
+    rebuild_reminder_schedule()
+    rebuild_subscription_index()
+
+    if USE_FAKE_BOT:
+        from fake_bot import FakeBot
+        bot = FakeBot(log_messages=True)
+    else:
+        bot = Bot(os.environ.get("BOT_TOKEN") or get_bot_token())
+        await bot.initialize()
+    await notifier.start(bot)
+    if METRICS_PORT is not None:
+        start_metrics(METRICS_PORT + 1 + SHARD_INDEX)
+        start_loop_lag_monitor()
+    # 前台进程退出时会 terminate worker，收到 SIGTERM 后正常退出，写完缓存中的数据
+    loop = asyncio.get_running_loop()
+    if hasattr(signal, "SIGTERM"):
+        try:
+            loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            pass
+    startup.mark("启动 worker")
+    startup.export(STARTUP_SECONDS)
+    logger.info(f"分片 worker {SHARD_INDEX}/{SHARD_COUNT} 已启动，负责 {len(user_data)} 个用户，耗时 {startup.summary()}")
+
+    try:
+        while True:
+            started = time.monotonic()
+            t0 = time.perf_counter()
+            synced = await sync_user_data()
+            t1 = time.perf_counter()
+            await check_expirations_job(None)
+            t2 = time.perf_counter()
+            await check_datacenters_job(None)  # 抓取由前台进程负责，这里只读取它写出的快照文件
+            t3 = time.perf_counter()
+            await storage.maybe_flush_async()
+            print(REPORT_PREFIX + json.dumps({
+                "shard": SHARD_INDEX,
+                "users": len(user_data),
+                "scheduled": len(reminder_scheduler),
+                "synced_users": len(synced),
+                "sync_ms": (t1 - t0) * 1000,
+                "expirations_ms": (t2 - t1) * 1000,
+                "datacenters_ms": (t3 - t2) * 1000,
+                "pending_sends": notifier.pending,
+            }), flush=True)
+            await asyncio.sleep(max(0.0, SHARD_TICK - (time.monotonic() - started)))
+    finally:
+        await stop_loop_lag_monitor()
+        await notifier.stop()
+        await datacenter_scraper.aclose()
+        if not USE_FAKE_BOT:
+            await bot.shutdown()
+        aio.shutdown()
+        storage.close()
+
+
+def shard_worker_main() -> None:
+    try:
+        asyncio.run(run_shard_worker())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    logger.info(f"分片 worker {SHARD_INDEX} 已退出。")
+
+
+def log_shard_reports_job(supervisor: ShardSupervisor):
+    async def job(context: ContextTypes.DEFAULT_TYPE) -> None:
+        for report in supervisor.drain_reports():
+            logger.info(format_report(report))
+        supervisor.check_alive()
+    return job
+
+
+def build_application(bot_token: str, request=None) -> Application:
+    """创建 Application 并注册所有处理器；request 可以替换网络层（例如 fake_bot.FakeRequest）。"""
+    builder = (
+        Application.builder()
+        .token(bot_token)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .concurrent_updates(CONCURRENT_UPDATES)
+    )
+    if request is not None:
+        builder = builder.request(request)
+    if BOT_MODE == "webhook":
+        # 由 webhook.py 的 ASGI 服务直接往有界队列里放更新，不需要 Updater
+        builder = builder.update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)).updater(None)
+    application = builder.build()
 
     # 注册所有处理器
     conv_new = ConversationHandler(
@@ -446,27 +1094,98 @@ def main() -> None:
         fallbacks=[CommandHandler("cancel", cancel_conversation)])
     conv_del = ConversationHandler(
         entry_points=[CommandHandler("delmachine", delete_machine_command)],
-        states={DEL_AWAIT_NUMBER: [MessageHandler(filters.TEXT & ~filters.COMMAND, received_delete_number)]},
+        states={DEL_AWAIT_NUMBER: [
+            MessageHandler(filters.TEXT & ~filters.COMMAND, received_delete_number),
+            CallbackQueryHandler(delete_button_callback, pattern="^del_"),
+        ]},
+        fallbacks=[CommandHandler("cancel", cancel_conversation)])
+    conv_import = ConversationHandler(
+        entry_points=[CommandHandler("import", import_command)],
+        states={IMPORT_AWAIT_FILE: [MessageHandler(filters.Document.ALL | (filters.TEXT & ~filters.COMMAND), received_import)]},
         fallbacks=[CommandHandler("cancel", cancel_conversation)])
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("info", info_command))
     application.add_handler(CommandHandler("monitor", monitor_command))
+    application.add_handler(CommandHandler("subscribe", subscribe_command))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
+    application.add_handler(CommandHandler("subscriptions", subscriptions_command))
+    application.add_handler(CommandHandler("trend", trend_command))
     application.add_handler(conv_new)
     application.add_handler(conv_del)
+    application.add_handler(conv_import)
+    application.add_handler(CommandHandler("renewall", renew_all_command))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CallbackQueryHandler(renew_all_callback, pattern="^renewall_confirm$"))
+    application.add_handler(CallbackQueryHandler(delete_button_callback, pattern="^del_"))
     application.add_handler(CallbackQueryHandler(renew_button_callback, pattern="^renew_.*"))
+    application.add_handler(CallbackQueryHandler(info_page_callback, pattern=r"^info_page_\d+$"))
     application.add_handler(CallbackQueryHandler(toggle_dc_monitor_callback, pattern="^toggle_dc_monitor$"))
     application.add_handler(CallbackQueryHandler(manual_refresh_callback, pattern="^dc_manual_refresh$"))
+    application.add_handler(TypeHandler(Update, first_update_callback), group=1)
+    return application
 
 
+# --- 主函数 (最终稳定版) ---
+def main() -> None:
+    """主函数，完全同步构建，最后启动，避免所有事件循环冲突。"""
+    bot_token = get_bot_token()
+    if not bot_token:
+        logger.critical("未能获取Token，程序退出。"); return
+    if METRICS_PORT is not None:
+        start_metrics(METRICS_PORT)
+    application = build_application(bot_token)
+
     # 注册后台任务
     jq = application.job_queue
-    jq.run_repeating(check_expirations_job, interval=60, first=10)
-    jq.run_repeating(check_datacenters_job, interval=60, first=15)
+    supervisor = None
+    if IS_SHARD_FRONT:
+        if not storage.store.supports_sync:
+            logger.critical("分片模式需要 sqlite 存储后端 (BOT_STORAGE=sqlite)，程序退出。"); return
+        # 提醒和数据中心推送交给 worker（inprocess 模式下仍由本进程抓取），本进程只同步它们写入的数据（例如提醒时间、屏蔽标记）
+        supervisor = ShardSupervisor(SHARD_COUNT, os.path.abspath(__file__), {"BOT_TOKEN": bot_token})
+        jq.run_repeating(sync_user_data_job, interval=SHARD_SYNC_INTERVAL, first=SHARD_SYNC_INTERVAL)
+        jq.run_repeating(log_shard_reports_job(supervisor), interval=60, first=60)
+        if DC_SOURCE == "inprocess":
+            jq.run_repeating(scrape_datacenters_job, interval=SCRAPE_INTERVAL, first=5)
+    else:
+        rebuild_reminder_schedule()
+        rebuild_subscription_index()
+        jq.run_repeating(check_expirations_job, interval=60, first=10)
+        if DC_SOURCE == "inprocess":
+            jq.run_repeating(scrape_datacenters_job, interval=SCRAPE_INTERVAL, first=5)
+        elif DC_TRIGGER != "watch":
+            jq.run_repeating(check_datacenters_job, interval=60, first=15)
+    jq.run_repeating(flush_user_data_job, interval=FLUSH_INTERVAL, first=FLUSH_INTERVAL)
+    startup.mark("注册处理器和任务")
 
     # 启动机器人！
-    logger.info("机器人启动中，开始轮询... (按 Ctrl+C 停止)")
-    application.run_polling(drop_pending_updates=True)
+    if supervisor is not None:
+        supervisor.start()
+    try:
+        if BOT_MODE == "webhook":
+            from webhook import serve_webhook
+            secret = WEBHOOK_SECRET
+            if not secret:
+                import secrets
+                secret = secrets.token_urlsafe(32)
+                logger.warning("未设置 BOT_WEBHOOK_SECRET，已随机生成（仅本次运行有效）。")
+            logger.info("机器人启动中，使用 webhook 接收更新... (按 Ctrl+C 停止)")
+            asyncio.run(serve_webhook(
+                application,
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                path=WEBHOOK_PATH,
+                secret_token=secret,
+                webhook_url=WEBHOOK_URL,
+            ))
+        else:
+            logger.info("机器人启动中，开始轮询... (按 Ctrl+C 停止)")
+            application.run_polling(drop_pending_updates=True)
+    finally:
+        if supervisor is not None:
+            supervisor.stop()
+    storage.close()  # 同步写完写回缓存中剩余的数据
 
 
 async def cleanup(application):
@@ -477,10 +1196,16 @@ async def cleanup(application):
         await application.stop()
     if hasattr(application, 'shutdown'):
         await application.shutdown()
+    await notifier.stop()
+    storage.close()
     logger.info("机器人已关闭。")
 
+startup.mark("初始化模块")
+
 # 主程序入口
-if __name__ == "__main__":
+if __name__ == "__main__" and SHARD_INDEX is not None:
+    shard_worker_main()
+elif __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
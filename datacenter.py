@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+数据中心快照。
+
+每次抓取/读取数据后只生成一个 DatacenterSnapshot，解析结果、总数、内容哈希
+以及各种消息文本都在这里渲染一次，所有推送和手动刷新共享同一个对象。
+数据按服务商（hax / woiden …）分组：{服务商: {数据中心名称: 数量}}。
+
+SnapshotFileReader 负责读取 hax.py 写出的文件：优先读取 JSON 快照，
+不存在时退回旧版文本文件；文件的 mtime/大小或快照序号没有变化时直接返回上次的解析结果。
+
+单进程模式下由 AsyncDataCenterScraper 在 bot 的事件循环里直接抓取页面，
+新快照通过 SnapshotBus 发布给进程内的订阅者，不再经过文件中转。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from aio import run_blocking
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_SNAPSHOT_VERSIONS = (1, 2)
+
+NO_DETAILS_TEXT = "未能解析出任何数据中心的详情。"
+
+PROVIDER_NAMES = {"hax": "Hax", "woiden": "Woiden"}
+
+
+def provider_name(provider: str) -> str:
+    return PROVIDER_NAMES.get(provider, provider)
+
+
+class DatacenterSnapshot:
+    __slots__ = ("providers", "totals", "total", "digest", "taken_at", "details", "manual_refresh_text", "summary_text", "_alerts")
+
+    def __init__(self, providers: dict[str, dict[str, int]], taken_at: float | None = None):
+        self.providers = providers
+        self.totals = {provider: sum(stats.values()) for provider, stats in providers.items()}
+        self.total = sum(self.totals.values())
+        self.digest = self.compute_digest(providers)
+        self.taken_at = time.time() if taken_at is None else taken_at
+
+        self.details = {provider: self._render_details(stats) for provider, stats in providers.items()}
+        sections = [f"**{provider_name(p)}**（{self.totals[p]}）:\n{self.details[p]}" for p in providers]
+        self.manual_refresh_text = (
+            f"🔄 **手动刷新成功**\n\n当前服务器总数: **{self.total}**\n\n**详情:**\n" + ("\n\n".join(sections) or NO_DETAILS_TEXT)
+        )
+        per_provider = " · ".join(f"{provider_name(p)} {total}" for p, total in self.totals.items())
+        self.summary_text = f"当前服务器总数: **{self.total}**（{per_provider}）"
+        self._alerts: dict[tuple, str] = {}
+
+    @staticmethod
+    def _render_details(stats: dict[str, int]) -> str:
+        return "\n".join(f"- {name}: **{count}**" for name, count in stats.items()) if stats else NO_DETAILS_TEXT
+
+    @staticmethod
+    def compute_digest(providers: dict[str, dict[str, int]]) -> str:
+        payload = "\n".join(
+            f"{provider}\t{name}\t{count}" for provider, stats in providers.items() for name, count in stats.items()
+        )
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def alert_text(self, changes: tuple[tuple[str, int], ...]) -> str:
+        """数量变化提醒，只列出发生变化的服务商；同一组变化只渲染一次。"""
+        text = self._alerts.get(changes)
+        if text is None:
+            lines = [
+                f"**{provider_name(p)}** 服务器总数从 **{last}** 变为 **{self.totals[p]}**！\n\n**详情:**\n{self.details[p]}"
+                for p, last in changes
+            ]
+            text = self._alerts[changes] = "🚨 **数据中心数量变化提醒** 🚨\n\n" + "\n\n".join(lines)
+        return text
+
+
+def normalize_name(name: str) -> str | None:
+    """统一数据中心名称；返回 None 表示这一项不是独立的数据中心（例如在线总数）。"""
+    if "Number of VPS Online" in name:
+        return None
+    return name.replace("./", "")
+
+
+def normalize_stats(datacenters: dict) -> dict[str, int]:
+    stats = {}
+    for name, count in datacenters.items():
+        name = normalize_name(name)
+        if name is not None:
+            stats[name] = int(count)
+    return stats
+
+
+def parse_text_lines(lines: list[str], source: str) -> dict[str, int]:
+    """解析旧版 HaxDataCenter.txt 的文本格式。"""
+    stats = {}
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("✅ 数据中心:") or "VPS 数量:" not in line:
+            continue
+
+        try:
+            name = normalize_name(line.split("✅ 数据中心:")[1].split(",")[0].strip())
+            count = int(line.split("VPS 数量:")[1].strip().split(" ")[0])
+        except (IndexError, ValueError):
+            logger.warning(f"无法解析行: '{line}' in {source}。已跳过。")
+            continue
+        if name is not None:
+            stats[name] = count
+    return stats
+
+
+class SnapshotFileReader:
+    """
+    读取数据源文件并缓存解析结果。
+    read() 返回 {服务商: {名称: 数量}}；文件不存在、抓取失败或无法解析时返回 None。
+    版本 1 的快照和旧版文本文件只有 Hax 的数据。
+    read() 是阻塞的，事件循环中使用 read_async()（在 I/O 线程池中执行）。
+    """
+
+    def __init__(self, json_path: str, text_path: str):
+        self.json_path = json_path
+        self.text_path = text_path
+        self._key = None
+        self._seq = None
+        self._stats: dict[str, dict[str, int]] | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def seq(self) -> int | None:
+        return self._seq
+
+    def read(self) -> dict[str, dict[str, int]] | None:
+        with self._lock:
+            if os.path.exists(self.json_path):
+                return self._read_json()
+            return self._read_text()
+
+    async def read_async(self) -> dict[str, dict[str, int]] | None:
+        return await run_blocking(self.read, op="read_datacenter_file")
+
+    def _file_key(self, path: str):
+        st = os.stat(path)
+        return path, st.st_mtime_ns, st.st_size
+
+    def _read_json(self) -> dict[str, dict[str, int]] | None:
+        try:
+            key = self._file_key(self.json_path)
+            if key == self._key:
+                return self._stats
+            with open(self.json_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return self._read_text()
+        except Exception as e:
+            logger.error(f"读取或解析 '{self.json_path}' 时出错: {e}")
+            return None
+
+        if snapshot.get("version") not in SUPPORTED_SNAPSHOT_VERSIONS:
+            logger.error(f"不支持的快照版本: {snapshot.get('version')}（{self.json_path}）")
+            return None
+        self._key = key
+        if snapshot.get("seq") == self._seq:
+            return self._stats
+        self._seq = snapshot.get("seq")
+
+        if not snapshot.get("ok"):
+            logger.warning(f"数据源抓取失败（序号 {self._seq}）: {snapshot.get('error')}")
+            self._stats = None
+            return None
+
+        if snapshot["version"] == 1:
+            self._stats = {"hax": normalize_stats(snapshot.get("datacenters", {}))}
+            return self._stats
+        providers = {}
+        for provider, entry in snapshot.get("providers", {}).items():
+            if entry.get("ok") or entry.get("stale"):
+                if entry.get("stale"):
+                    logger.warning(f"{provider} 本轮抓取失败，沿用上次的数据: {entry.get('error')}")
+                providers[provider] = normalize_stats(entry.get("datacenters", {}))
+        self._stats = providers or None
+        return self._stats
+
+    def _read_text(self) -> dict[str, dict[str, int]] | None:
+        try:
+            key = self._file_key(self.text_path)
+            if key == self._key:
+                return self._stats
+            with open(self.text_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            logger.warning(f"数据文件 '{self.text_path}' 未找到。")
+            return None
+        except Exception as e:
+            logger.error(f"读取或解析 '{self.text_path}' 时出错: {e}")
+            return None
+
+        self._key = key
+        self._seq = None
+        self._stats = {"hax": parse_text_lines(lines, self.text_path)}
+        return self._stats
+
+
+class SnapshotBus:
+    """
+    进程内的快照发布/订阅：内容变化时才发布，订阅者按注册顺序依次被 await。
+    previous 是发布前的上一份快照，所有订阅者共用它做对比。
+    设置了 baseline_path 时每次发布后把最新快照写入该文件，重启后用 restore() 恢复，不会漏掉停机期间的变化。
+    """
+
+    def __init__(self, baseline_path: str | None = None):
+        self._subscribers = []
+        self.baseline_path = baseline_path
+        self.previous: DatacenterSnapshot | None = None
+        self.latest: DatacenterSnapshot | None = None
+
+    def subscribe(self, callback) -> None:
+        """callback 为 async def callback(snapshot)。"""
+        self._subscribers.append(callback)
+
+    def snapshot_for(self, stats: dict[str, dict[str, int]]) -> DatacenterSnapshot | None:
+        """stats（{服务商: {名称: 数量}}）与最新快照内容相同时返回最新快照，否则返回 None。"""
+        latest = self.latest
+        if latest is not None and (latest.providers is stats or latest.digest == DatacenterSnapshot.compute_digest(stats)):
+            return latest
+        return None
+
+    async def publish(self, stats: dict[str, dict[str, int]]) -> DatacenterSnapshot:
+        snapshot = self.snapshot_for(stats)
+        if snapshot is not None:
+            return snapshot
+        self.previous, self.latest = self.latest, DatacenterSnapshot(stats)
+        snapshot = self.latest
+        for callback in self._subscribers:
+            try:
+                await callback(snapshot)
+            except Exception as e:
+                logger.error(f"处理数据中心快照时出错（{getattr(callback, '__name__', callback)}）: {e}")
+        if self.baseline_path:
+            await run_blocking(self._save_baseline, snapshot, op="save_baseline")
+        return snapshot
+
+    def restore(self) -> DatacenterSnapshot | None:
+        """从 baseline_path 恢复上次发布的快照作为 latest（下一份内容不同的快照会与它比较）。"""
+        if not self.baseline_path or not os.path.exists(self.baseline_path):
+            return None
+        try:
+            with open(self.baseline_path, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+            self.latest = DatacenterSnapshot(baseline["providers"], baseline.get("taken_at"))
+        except Exception as e:
+            logger.error(f"读取数据中心基准快照 '{self.baseline_path}' 时出错: {e}")
+            return None
+        return self.latest
+
+    def _save_baseline(self, snapshot: DatacenterSnapshot) -> None:
+        # 分片模式下多个进程可能同时写入，各自写临时文件再原子替换
+        tmp_path = f"{self.baseline_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"taken_at": snapshot.taken_at, "providers": snapshot.providers}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.baseline_path)
+        except Exception as e:
+            logger.error(f"保存数据中心基准快照 '{self.baseline_path}' 时出错: {e}")
+
+
+class AsyncDataCenterScraper:
+    """
+    hax.fetch_all_sources 的异步版本，供单进程模式在事件循环中使用：
+    所有数据源并发抓取，每个数据源有自己的超时、带抖动的退避重试和熔断器（与 hax.py 共用 hax.Source）；
+    httpx 长连接 + ETag/Last-Modified 条件请求 + 内容哈希，HTML 解析放到 I/O 线程池中执行。
+    fetch() 返回 {数据源名称: 结果}，结果格式与 hax.get_data_center_stats 相同。
+    """
+
+    def __init__(self, sources=None):
+        self._sources = sources
+        self._client = None
+        self._cache: dict[str, dict] = {}  # 数据源名称 -> {"etag", "last_modified", "digest", "result"}
+
+    @property
+    def sources(self):
+        if self._sources is None:
+            import hax
+            self._sources = hax.enabled_sources()
+        return self._sources
+
+    async def fetch(self) -> dict[str, dict]:
+        import httpx
+        import hax
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(headers=hax.HEADERS, follow_redirects=True)
+        sources = self.sources
+        results = await asyncio.gather(*(self._fetch_source(source) for source in sources))
+        return {source.name: result for source, result in zip(sources, results)}
+
+    async def _fetch_source(self, source) -> dict:
+        import hax
+
+        if not source.breaker.allow():
+            return hax.skipped_result(source)
+        for attempt in range(source.retries + 1):
+            result = await self._fetch_once(source)
+            if result["fetched"]:
+                source.breaker.record_success()
+                return result
+            if attempt < source.retries:
+                await asyncio.sleep(source.retry_delay(attempt))
+        source.breaker.record_failure()
+        return result
+
+    async def _fetch_once(self, source) -> dict:
+        import httpx
+        import hax
+
+        cached = self._cache.get(source.name)
+        headers = {}
+        if cached and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            with hax.SCRAPE_FETCH_SECONDS.time(provider=source.name):
+                response = await self._client.get(source.url, headers=headers, timeout=source.timeout)
+            if response.status_code == 304 and cached:
+                hax.SCRAPE_RESULTS.inc(provider=source.name, result="unchanged")
+                return {**cached["result"], "unchanged": True}
+            response.raise_for_status()
+
+            digest = hashlib.sha256(response.content).hexdigest()
+            if cached and digest == cached["digest"]:
+                result = {**cached["result"], "unchanged": True}
+            else:
+                with hax.SCRAPE_PARSE_SECONDS.time(provider=source.name):
+                    parsed = await run_blocking(source.parser, response.text, op="parse_page")
+                result = {**parsed, "fetched": True, "unchanged": False}
+            hax.SCRAPE_RESULTS.inc(provider=source.name, result="unchanged" if result["unchanged"] else "changed")
+
+            self._cache[source.name] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "digest": digest,
+                "result": result,
+            }
+            return result
+        except httpx.HTTPError as e:
+            hax.SCRAPE_RESULTS.inc(provider=source.name, result="error")
+            return {"datacenters": {}, "error": f"网络请求错误: {e}", "fetched": False, "unchanged": False}
+        except Exception as e:
+            hax.SCRAPE_RESULTS.inc(provider=source.name, result="error")
+            return {"datacenters": {}, "error": f"发生未知错误: {e}", "fetched": False, "unchanged": False}
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地调试/压测用的假 Bot：只实现后台任务用到的 send_message，不访问 Telegram。
+可以模拟网络延迟和 429（RetryAfter）。
+
+FakeRequest 则是 python-telegram-bot 的网络层替身：交给 Application.builder().request() 后，
+完整的 Application（initialize / process_update / 回复消息）都可以离线运行，供启动基准使用。
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+
+from telegram.error import RetryAfter
+from telegram.request import BaseRequest
+
+logger = logging.getLogger(__name__)
+
+
+class FakeBot:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, retry_after_ratio: float = 0.0,
+                 retry_after: int = 1, seed: int | None = None, log_messages: bool = False):
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_after_ratio = retry_after_ratio
+        self.retry_after = retry_after
+        self.log_messages = log_messages
+        self.sent = 0
+        self.rate_limited = 0
+        self.send_latencies: list[float] = []  # 每次成功调用的实际耗时（秒）
+        self._rng = random.Random(seed)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        started = time.perf_counter()
+        delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.retry_after_ratio and self._rng.random() < self.retry_after_ratio:
+            self.rate_limited += 1
+            raise RetryAfter(self.retry_after)
+        self.sent += 1
+        self.send_latencies.append(time.perf_counter() - started)
+        if self.log_messages:
+            logger.info(f"[FakeBot] -> {chat_id}: {text.splitlines()[0] if text else ''}")
+        return None
+
+
+class FakeRequest(BaseRequest):
+    """所有 Bot API 调用都立即返回成功：getMe 返回一个假的机器人，发送类方法返回对应的消息。"""
+
+    BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+    def __init__(self):
+        self.calls: list[str] = []
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls.append(api_method)
+        params = request_data.json_parameters if request_data is not None else {}
+        if api_method == "getMe":
+            result = self.BOT_USER
+        elif api_method.startswith("send") or api_method.startswith("edit"):
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "from": self.BOT_USER,
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+数据文件监听。
+
+Linux 上通过 inotify（ctypes 调用 libc，无需额外依赖）监听数据文件所在目录，
+其它平台或 inotify 不可用时退回到定时比较 mtime/大小的轮询方式。
+同一批写入（例如 hax.py 先后替换 JSON 和文本文件）在 debounce 时间内只触发一次回调。
+"""
+
+import asyncio
+import logging
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    def __init__(self):
+        # 只有 watch 模式会用到 inotify，ctypes 在这里才导入，不拖慢默认的启动
+        import ctypes
+        import ctypes.util
+
+        self._ctypes = ctypes
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("找不到 libc")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("当前系统不支持 inotify")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(self._ctypes.get_errno(), f"inotify_add_watch 失败: {path}")
+        return wd
+
+    def read_names(self) -> list[str]:
+        """读出当前所有事件对应的文件名。"""
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names, offset = [], 0
+        while offset + _EVENT_HEADER.size <= len(buf):
+            _, _, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            names.append(os.fsdecode(buf[offset:offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class FileWatcher:
+    """
+    监听若干文件，内容写完后调用 async 回调 callback()。
+    use_inotify=False 或 inotify 不可用时，每 poll_interval 秒比较一次文件的 mtime 和大小。
+    """
+
+    def __init__(self, paths, callback, debounce: float = 0.5, poll_interval: float = 2.0, use_inotify: bool = True):
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self._inotify: _Inotify | None = None
+        self._poll_task: asyncio.Task | None = None
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify else "poll"
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if self.use_inotify:
+            try:
+                self._start_inotify()
+            except OSError as e:
+                logger.warning(f"inotify 不可用（{e}），改用轮询方式监听数据文件。")
+                self._inotify = None
+        if self._inotify is None:
+            self._poll_task = asyncio.create_task(self._poll_loop(self._stat_all()))
+        logger.info(f"开始监听数据文件（{self.mode}）: {', '.join(self.paths)}")
+
+    def _start_inotify(self) -> None:
+        inotify = _Inotify()
+        try:
+            for directory in {os.path.dirname(p) for p in self.paths}:
+                inotify.add_watch(directory, IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        except OSError:
+            inotify.close()
+            raise
+        self._names = {os.path.basename(p) for p in self.paths}
+        self._inotify = inotify
+        self._loop.add_reader(inotify.fd, self._on_inotify_readable)
+
+    def _on_inotify_readable(self) -> None:
+        if any(name in self._names for name in self._inotify.read_names()):
+            self._schedule()
+
+    def _schedule(self) -> None:
+        # 防抖：最后一次事件之后 debounce 秒内没有新事件才触发
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._loop.call_later(self.debounce, self._fire)
+
+    def _fire(self) -> None:
+        self._timer = None
+        task = asyncio.create_task(self._run_callback())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_callback(self) -> None:
+        try:
+            await self.callback()
+        except Exception as e:
+            logger.error(f"处理数据文件变化时出错: {e}")
+
+    def _stat_all(self):
+        result = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                result.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                result.append(None)
+        return result
+
+    async def _poll_loop(self, last) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = self._stat_all()
+            if current == last:
+                continue
+            # 等文件稳定下来（debounce 内不再变化）再触发，避免读到写了一半的文件
+            await asyncio.sleep(self.debounce)
+            settled = self._stat_all()
+            if settled != current:
+                continue
+            last = settled
+            await self._run_callback()
+
+    async def stop(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._inotify is not None:
+            self._loop.remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            await asyncio.gather(self._poll_task, return_exceptions=True)
+            self._poll_task = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -1,77 +1,410 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import requests
-from bs4 import BeautifulSoup
+# requests / bs4 只在真正抓取、兜底解析时才导入（bot.py 单进程模式只用到这里的解析函数和数据源配置）
+import argparse
+import hashlib
+import json
+import os
+import random
 import sys
+import tempfile
 import time
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-def get_data_center_stats():
+from metrics import Counter, Gauge, Histogram, start_http_server
+
+# --- 输出文件 ---
+# HaxDataCenter.json 为机器可读的快照（bot.py 优先读取），HaxDataCenter.txt 为兼容旧版的文本输出
+SNAPSHOT_FILE = "HaxDataCenter.json"
+TEXT_FILE = "HaxDataCenter.txt"
+SNAPSHOT_VERSION = 2  # 2: 按服务商分组的 "providers"；1: 只有 Hax 的 "datacenters"
+WRITE_TEXT_FILE = os.environ.get("HAX_WRITE_TEXT", "1") != "0"
+HISTORY_DB = os.environ.get("HAX_HISTORY_DB", "dc_history.db")  # 每轮抓取的数量历史（见 history.py），设为空字符串时不记录
+
+# --- 数据源：每个服务商一个页面，可以指向本地的 HTTP 服务做测试 ---
+DATA_CENTER_URL = os.environ.get("HAX_DATA_CENTER_URL", "https://hax.co.id/data-center/")
+WOIDEN_DATA_CENTER_URL = os.environ.get("WOIDEN_DATA_CENTER_URL", "https://woiden.id/data-center/")
+ENABLED_SOURCES = [name.strip() for name in os.environ.get("HAX_SOURCES", "hax,woiden").split(",") if name.strip()]
+SOURCE_TIMEOUT = float(os.environ.get("HAX_SOURCE_TIMEOUT", "15"))
+SOURCE_RETRIES = int(os.environ.get("HAX_SOURCE_RETRIES", "2"))
+# 连续失败 BREAKER_THRESHOLD 轮后暂停抓取该数据源，BREAKER_RESET 秒后再试一次
+BREAKER_THRESHOLD = int(os.environ.get("HAX_BREAKER_THRESHOLD", "3"))
+BREAKER_RESET = float(os.environ.get("HAX_BREAKER_RESET", "300"))
+
+# 设置后在该端口提供 /metrics（Prometheus 文本格式）
+METRICS_PORT = os.environ.get("HAX_METRICS_PORT")
+
+SCRAPE_FETCH_SECONDS = Histogram("hax_scrape_fetch_seconds", "请求数据中心页面的耗时", ("provider",))
+SCRAPE_PARSE_SECONDS = Histogram("hax_scrape_parse_seconds", "解析数据中心页面的耗时", ("provider",))
+SCRAPE_RESULTS = Counter("hax_scrape_total", "抓取结果", ("provider", "result"))  # changed / unchanged / error / skipped
+SNAPSHOT_AGE = Gauge("hax_snapshot_age_seconds", "距离上次写出快照的秒数")
+
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# 复用同一个 Session 以保持长连接
+_session = None
+# 每个 URL 上一次的响应信息: {"etag", "last_modified", "digest", "result"}
+_page_cache = {}
+
+
+def get_session():
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+        _session.headers.update(HEADERS)
+    return _session
+
+
+CARD_CLASS = 'card h-100 bg-dark text-white'
+# 只定位数据中心卡片及其中的标题/数量节点，不需要遍历整棵树
+_CARD_XPATH = f'//div[@class="{CARD_CLASS}"]'
+_NAME_XPATH = './/h5[contains(concat(" ", normalize-space(@class), " "), " card-title ")]'
+_COUNT_XPATH = './/h1[contains(concat(" ", normalize-space(@class), " "), " card-text ")]'
+
+
+def _is_data_center_name(name):
+    return "在线VPS数量" not in name and "Online VPS" not in name
+
+
+def _add_count(datacenters, name, count):
+    if _is_data_center_name(name):
+        try:
+            datacenters[name] = int(count.replace(",", ""))
+        except ValueError:
+            pass
+
+
+def _parse_fast(html):
+    """lxml + XPath 直接取卡片节点，比 BeautifulSoup 建树快得多。"""
+    from lxml import html as lxml_html
+
+    datacenters = {}
+    root = lxml_html.fromstring(html)
+    for card in root.xpath(_CARD_XPATH):
+        name_tags = card.xpath(_NAME_XPATH)
+        count_tags = card.xpath(_COUNT_XPATH)
+        if name_tags and count_tags:
+            # 与 get_text(strip=True) 的结果保持一致
+            name = "".join(t.strip() for t in name_tags[0].itertext())
+            count = "".join(t.strip() for t in count_tags[0].itertext())
+            _add_count(datacenters, name, count)
+    return datacenters
+
+
+def _parse_with_soup(html):
+    """原来的 BeautifulSoup 解析方式，快速路径没有结果时作为兜底。"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'lxml')
+
+    data_center_cards = soup.find_all('div', class_=CARD_CLASS)
+
+    if not data_center_cards:
+        return {"datacenters": {}, "error": "错误：在页面上没有找到数据中心信息卡片。"}
+
+    datacenters = {}
+    for card in data_center_cards:
+        name_tag = card.find('h5', class_='card-title')
+        count_tag = card.find('h1', class_='card-text')
+        if name_tag and count_tag:
+            _add_count(datacenters, name_tag.get_text(strip=True), count_tag.get_text(strip=True))
+
+    if not datacenters:
+        return {"datacenters": {}, "error": "未能解析出任何独立的数据中心信息。"}
+
+    return {"datacenters": datacenters, "error": None}
+
+
+def parse_data_center_page(html):
+    """从页面 HTML 中解析出 {"datacenters": {名称: 数量}, "error": 错误信息或 None}。"""
+    try:
+        datacenters = _parse_fast(html)
+    except Exception:
+        datacenters = {}
+    if datacenters:
+        return {"datacenters": datacenters, "error": None}
+    return _parse_with_soup(html)
+
+
+def get_data_center_stats(url=DATA_CENTER_URL, session=None, timeout=15, parser=None, provider="hax"):
     """
-    访问 Hax.co.id 并获取数据，返回一个包含结果字符串的列表。
+    访问 Hax.co.id 并获取数据，返回
+    {"datacenters": {名称: 数量}, "error": 错误信息或 None, "fetched": 是否成功取到页面, "unchanged": 页面是否与上次相同}。
+
+    带上 ETag / Last-Modified 做条件请求；服务器返回 304，或者页面内容的哈希与上次相同时，
+    直接返回上一次的解析结果，不再构建 DOM。
     """
-    url = "https://hax.co.id/data-center/"
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
-    # 这个列表将用于存储我们要写入文件的每一行内容
-    output_lines = []
+    import requests
+
+    session = session or get_session()
+    parser = parser or parse_data_center_page
+    cached = _page_cache.get(url)
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
 
     try:
-        response = requests.get(url, headers=headers, timeout=15)
+        with SCRAPE_FETCH_SECONDS.time(provider=provider):
+            response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached:
+            SCRAPE_RESULTS.inc(provider=provider, result="unchanged")
+            return {**cached["result"], "unchanged": True}
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
-
-        # 添加时间戳，这样就知道文件是什么时候更新的
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        output_lines.append(f"--- HAX.CO.ID 数据中心状态 (更新于: {timestamp}) ---\n")
-
-        data_center_cards = soup.find_all('div', class_='card h-100 bg-dark text-white')
-
-        if not data_center_cards:
-            output_lines.append("错误：在页面上没有找到数据中心信息卡片。\n")
-            return output_lines
-
-        found_data = False
-        for card in data_center_cards:
-            name_tag = card.find('h5', class_='card-title')
-            count_tag = card.find('h1', class_='card-text')
-            if name_tag and count_tag:
-                name = name_tag.get_text(strip=True)
-                count = count_tag.get_text(strip=True)
-                if "在线VPS数量" not in name and "Online VPS" not in name:
-                    # 将格式化的结果添加到列表中，并手动添加换行符 \n
-                    output_lines.append(f"✅ 数据中心: {name},  VPS 数量: {count}\n")
-                    found_data = True
-        
-        if not found_data:
-             output_lines.append("未能解析出任何独立的数据中心信息。\n")
-
-        return output_lines
+
+        digest = hashlib.sha256(response.content).hexdigest()
+        if cached and cached["digest"] == digest:
+            result = {**cached["result"], "unchanged": True}
+        else:
+            with SCRAPE_PARSE_SECONDS.time(provider=provider):
+                result = {**parser(response.text), "fetched": True, "unchanged": False}
+        SCRAPE_RESULTS.inc(provider=provider, result="unchanged" if result["unchanged"] else "changed")
+
+        _page_cache[url] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "digest": digest,
+            "result": result,
+        }
+        return result
 
     except requests.exceptions.RequestException as e:
-        return [f"网络请求错误: {e}\n"]
+        SCRAPE_RESULTS.inc(provider=provider, result="error")
+        return {"datacenters": {}, "error": f"网络请求错误: {e}", "fetched": False, "unchanged": False}
     except Exception as e:
-        return [f"发生未知错误: {e}\n"]
+        SCRAPE_RESULTS.inc(provider=provider, result="error")
+        return {"datacenters": {}, "error": f"发生未知错误: {e}", "fetched": False, "unchanged": False}
+
+
+class CircuitBreaker:
+    """连续失败 threshold 次后断开，reset_timeout 秒后放行一次试探（半开），成功则恢复。"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self):
+        return self.state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class Source:
+    """一个服务商的数据中心页面。parser 接收 HTML，返回 {"datacenters", "error"}。"""
+
+    def __init__(self, name, url, parser=None, timeout=SOURCE_TIMEOUT, retries=SOURCE_RETRIES, backoff=1.0):
+        self.name = name
+        self.url = url
+        self.parser = parser or parse_data_center_page
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker()
+        self._session = None
+
+    def get_session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+            self._session.headers.update(HEADERS)
+        return self._session
+
+    def retry_delay(self, attempt):
+        """指数退避加随机抖动，避免几个数据源同时重试。"""
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+# 已注册的数据源，按名称索引；新的服务商只需在这里注册一个 Source
+SOURCES = {}
+
+
+def register_source(name, url, **kwargs):
+    source = SOURCES[name] = Source(name, url, **kwargs)
+    return source
+
+
+register_source("hax", DATA_CENTER_URL)
+register_source("woiden", WOIDEN_DATA_CENTER_URL)
+
+
+def enabled_sources():
+    return [SOURCES[name] for name in ENABLED_SOURCES if name in SOURCES]
+
+
+def skipped_result(source):
+    SCRAPE_RESULTS.inc(provider=source.name, result="skipped")
+    return {
+        "datacenters": {},
+        "error": f"{source.name} 连续 {source.breaker.failures} 次抓取失败，暂停抓取（熔断中）",
+        "fetched": False,
+        "unchanged": False,
+    }
+
+
+def fetch_source(source):
+    """抓取一个数据源：网络错误时按退避重试，整轮失败计入熔断器。"""
+    if not source.breaker.allow():
+        return skipped_result(source)
+    for attempt in range(source.retries + 1):
+        result = get_data_center_stats(source.url, source.get_session(), source.timeout, source.parser, source.name)
+        if result["fetched"]:
+            source.breaker.record_success()
+            return result
+        if attempt < source.retries:
+            time.sleep(source.retry_delay(attempt))
+    source.breaker.record_failure()
+    return result
+
+
+_executor = None
+
+
+def fetch_all_sources(sources=None):
+    """并发抓取所有数据源，返回 {名称: get_data_center_stats 格式的结果}。"""
+    global _executor
+    sources = enabled_sources() if sources is None else sources
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max(1, len(SOURCES)), thread_name_prefix="source")
+    futures = {source.name: _executor.submit(fetch_source, source) for source in sources}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def render_text_lines(result, timestamp):
+    """把抓取结果渲染成旧版 HaxDataCenter.txt 的格式。"""
+    if not result["fetched"]:
+        return [f"{result['error']}\n"]
+    output_lines = [f"--- HAX.CO.ID 数据中心状态 (更新于: {timestamp}) ---\n"]
+    for name, count in result["datacenters"].items():
+        output_lines.append(f"✅ 数据中心: {name},  VPS 数量: {count}\n")
+    if result["error"]:
+        output_lines.append(f"{result['error']}\n")
+    return output_lines
+
+
+def atomic_write(path, text):
+    """先写临时文件再替换，读取方永远不会看到写了一半的文件。"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_last_snapshot(path=SNAPSHOT_FILE):
+    """读取已有快照，保证重启后序号仍然单调递增，失败的数据源也能沿用上次的数据。"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        int(snapshot.get("seq", 0))
+        return snapshot
+    except (FileNotFoundError, ValueError, AttributeError, TypeError, json.JSONDecodeError):
+        return {}
+
+
+def build_snapshot(results, seq, previous=None):
+    """
+    把各数据源的结果合并成一个快照，按服务商分组。
+    某个数据源本轮失败时沿用上一份快照中它的数据，并标记 "stale"。
+    """
+    previous_providers = (previous or {}).get("providers") or {}
+    providers = {}
+    for name, result in results.items():
+        entry = {
+            "url": SOURCES[name].url if name in SOURCES else None,
+            "ok": result["error"] is None,
+            "error": result["error"],
+            "datacenters": result["datacenters"],
+        }
+        last = previous_providers.get(name)
+        if not entry["ok"] and last and (last.get("ok") or last.get("stale")):
+            entry["datacenters"] = last["datacenters"]
+            entry["stale"] = True
+        providers[name] = entry
+    errors = [f"{name}: {entry['error']}" for name, entry in providers.items() if entry["error"]]
+    return {
+        "version": SNAPSHOT_VERSION,
+        "seq": seq,
+        "updated_at": datetime.datetime.now().astimezone().isoformat(timespec="seconds"),
+        "ok": any(entry["ok"] for entry in providers.values()),
+        "error": "; ".join(errors) or None,
+        "providers": providers,
+    }
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="抓取各服务商的数据中心页面，写出 HaxDataCenter.json")
+    parser.add_argument("--once", action="store_true", help="只抓取一轮后退出（便于用本地页面测试）")
+    args = parser.parse_args()
     try:
+        snapshot = read_last_snapshot()
+        seq = int(snapshot.get("seq", 0))
+        history = None
+        if HISTORY_DB:
+            from datacenter import normalize_stats
+            from history import HistoryStore
+            history = HistoryStore(HISTORY_DB)
+        if METRICS_PORT:
+            start_http_server(int(METRICS_PORT))
+            SNAPSHOT_AGE.set_function(
+                lambda: time.time() - os.path.getmtime(SNAPSHOT_FILE) if os.path.exists(SNAPSHOT_FILE) else None
+            )
         while True:
             # 1. 打印提示信息到控制台，表示脚本正在工作
             print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] 正在获取最新数据...")
             
-            # 2. 调用函数获取数据
-            results = get_data_center_stats()
-            
-            # 3. 将结果写入文件
-            #    使用 'w' 模式会覆盖整个文件，'utf-8' 编码以支持中文
-            with open("HaxDataCenter.txt", "w", encoding="utf-8") as f:
-                f.writelines(results)
-            
-            print("数据已成功写入 HaxDataCenter.txt，将在60秒后重新获取。")
-            
+            # 2. 并发抓取所有数据源
+            results = fetch_all_sources()
+            for name, result in results.items():
+                if result["error"]:
+                    print(f"  {name}: {result['error']}")
+            if history is not None:
+                # 页面未变化时也记录，历史中每轮抓取都有一个点
+                history.record({name: normalize_stats(r["datacenters"]) for name, r in results.items() if r["error"] is None})
+            new_snapshot = build_snapshot(results, seq + 1, snapshot)
+            if all(r["unchanged"] for r in results.values()) or new_snapshot["providers"] == snapshot.get("providers"):
+                print("页面内容未变化，跳过写入，将在60秒后重新获取。")
+            else:
+                # 3. 原子写入 JSON 快照（序号单调递增），以及可选的兼容文本文件（只包含 Hax）
+                seq += 1
+                snapshot = new_snapshot
+                atomic_write(SNAPSHOT_FILE, json.dumps(snapshot, ensure_ascii=False))
+                if WRITE_TEXT_FILE and "hax" in results:
+                    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    atomic_write(TEXT_FILE, "".join(render_text_lines(results["hax"], timestamp)))
+                print(f"数据已成功写入 {SNAPSHOT_FILE}（序号 {seq}），将在60秒后重新获取。")
+
+            if args.once:
+                break
             # 4. 等待60秒
             time.sleep(60)
 
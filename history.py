@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+数据中心数量的历史记录（SQLite）。
+
+hax.py（单进程模式下由 bot.py）每抓取一轮就调用 HistoryStore.record() 记录各数据中心的数量，
+写入原始记录的同时增量更新 5 分钟和 1 小时两级汇总表（最小 / 最大 / 总和 / 次数 / 最后值），
+查询趋势时只读汇总表，不扫描原始记录。
+各表按保留期限定期清理，每分钟抓取一次、几十个数据中心、保留一年，数据库也只有几十 MB。
+读取方（bot.py 的 /trend）以只读方式打开并启用 mmap。
+同一个连接可能被 I/O 线程池中的多个线程使用，所有操作都在 _lock 下执行。
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from datacenter import provider_name
+
+logger = logging.getLogger(__name__)
+
+# 保留期限（天）：原始记录 / 5 分钟汇总 / 1 小时汇总
+RAW_RETENTION_DAYS = float(os.environ.get("HAX_HISTORY_RAW_DAYS", "2"))
+ROLLUP_5M_RETENTION_DAYS = float(os.environ.get("HAX_HISTORY_5M_DAYS", "30"))
+ROLLUP_1H_RETENTION_DAYS = float(os.environ.get("HAX_HISTORY_1H_DAYS", "400"))
+PRUNE_INTERVAL = 3600
+MMAP_SIZE = 64 * 1024 * 1024
+
+# (表名, 桶宽度秒数, 保留天数)；查询跨度不超过 FINE_ROLLUP_MAX_HOURS 时使用 5 分钟汇总
+ROLLUPS = (
+    ("samples_5m", 300, ROLLUP_5M_RETENTION_DAYS),
+    ("samples_1h", 3600, ROLLUP_1H_RETENTION_DAYS),
+)
+FINE_ROLLUP_MAX_HOURS = 48
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    provider TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (provider, name)
+);
+CREATE TABLE IF NOT EXISTS samples_raw (
+    series INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (series, ts)
+) WITHOUT ROWID;
+""" + "".join(f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    series INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    lo INTEGER NOT NULL,
+    hi INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    last INTEGER NOT NULL,
+    PRIMARY KEY (series, bucket)
+) WITHOUT ROWID;
+""" for table, _, _ in ROLLUPS)
+
+INSERT_RAW = "INSERT OR REPLACE INTO samples_raw (series, ts, count) VALUES (?, ?, ?)"
+UPSERT_ROLLUP = """
+INSERT INTO {table} (series, bucket, lo, hi, total, n, last) VALUES (?, ?, ?, ?, ?, 1, ?)
+ON CONFLICT (series, bucket) DO UPDATE SET
+    lo = min(lo, excluded.lo),
+    hi = max(hi, excluded.hi),
+    total = total + excluded.total,
+    n = n + 1,
+    last = excluded.last
+"""
+
+
+def sparkline(values: list[float]) -> str:
+    if not values:
+        return ""
+    lo, hi = min(values), max(values)
+    if hi == lo:
+        return SPARK_CHARS[len(SPARK_CHARS) // 2] * len(values)
+    scale = (len(SPARK_CHARS) - 1) / (hi - lo)
+    return "".join(SPARK_CHARS[round((v - lo) * scale)] for v in values)
+
+
+class HistoryStore:
+    """readonly=True 时以只读方式打开已有的数据库（文件不存在时抛出 sqlite3.OperationalError）。"""
+
+    def __init__(self, path: str, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        self._series_ids: dict[tuple[str, str], int] = {}
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _series_id(self, provider: str, name: str) -> int:
+        key = (provider, name)
+        series_id = self._series_ids.get(key)
+        if series_id is None:
+            self.conn.execute("INSERT OR IGNORE INTO series (provider, name) VALUES (?, ?)", key)
+            series_id = self.conn.execute("SELECT id FROM series WHERE provider = ? AND name = ?", key).fetchone()[0]
+            self._series_ids[key] = series_id
+        return series_id
+
+    def record(self, providers: dict[str, dict[str, int]], ts: float | None = None) -> None:
+        """记录一轮抓取的结果 {服务商: {数据中心: 数量}}，同时更新各级汇总。"""
+        ts = int(time.time() if ts is None else ts)
+        with self._lock, self.conn:
+            rows = [(self._series_id(p, name), count) for p, stats in providers.items() for name, count in stats.items()]
+            self.conn.executemany(INSERT_RAW, [(series_id, ts, count) for series_id, count in rows])
+            for table, width, _ in ROLLUPS:
+                bucket = ts - ts % width
+                self.conn.executemany(
+                    UPSERT_ROLLUP.format(table=table),
+                    [(series_id, bucket, count, count, count, count) for series_id, count in rows],
+                )
+        if ts - self._last_prune >= PRUNE_INTERVAL:
+            self.prune(ts)
+
+    def prune(self, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM samples_raw WHERE ts < ?", (int(now - RAW_RETENTION_DAYS * 86400),))
+            for table, _, days in ROLLUPS:
+                self.conn.execute(f"DELETE FROM {table} WHERE bucket < ?", (int(now - days * 86400),))
+        self._last_prune = now
+
+    def series(self) -> list[tuple[int, str, str]]:
+        """[(id, 服务商, 数据中心)]，按服务商和名称排序。"""
+        with self._lock:
+            return self.conn.execute("SELECT id, provider, name FROM series ORDER BY provider, name").fetchall()
+
+    def trend(self, series_id: int, hours: float, points: int = 24, now: float | None = None) -> list[dict]:
+        """
+        最近 hours 小时的走势，合并成最多 points 个点: [{"ts", "lo", "hi", "avg", "last"}]。
+        跨度不超过 48 小时读 5 分钟汇总，否则读 1 小时汇总。
+        """
+        now = time.time() if now is None else now
+        table = ROLLUPS[0][0] if hours <= FINE_ROLLUP_MAX_HOURS else ROLLUPS[1][0]
+        start = now - hours * 3600
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT bucket, lo, hi, total, n, last FROM {table} WHERE series = ? AND bucket >= ? ORDER BY bucket",
+                (series_id, int(start)),
+            ).fetchall()
+
+        span = max(now - start, 1)
+        merged = {}
+        for bucket, lo, hi, total, n, last in rows:
+            slot = min(points - 1, int((bucket - start) * points / span))
+            point = merged.get(slot)
+            if point is None:
+                merged[slot] = {"ts": bucket, "lo": lo, "hi": hi, "total": total, "n": n, "last": last}
+            else:
+                point["lo"] = min(point["lo"], lo)
+                point["hi"] = max(point["hi"], hi)
+                point["total"] += total
+                point["n"] += n
+                point["last"] = last
+        return [
+            {"ts": p["ts"], "lo": p["lo"], "hi": p["hi"], "avg": p["total"] / p["n"], "last": p["last"]}
+            for _, p in sorted(merged.items())
+        ]
+
+    def trend_text(self, hours: float, provider: str | None = None, name: str | None = None) -> str | None:
+        """/trend 的回复：每个数据中心一行走势图；没有匹配的数据中心时返回 None。"""
+        lines = []
+        for series_id, series_provider, series_name in self.series():
+            if provider is not None and series_provider != provider:
+                continue
+            if name is not None and series_name != name:
+                continue
+            points = self.trend(series_id, hours)
+            if not points:
+                continue
+            lo = min(p["lo"] for p in points)
+            hi = max(p["hi"] for p in points)
+            lines.append(
+                f"{provider_name(series_provider)} {series_name}\n"
+                f"`{sparkline([p['avg'] for p in points])}` {points[0]['last']} → **{points[-1]['last']}**（最低 {lo}，最高 {hi}）"
+            )
+        if not lines:
+            return None
+        return f"📈 **最近 {hours:g} 小时的数据中心走势**\n\n" + "\n\n".join(lines)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+/info 的分页渲染。
+
+每个用户缓存一份按到期时间排序的机器索引，以及每台机器不随时间变化的文本（名称、到期时间），
+只在添加/删除/续期时失效。翻页时只需为当前页的机器计算"剩余时间"，开销与页大小成正比，
+与机器总数无关。备注（用户可以输入很长的文本）渲染时截断到 MAX_REMARK_CHARS 个字符，
+每页最多 PAGE_SIZE 台机器，消息长度远低于 Telegram 的 4096 字符上限。
+缓存最多保留 MAX_CACHED_USERS 个用户，超出时淘汰最久未翻页的用户。
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+
+from models import Machine
+
+PAGE_SIZE = 10
+MAX_REMARK_CHARS = 64
+MAX_CACHED_USERS = 1000
+
+
+def short_remark(remark: str) -> str:
+    return remark if len(remark) <= MAX_REMARK_CHARS else remark[:MAX_REMARK_CHARS - 1] + "…"
+
+
+class _UserPages:
+    __slots__ = ("machines", "count", "order", "lines")
+
+    def __init__(self, machines: list[Machine]):
+        self.machines = machines
+        self.count = len(machines)
+        # 按到期时间排序的位置；序号仍显示机器在列表中的位置（与 /delmachine 的序号一致）
+        self.order = sorted(range(len(machines)), key=lambda i: (machines[i].expires_at, i))
+        self.lines: dict[int, tuple[str, str]] = {}  # 位置 -> (名称行, 到期时间行)，按需渲染
+
+    def valid_for(self, machines: list[Machine]) -> bool:
+        # 其它进程同步来的数据会替换整个列表，即使漏掉了 invalidate 也不会显示旧数据
+        return self.machines is machines and self.count == len(machines)
+
+    def static_lines(self, position: int) -> tuple[str, str]:
+        lines = self.lines.get(position)
+        if lines is None:
+            m = self.machines[position]
+            lines = self.lines[position] = (
+                f"{position + 1}. 🖥️ 机器名称: 「{short_remark(m.remark)}」\n",
+                f"   📅 到期时间: {m.expires_dt:%Y-%m-%d %H:%M}（GMT+7）\n",
+            )
+        return lines
+
+
+class MachinePages:
+    """format_left(timedelta) -> str 用于渲染剩余时间（与提醒消息的格式一致）。"""
+
+    def __init__(self, format_left, page_size: int = PAGE_SIZE, max_users: int = MAX_CACHED_USERS):
+        self.format_left = format_left
+        self.page_size = page_size
+        self.max_users = max_users
+        self._users: OrderedDict[str, _UserPages] = OrderedDict()  # 按最近使用排序，最久未用的在最前
+
+    def invalidate(self, user_id: str) -> None:
+        self._users.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._users.clear()
+
+    def _pages_for(self, user_id: str, machines: list[Machine]) -> _UserPages:
+        pages = self._users.get(user_id)
+        if pages is None or not pages.valid_for(machines):
+            pages = self._users[user_id] = _UserPages(machines)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        return pages
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def page_count(self, machine_count: int) -> int:
+        return max(1, -(-machine_count // self.page_size))
+
+    def render(self, user_id: str, machines: list[Machine], page: int, now: datetime) -> tuple[str, int, int]:
+        """渲染第 page 页（从 0 开始，越界时取最近的一页），返回 (文本, 实际页码, 总页数)。"""
+        pages = self._pages_for(user_id, machines)
+        total = self.page_count(pages.count)
+        page = min(max(page, 0), total - 1)
+        start = page * self.page_size
+        lines = ["🗂️ 您的机器列表（按到期时间排序）：\n"]
+        for position in pages.order[start:start + self.page_size]:
+            name_line, expiry_line = pages.static_lines(position)
+            time_left = self.format_left(machines[position].expires_dt - now)
+            lines.append(f"{name_line}   ⏳ 剩余时间: {time_left}\n{expiry_line}")
+        if total > 1:
+            lines.append(f"第 {page + 1}/{total} 页，共 {pages.count} 台机器")
+        return "\n".join(lines), page, total
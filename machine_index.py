@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+机器 uuid 索引。
+
+uuid -> (user_id, Machine)，续期按钮、删除按钮、提醒任务按 uuid 找机器时不再遍历用户的机器列表。
+bot.py 中所有增删机器的操作（添加、删除、导入、其它进程同步来的数据）都会同步更新这里。
+"""
+
+from models import Machine
+
+
+class MachineIndex:
+    def __init__(self):
+        self._entries: dict[str, tuple[str, Machine]] = {}
+        self._by_user: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def rebuild(self, user_data: dict) -> None:
+        # 启动时对全部用户调用，直接构建两个字典，不逐台 add()
+        self._entries = {
+            machine.uuid: (user_id, machine)
+            for user_id, u_data in user_data.items()
+            for machine in u_data.get("machines", ())
+        }
+        self._by_user = {
+            user_id: {machine.uuid for machine in u_data["machines"]}
+            for user_id, u_data in user_data.items()
+            if u_data.get("machines")
+        }
+
+    def get(self, machine_uuid: str) -> tuple[str, Machine] | None:
+        return self._entries.get(machine_uuid)
+
+    def find(self, user_id: str, machine_uuid: str) -> Machine | None:
+        """只返回属于 user_id 的机器。"""
+        entry = self._entries.get(machine_uuid)
+        if entry is None or entry[0] != user_id:
+            return None
+        return entry[1]
+
+    def owner(self, machine_uuid: str) -> str | None:
+        entry = self._entries.get(machine_uuid)
+        return entry[0] if entry is not None else None
+
+    def add(self, user_id: str, machine: Machine) -> None:
+        self._entries[machine.uuid] = (user_id, machine)
+        self._by_user.setdefault(user_id, set()).add(machine.uuid)
+
+    def remove(self, machine_uuid: str) -> None:
+        entry = self._entries.pop(machine_uuid, None)
+        if entry is not None:
+            uuids = self._by_user.get(entry[0])
+            if uuids is not None:
+                uuids.discard(machine_uuid)
+
+    def set_user(self, user_id: str, machines: list[Machine]) -> None:
+        """用 machines 替换该用户在索引中的全部机器（导入或同步后调用）。"""
+        for machine_uuid in self._by_user.pop(user_id, ()):
+            if self._entries.get(machine_uuid, (None,))[0] == user_id:
+                del self._entries[machine_uuid]
+        for machine in machines:
+            self.add(user_id, machine)
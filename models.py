@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+内存中的机器记录。
+
+到期时间和上次提醒时间以整数秒（epoch）保存，只在添加/续期时重新计算，
+后台任务比较整数即可，不再反复 strptime / fromisoformat。
+与 JSON / 数据库中字典格式的互相转换只发生在存储层（from_dict / to_dict）。
+"""
+
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+TZ_GMT7 = ZoneInfo("Asia/Bangkok")      # 续期日期按 GMT+7 计算
+TZ_BEIJING = ZoneInfo("Asia/Shanghai")  # 提醒消息中展示北京时间
+
+_FIELDS = ("uuid", "remark", "host_type", "renewal_days", "last_event_date", "last_hourly_reminder_sent")
+
+
+def compute_expires_at(last_event_date: str, renewal_days: int) -> int:
+    """续期日期（GMT+7 当天 0 点）加上续期天数，返回到期时间的 epoch 秒。"""
+    d = date.fromisoformat(last_event_date)
+    event = datetime(d.year, d.month, d.day, tzinfo=TZ_GMT7)
+    return int((event + timedelta(days=renewal_days)).timestamp())
+
+
+class Machine:
+    __slots__ = ("uuid", "remark", "host_type", "renewal_days", "last_event_date", "expires_at", "last_reminder_at", "extra")
+
+    def __init__(
+        self,
+        uuid: str,
+        remark: str,
+        host_type: str,
+        renewal_days: int,
+        last_event_date: str,
+        last_reminder_at: int | None = None,
+        extra: dict | None = None,
+    ):
+        self.uuid = uuid
+        self.remark = remark
+        self.host_type = host_type
+        self.renewal_days = renewal_days
+        self.last_event_date = last_event_date
+        self.expires_at = compute_expires_at(last_event_date, renewal_days)
+        self.last_reminder_at = last_reminder_at
+        self.extra = extra  # 保留存储中未识别的字段，写回时原样输出
+
+    def __reduce__(self):
+        # 状态快照（storage.StateSnapshot）用 pickle 保存机器：按槽位顺序存成元组，恢复时不再重新计算到期时间
+        return _restore_machine, ((self.uuid, self.remark, self.host_type, self.renewal_days, self.last_event_date,
+                                   self.expires_at, self.last_reminder_at, self.extra),)
+
+    def __repr__(self) -> str:
+        return f"Machine({self.uuid!r}, {self.remark!r}, expires_at={self.expires_at})"
+
+    @property
+    def expires_dt(self) -> datetime:
+        return datetime.fromtimestamp(self.expires_at, TZ_GMT7)
+
+    def renew(self, event_date: str) -> None:
+        self.last_event_date = event_date
+        self.expires_at = compute_expires_at(event_date, self.renewal_days)
+        self.last_reminder_at = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Machine":
+        last_sent = data.get("last_hourly_reminder_sent")
+        extra = {k: v for k, v in data.items() if k not in _FIELDS}
+        return cls(
+            data["uuid"],
+            data["remark"],
+            data.get("host_type"),
+            data["renewal_days"],
+            data["last_event_date"],
+            int(datetime.fromisoformat(last_sent).timestamp()) if last_sent else None,
+            extra or None,
+        )
+
+    def to_dict(self) -> dict:
+        data = {
+            "uuid": self.uuid,
+            "remark": self.remark,
+            "host_type": self.host_type,
+            "renewal_days": self.renewal_days,
+            "last_event_date": self.last_event_date,
+            "last_hourly_reminder_sent": (
+                datetime.fromtimestamp(self.last_reminder_at, TZ_GMT7).isoformat()
+                if self.last_reminder_at is not None else None
+            ),
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+def _restore_machine(state: tuple) -> Machine:
+    machine = Machine.__new__(Machine)
+    (machine.uuid, machine.remark, machine.host_type, machine.renewal_days, machine.last_event_date,
+     machine.expires_at, machine.last_reminder_at, machine.extra) = state
+    return machine
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+通知分发器。
+
+后台任务只负责把消息放进队列，由固定数量的 worker 并发发送：
+- 全局和单个聊天各有一个令牌桶，对应 Telegram 的全局 / 单聊天发送频率限制；
+- 每个聊天有自己的待发队列（保持顺序），拿到该聊天的令牌后才放进就绪队列交给 worker，
+  某个聊天积压很多消息时只是定时稍后再排队，不会占住 worker、拖慢其它聊天；
+- 遇到 RetryAfter 按服务器要求的时间暂停全部发送后重试，网络错误按指数退避重试；
+- Forbidden（用户屏蔽了机器人）交给 on_forbidden 回调处理。
+
+bot 对象在 start() 时传入，测试时可以换成任何实现了 send_message 的假 Bot。
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Callable
+
+from telegram.error import Forbidden, NetworkError, RetryAfter, TimedOut
+
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+SEND_LATENCY = Histogram("bot_send_latency_seconds", "单次 send_message 调用耗时")
+SEND_RESULTS = Counter("bot_send_total", "send_message 调用结果", ("result",))  # ok / forbidden / retry_after / network / error
+SEND_QUEUE = Gauge("bot_send_queue_length", "等待发送的消息数")
+
+
+class TokenBucket:
+    """简单的令牌桶：每秒补充 rate 个令牌，最多存 capacity 个。"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """拿到令牌返回 0，否则返回还需等待的秒数。"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> None:
+        while (delay := self.try_acquire()) > 0:
+            await asyncio.sleep(delay)
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class Notification:
+    chat_id: int | str
+    text: str
+    kwargs: dict[str, Any] = field(default_factory=dict)
+    on_sent: Callable[[], None] | None = None
+    on_failed: Callable[[Exception], None] | None = None
+
+
+class NotificationDispatcher:
+    def __init__(
+        self,
+        workers: int = 8,
+        global_rate: float = 25.0,
+        per_chat_rate: float = 1.0,
+        max_retries: int = 3,
+        queue_size: int = 10000,
+        on_forbidden: Callable[[str], None] | None = None,
+    ):
+        self.workers = workers
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self.on_forbidden = on_forbidden
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: dict[str, TokenBucket] = {}
+        self._chats: dict[str, deque[Notification]] = {}  # 有待发消息的聊天 -> 按顺序的消息
+        self._timers: dict[str, asyncio.TimerHandle] = {}  # 等待令牌的聊天 -> 重新排队的定时器
+        self._ready: asyncio.Queue | None = None  # 已拿到令牌、可以立即发送的聊天
+        self._queue_size = queue_size
+        self._pending = 0  # 已入队但还没处理完（含正在发送）的消息数
+        self._idle: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._paused_until = 0.0
+        self.bot = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def start(self, bot) -> None:
+        if self.running:
+            return
+        self.bot = bot
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"notifier-{i}") for i in range(self.workers)]
+        SEND_QUEUE.set_function(lambda: self.pending)
+        logger.info(f"通知分发器已启动，{self.workers} 个发送 worker。")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """尽量发完队列中的消息（最多等待 timeout 秒），然后停止所有 worker。"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"通知分发器停止时仍有 {self.pending} 条消息未发送。")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._chats.clear()
+        self._pending = 0
+        self._idle.set()
+
+    async def join(self) -> None:
+        if self._idle is not None:
+            await self._idle.wait()
+
+    def enqueue(self, chat_id: int | str, text: str, *, on_sent=None, on_failed=None, **kwargs) -> bool:
+        """放入发送队列；队列已满或分发器未启动时调用 on_failed 并返回 False。"""
+        notification = Notification(chat_id, text, kwargs, on_sent, on_failed)
+        if not self.running:
+            self._fail(notification, RuntimeError("通知分发器未启动"))
+            return False
+        if self._pending >= self._queue_size:
+            logger.error(f"通知队列已满，丢弃发给 {chat_id} 的消息。")
+            self._fail(notification, asyncio.QueueFull())
+            return False
+        self._pending += 1
+        self._idle.clear()
+        key = str(chat_id)
+        messages = self._chats.get(key)
+        if messages is None:
+            self._chats[key] = deque([notification])
+            self._schedule(key)
+        else:
+            messages.append(notification)  # 该聊天已在排队，发完前一条后自然轮到它
+        return True
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets = {k: b for k, b in self._chat_buckets.items() if not b.idle}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, 1)
+        return bucket
+
+    def _schedule(self, chat_id: str) -> None:
+        """拿到该聊天的令牌后放进就绪队列；否则定时到令牌补足时再试，不占用 worker。"""
+        self._timers.pop(chat_id, None)
+        delay = self._chat_bucket(chat_id).try_acquire()
+        if delay > 0:
+            self._timers[chat_id] = asyncio.get_running_loop().call_later(delay, self._schedule, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._ready.get()
+            notification = self._chats[chat_id].popleft()
+            try:
+                await self._deliver(chat_id, notification)
+            except Exception as e:
+                logger.error(f"发送通知给 {chat_id} 时出现未处理的错误: {e}")
+            finally:
+                self._finish(chat_id)
+
+    def _finish(self, chat_id: str) -> None:
+        if self._chats.get(chat_id):
+            self._schedule(chat_id)
+        else:
+            self._chats.pop(chat_id, None)
+        self._pending -= 1
+        if self._pending <= 0:
+            self._idle.set()
+
+    async def _wait_for_slot(self) -> None:
+        await self._global_bucket.acquire()
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    async def _deliver(self, chat_id: str, n: Notification) -> None:
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                # 第一次发送的令牌在 _schedule 中已经拿到；重试前本来就要等待，这时再取该聊天的令牌
+                await self._chat_bucket(chat_id).acquire()
+            await self._wait_for_slot()
+            started = time.perf_counter()
+            try:
+                await self.bot.send_message(chat_id=n.chat_id, text=n.text, **n.kwargs)
+            except Forbidden as e:
+                SEND_RESULTS.inc(result="forbidden")
+                if self.on_forbidden:
+                    self.on_forbidden(chat_id)
+                self._fail(n, e)
+                return
+            except RetryAfter as e:
+                SEND_RESULTS.inc(result="retry_after")
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                logger.warning(f"触发 Telegram 频率限制，暂停发送 {delay} 秒。")
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                last_error = e
+            except (TimedOut, NetworkError) as e:
+                SEND_RESULTS.inc(result="network")
+                await asyncio.sleep(min(30.0, 2 ** attempt) + random.random())
+                last_error = e
+            except Exception as e:
+                SEND_RESULTS.inc(result="error")
+                logger.error(f"发送通知给 {chat_id} 失败: {e}")
+                self._fail(n, e)
+                return
+            else:
+                SEND_LATENCY.observe(time.perf_counter() - started)
+                SEND_RESULTS.inc(result="ok")
+                if n.on_sent:
+                    n.on_sent()
+                return
+        logger.error(f"发送通知给 {chat_id} 失败，已重试 {self.max_retries} 次: {last_error}")
+        self._fail(n, last_error)
+
+    @staticmethod
+    def _fail(n: Notification, error: Exception) -> None:
+        if n.on_failed:
+            n.on_failed(error)
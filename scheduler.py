@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+续期提醒调度器。
+
+按"下一次应提醒时间"排序的最小堆，以机器 uuid 为键。
+添加/删除/续期/发送提醒时增量更新，每次任务只弹出已到期的条目，
+开销与需要发送的提醒数成正比，而不是与机器总数成正比。
+"""
+
+import heapq
+import itertools
+import time
+
+# 到期前多久开始提醒（秒），以及两次提醒的最小间隔（秒）
+REMIND_WINDOW = 2 * 24 * 3600
+REMIND_INTERVAL = 3600
+
+
+def next_reminder_at(expires_at: float, last_sent: float | None, now: float | None = None) -> float | None:
+    """
+    根据到期时间和上次提醒时间计算下一次提醒的时间戳。
+    已经过期，或者下一次提醒会落在到期之后时，不需要再提醒，返回 None。
+    """
+    if expires_at <= (time.time() if now is None else now):
+        return None
+    due = expires_at - REMIND_WINDOW
+    if last_sent is not None:
+        due = max(due, last_sent + REMIND_INTERVAL)
+    return due if due < expires_at else None
+
+
+class ReminderScheduler:
+    """
+    以 uuid 为键的提醒优先队列。
+
+    堆中的旧条目采用惰性删除：每个 uuid 只有 _entries 中记录的序号有效，
+    弹出时遇到序号不匹配的条目直接丢弃。
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[float, int, str]] = []
+        self._entries: dict[str, tuple[float, int, str]] = {}  # uuid -> (due, seq, user_id)
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, machine_uuid: str) -> bool:
+        return machine_uuid in self._entries
+
+    def schedule(self, user_id: str, machine_uuid: str, expires_at: float, last_sent: float | None, now: float | None = None) -> None:
+        """为机器（重新）安排下一次提醒；无需提醒时移除其条目。"""
+        due = next_reminder_at(expires_at, last_sent, now)
+        if due is None:
+            self.discard(machine_uuid)
+            return
+        seq = next(self._seq)
+        self._entries[machine_uuid] = (due, seq, user_id)
+        heapq.heappush(self._heap, (due, seq, machine_uuid))
+        self._maybe_compact()
+
+    def discard(self, machine_uuid: str) -> None:
+        self._entries.pop(machine_uuid, None)
+
+    def pop_due(self, now: float) -> list[tuple[str, str]]:
+        """弹出所有 due <= now 的条目，返回 [(user_id, uuid), ...]。"""
+        due = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, seq, machine_uuid = heapq.heappop(heap)
+            entry = self._entries.get(machine_uuid)
+            if entry is None or entry[1] != seq:
+                continue
+            del self._entries[machine_uuid]
+            due.append((entry[2], machine_uuid))
+        return due
+
+    def next_due(self) -> float | None:
+        """最近一次提醒的时间戳，队列为空时返回 None。"""
+        while self._heap:
+            due, seq, machine_uuid = self._heap[0]
+            entry = self._entries.get(machine_uuid)
+            if entry is not None and entry[1] == seq:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self._entries.clear()
+
+    def _maybe_compact(self) -> None:
+        # 过期条目过多时重建堆，避免频繁续期导致堆无限增长
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(due, seq, u) for u, (due, seq, _) in self._entries.items()]
+            heapq.heapify(self._heap)
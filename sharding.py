@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+分片部署：前台进程负责 run_polling 和所有命令处理，
+check_expirations_job / check_datacenters_job 交给 N 个 worker 进程执行。
+
+每个 worker 按 crc32(user_id) % N 只负责自己那一部分用户，几个进程通过同一个
+SQLite 数据库共享数据（见 storage.SqliteStorage.load_changes）。
+worker 每一轮结束后向标准输出写一行 "SHARD_REPORT {json}"，由前台进程汇总到日志。
+
+本地试运行（不连接 Telegram，使用 fake_bot.FakeBot）:
+    python sharding.py --shards 4 --duration 180
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+REPORT_PREFIX = "SHARD_REPORT "
+
+
+def shard_of(user_id: str, count: int) -> int:
+    """稳定的分片函数（不能用 hash()，它在每个进程中都不一样）。"""
+    return zlib.crc32(str(user_id).encode("utf-8")) % count
+
+
+class ShardSupervisor:
+    """启动并看管 worker 子进程，收集它们上报的每轮耗时。"""
+
+    def __init__(self, count: int, script: str, env: dict | None = None):
+        self.count = count
+        self.script = script
+        self.env = env or {}
+        self.cwd = os.getcwd()  # 数据文件都是相对路径，worker 必须与前台进程使用同一个工作目录
+        self.processes: list[subprocess.Popen] = []
+        self.reports: queue.Queue = queue.Queue()
+        self._reported_exit: set[int] = set()
+
+    def start(self) -> None:
+        for index in range(self.count):
+            env = {**os.environ, **self.env, "BOT_SHARD_INDEX": str(index), "BOT_SHARDS": str(self.count)}
+            proc = subprocess.Popen(
+                [sys.executable, "-u", self.script],
+                env=env,
+                stdout=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+                cwd=self.cwd,
+            )
+            threading.Thread(target=self._read_reports, args=(index, proc), daemon=True).start()
+            self.processes.append(proc)
+        logger.info(f"已启动 {self.count} 个分片 worker 进程。")
+
+    def _read_reports(self, index: int, proc: subprocess.Popen) -> None:
+        for line in proc.stdout:
+            if line.startswith(REPORT_PREFIX):
+                try:
+                    self.reports.put(json.loads(line[len(REPORT_PREFIX):]))
+                except json.JSONDecodeError:
+                    pass
+            else:
+                sys.stdout.write(f"[shard-{index}] {line}")
+
+    def drain_reports(self) -> list[dict]:
+        reports = []
+        while True:
+            try:
+                reports.append(self.reports.get_nowait())
+            except queue.Empty:
+                return reports
+
+    def check_alive(self) -> None:
+        for index, proc in enumerate(self.processes):
+            if proc.poll() is not None and index not in self._reported_exit:
+                self._reported_exit.add(index)
+                logger.error(f"分片 worker {index} 已退出（退出码 {proc.returncode}）。")
+
+    def stop(self, timeout: float = 15.0) -> None:
+        for proc in self.processes:
+            if proc.poll() is None:
+                proc.terminate()
+        deadline = time.monotonic() + timeout
+        for proc in self.processes:
+            try:
+                proc.wait(max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self.processes = []
+
+
+def format_report(report: dict) -> str:
+    return (
+        f"分片 {report['shard']}: 用户 {report['users']}，待提醒 {report['scheduled']}，"
+        f"续期检查 {report['expirations_ms']:.1f} ms，数据中心检查 {report['datacenters_ms']:.1f} ms，"
+        f"同步 {report['sync_ms']:.1f} ms（更新 {report['synced_users']} 个用户）"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=180, help="运行多少秒后退出")
+    parser.add_argument("--tick", type=float, default=None, help="worker 每轮间隔（秒），默认沿用 BOT_SHARD_TICK")
+    args = parser.parse_args()
+
+    env = {"BOT_FAKE_BOT": "1", "BOT_TOKEN": os.environ.get("BOT_TOKEN", "0:fake")}
+    if args.tick is not None:
+        env["BOT_SHARD_TICK"] = str(args.tick)
+    supervisor = ShardSupervisor(args.shards, os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py"), env)
+    supervisor.start()
+    try:
+        deadline = time.monotonic() + args.duration
+        while time.monotonic() < deadline:
+            time.sleep(1)
+            for report in supervisor.drain_reports():
+                logger.info(format_report(report))
+            supervisor.check_alive()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
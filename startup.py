@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+启动耗时统计。
+
+bot.py 最先导入本模块，之后在每个阶段结束时调用 mark()，记录从上一阶段结束到现在的耗时
+（导入依赖、加载用户数据、初始化模块、注册处理器、连接 Telegram、等待第一条更新），
+启动完成和处理完第一条更新时各输出一行汇总日志，开启指标时导出为 bot_startup_seconds{phase}。
+模块级的导入明细可以用 python -X importtime bot.py 查看，或运行 benchmarks/bench_startup.py 按包汇总。
+"""
+
+import time
+
+_started = time.perf_counter()
+_last = _started
+phases: dict[str, float] = {}
+
+
+def mark(phase: str) -> float:
+    """结束一个阶段，返回该阶段的耗时（秒）；同名阶段的耗时累加。"""
+    global _last
+    now = time.perf_counter()
+    phases[phase] = phases.get(phase, 0.0) + now - _last
+    _last = now
+    return phases[phase]
+
+
+def elapsed() -> float:
+    """从导入本模块到最后一个阶段结束的总耗时（秒）。"""
+    return _last - _started
+
+
+def summary() -> str:
+    parts = "，".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in phases.items())
+    return f"{elapsed():.2f}s（{parts}）"
+
+
+def export(gauge) -> None:
+    """把各阶段耗时设置到带 phase 标签的 Gauge 上。"""
+    for phase, seconds in phases.items():
+        gauge.set(seconds, phase=phase)
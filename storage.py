@@ -0,0 +1,688 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+用户数据存储层。
+
+bot.py 通过 load_user_data / save_user_data 访问这里，具体写到哪里由后端决定：
+- JsonStorage:   兼容旧版的 user_data.json，按用户缓存序列化片段，整文件原子替换；
+- SqliteStorage: SQLite (WAL)，按用户/按机器行更新，首次启动时自动从 JSON 迁移。
+
+保存时在调用方线程只为要写入的用户拍一份快照（机器转成字典、嵌套的列表/字典复制一份），
+JSON 序列化和磁盘写入都交给单线程的写入器执行，不阻塞事件循环，同时保证写入顺序。
+WriteBehindCache 在此之上记录"脏"用户，把一段时间内的多次修改合并成一次写入；
+flush_async() 分批拍快照，批与批之间让出事件循环，大量用户写盘时也不会卡住更新处理。
+
+内存中的机器是 models.Machine 对象，与字典格式的转换只在这里进行。
+StateSnapshot 是启动用的二进制快照：正常退出时写出，下次启动时跳过 JSON 解析直接反序列化。
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import struct
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from aio import run_blocking
+from metrics import Counter, Histogram
+from models import Machine
+
+logger = logging.getLogger(__name__)
+
+PREPARE_SECONDS = Histogram("bot_storage_prepare_seconds", "保存时在事件循环中拍快照所花的时间（每批）")
+FLUSH_SECONDS = Histogram("bot_storage_flush_seconds", "后台线程写盘耗时")
+FLUSH_BYTES = Counter("bot_storage_flush_bytes_total", "写盘的字节数")
+FLUSH_ERRORS = Counter("bot_storage_flush_errors_total", "写盘失败次数")
+
+
+def _decode_user(u_data: dict) -> dict:
+    if "machines" in u_data:
+        u_data["machines"] = [Machine.from_dict(m) for m in u_data["machines"]]
+    return u_data
+
+
+# flush_async() 每批拍快照的用户数
+SNAPSHOT_BATCH = 1000
+
+
+def snapshot_users(data: dict, user_ids) -> list[tuple[str, dict | None]]:
+    """
+    为要写入的用户拍快照: [(user_id, 字典格式的用户数据或 None（已删除）)]。
+    结果可以交给其它线程序列化，之后事件循环继续修改 data 不会影响它。
+    """
+    rows = []
+    for user_id in user_ids:
+        u_data = data.get(user_id)
+        if u_data is None:
+            rows.append((user_id, None))
+            continue
+        encoded = {}
+        for k, v in u_data.items():  # 保持字段顺序，JSON 后端写出的文件与旧版逐字节相同
+            if k == "machines":
+                encoded[k] = [m.to_dict() for m in v]
+            else:
+                encoded[k] = copy.deepcopy(v) if isinstance(v, (dict, list)) else v
+        rows.append((user_id, encoded))
+    return rows
+
+
+def snapshot_owned_fields(data: dict, user_ids) -> list[tuple[str, dict | None]]:
+    """
+    分片 worker 用的快照：只包含 worker 负责修改的字段（屏蔽标记、每台机器的上次提醒时间），
+    其余字段由前台进程修改，worker 手中的副本可能已经过期，不能写回。
+    """
+    rows = []
+    for user_id in user_ids:
+        u_data = data.get(user_id)
+        if u_data is None:
+            rows.append((user_id, None))
+            continue
+        machines = []
+        for m in u_data.get("machines", ()):
+            last_sent = m.to_dict()["last_hourly_reminder_sent"]
+            if last_sent is not None:
+                machines.append((m.uuid, m.last_event_date, last_sent))
+        rows.append((user_id, {"is_blocked": u_data.get("is_blocked"), "machines": machines}))
+    return rows
+
+
+def _atomic_write(path: str, content: str | bytes) -> int:
+    """先写临时文件再 os.replace，崩溃时不会留下被截断的文件。"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    binary = isinstance(content, bytes)
+    try:
+        with os.fdopen(fd, "wb" if binary else "w", encoding=None if binary else "utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(content) if binary else len(content.encode("utf-8"))
+
+
+class JsonStorage:
+    """
+    整文件 JSON 后端，格式与旧版 user_data.json（indent=4）完全一致。
+    每个用户的序列化结果单独缓存，保存时只重新序列化发生变化的用户，再拼接成整个文件。
+    """
+
+    name = "json"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fragments: dict[str, str] = {}
+        # 第一次保存时还没有任何片段，必须拍全部用户的快照（由 UserDataStore 在事件循环中检查并清除）
+        self.needs_full_save = True
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        for u_data in data.values():
+            _decode_user(u_data)
+        return data
+
+    @staticmethod
+    def _fragment(user_id: str, encoded: dict) -> str:
+        # 与 json.dumps(data, indent=4) 中该用户对应的那一段逐字节相同
+        body = json.dumps(encoded, ensure_ascii=False, indent=4).replace("\n", "\n    ")
+        return f"    {json.dumps(user_id, ensure_ascii=False)}: {body}"
+
+    def prepare(self, rows: list, full: bool = False) -> list[str]:
+        """rows 为 snapshot_users() 的结果；full 表示 rows 包含全部用户。只在写入线程中调用。"""
+        if full:
+            self._fragments = {}
+        for user_id, encoded in rows:
+            if encoded is not None:
+                self._fragments[user_id] = self._fragment(user_id, encoded)
+            else:
+                self._fragments.pop(user_id, None)
+        return list(self._fragments.values())
+
+    def write(self, payload: list[str]) -> int:
+        text = "{\n" + ",\n".join(payload) + "\n}" if payload else "{}"
+        return _atomic_write(self.path, text)
+
+    def state_version(self, synced_rev: int | None = None) -> str | None:
+        """文件的大小和修改时间，作为状态快照的版本；文件不存在时返回 None。"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def accepts_snapshot(self, version: str) -> bool:
+        return version == self.state_version()
+
+    def catch_up(self, data: dict, version: str) -> dict | None:
+        return data
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteStorage:
+    """
+    SQLite 后端：users 表每个用户一行，machines 表每台机器一行。
+    保存某个用户时只更新该用户及其机器对应的行。
+
+    多进程（分片）部署时几个进程共用同一个数据库：每次写入都会递增全局版本号 rev，
+    并在用户行上记录版本号和写入者，其它进程通过 load_changes() 只读取别人改过的用户。
+    前台进程写入整行；worker 用 write_fields() 只更新提醒时间和屏蔽标记（写入者置空，所有进程都会重新读取）。
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            data    TEXT NOT NULL,
+            rev     INTEGER NOT NULL DEFAULT 0,
+            writer  TEXT
+        );
+        CREATE TABLE IF NOT EXISTS machines (
+            uuid     TEXT PRIMARY KEY,
+            user_id  TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            data     TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS machines_user ON machines (user_id, position);
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('rev', 0);
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('instance', lower(hex(randomblob(8))));
+    """
+
+    # 同一天内重复保存时，提醒时间只增不减（另一个进程可能刚刚发过提醒）；
+    # 续期（last_event_date 变化）时以新写入的数据为准
+    UPSERT_MACHINE = """
+        INSERT INTO machines (uuid, user_id, position, data) VALUES (?, ?, ?, ?)
+        ON CONFLICT(uuid) DO UPDATE SET
+            user_id = excluded.user_id,
+            position = excluded.position,
+            data = CASE
+                WHEN json_extract(excluded.data, '$.last_event_date') = json_extract(machines.data, '$.last_event_date')
+                 AND json_extract(machines.data, '$.last_hourly_reminder_sent')
+                     > COALESCE(json_extract(excluded.data, '$.last_hourly_reminder_sent'), '')
+                THEN json_set(excluded.data, '$.last_hourly_reminder_sent',
+                              json_extract(machines.data, '$.last_hourly_reminder_sent'))
+                ELSE excluded.data
+            END
+    """
+
+    # 分片 worker 只更新自己负责的字段：提醒时间只增不减，且只在续期日期未变（前台没有续期）、机器仍存在时写入；
+    # 用户行的 writer 置空，所有进程（包括 worker 自己）下次同步时都会重新读取合并后的整行
+    UPDATE_REMINDER = """
+        UPDATE machines SET data = json_set(data, '$.last_hourly_reminder_sent', ?)
+        WHERE uuid = ? AND user_id = ?
+          AND json_extract(data, '$.last_event_date') = ?
+          AND COALESCE(json_extract(data, '$.last_hourly_reminder_sent'), '') < ?
+    """
+    UPDATE_BLOCKED = "UPDATE users SET data = json_set(data, '$.is_blocked', json(?)), rev = ?, writer = NULL WHERE user_id = ?"
+
+    def __init__(self, path: str, legacy_json_path: str | None = None, writer_id: str = "main"):
+        self.path = path
+        self.legacy_json_path = legacy_json_path
+        self.writer_id = writer_id
+        self.rev = 0
+        # 连接只在启动加载时由主线程使用，之后只由写入线程使用；读取其它进程的修改使用单独的连接
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self._upgrade_schema()
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+        self._read_conn = None
+
+    def _upgrade_schema(self) -> None:
+        # 旧版数据库的 users 表没有 rev / writer 两列
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(users)")}
+        if columns and "rev" not in columns:
+            self.conn.execute("ALTER TABLE users ADD COLUMN rev INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute("ALTER TABLE users ADD COLUMN writer TEXT")
+
+    def load(self) -> dict:
+        self._migrate_from_json()
+        # 先取版本号再读数据：期间其它进程的写入最多在下次 load_changes 时被重复读取，不会遗漏
+        self.rev = int(self.conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0])
+        data = {}
+        for user_id, raw in self.conn.execute("SELECT user_id, data FROM users"):
+            u_data = json.loads(raw)
+            u_data["machines"] = []
+            data[user_id] = u_data
+        for user_id, raw in self.conn.execute("SELECT user_id, data FROM machines ORDER BY user_id, position"):
+            data.setdefault(user_id, {"machines": []})["machines"].append(Machine.from_dict(json.loads(raw)))
+        return data
+
+    def load_changes(self, since: int, include_own: bool = False) -> tuple[int, dict]:
+        """
+        读取版本号大于 since、且由其它进程写入或由 write_fields() 合并过（include_own 时包括本进程）的用户，
+        返回 (当前版本号, {user_id: u_data})。
+        """
+        if self._read_conn is None:
+            self._read_conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._read_conn.execute("PRAGMA busy_timeout=5000")
+        conn = self._read_conn
+        rev = int(conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0])
+        if rev <= since:
+            return rev, {}
+        data = {}
+        if include_own:
+            rows = conn.execute("SELECT user_id, data FROM users WHERE rev > ?", (since,))
+        else:
+            rows = conn.execute("SELECT user_id, data FROM users WHERE rev > ? AND writer IS NOT ?", (since, self.writer_id))
+        for user_id, raw in rows:
+            u_data = json.loads(raw)
+            u_data["machines"] = []
+            data[user_id] = u_data
+        for user_id in data:
+            for (raw,) in conn.execute("SELECT data FROM machines WHERE user_id = ? ORDER BY position", (user_id,)):
+                data[user_id]["machines"].append(Machine.from_dict(json.loads(raw)))
+        return rev, data
+
+    def state_version(self, synced_rev: int | None = None) -> str:
+        """
+        数据库实例 id 和版本号，作为状态快照的版本。
+        synced_rev 是内存数据已同步到的版本号：此后只有本进程写过（内存中都有）时取当前版本号，
+        否则取 synced_rev，下次启动时补读之后被修改的用户。
+        """
+        instance = self.conn.execute("SELECT value FROM meta WHERE key = 'instance'").fetchone()[0]
+        rev = int(self.conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0])
+        if synced_rev is not None and synced_rev < rev and self.conn.execute(
+            "SELECT 1 FROM users WHERE rev > ? AND rev <= ? AND writer IS NOT ? LIMIT 1",
+            (synced_rev, rev, self.writer_id),
+        ).fetchone():
+            rev = synced_rev
+        return f"{instance}:{rev}"
+
+    def accepts_snapshot(self, version: str) -> bool:
+        """同一个数据库、且快照不比数据库新时可以使用（落后的部分由 catch_up 补读）。"""
+        self._migrate_from_json()
+        instance, _, rev = version.partition(":")
+        current_instance, _, current_rev = self.state_version().partition(":")
+        return instance == current_instance and int(rev) <= int(current_rev)
+
+    def catch_up(self, data: dict, version: str) -> dict | None:
+        """
+        把快照补齐到数据库的当前状态：重新读取快照之后被修改过的用户（包括本进程写入的）。
+        用户数对不上（有用户被删除）时返回 None，由调用方完整加载。
+        """
+        self.rev, changes = self.load_changes(int(version.partition(":")[2]), include_own=True)
+        data.update(changes)
+        if self.conn.execute("SELECT count(*) FROM users").fetchone()[0] != len(data):
+            return None
+        return data
+
+    def _migrate_from_json(self) -> None:
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+            return
+        if self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+            return
+        legacy = JsonStorage(self.legacy_json_path).load()
+        self.write(self.prepare(snapshot_users(legacy, legacy.keys()), full=True))
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                (self.legacy_json_path,),
+            )
+        logger.info(f"已从 {self.legacy_json_path} 迁移 {len(legacy)} 个用户到 {self.path}。")
+
+    def prepare(self, rows: list, full: bool = False) -> list:
+        """
+        序列化 snapshot_users() 的结果，返回 [(user_id, user_json 或 None, [(uuid, position, machine_json), ...]), ...]。
+        只在写入线程中调用。
+        """
+        payload = []
+        for user_id, encoded in rows:
+            if encoded is None:
+                payload.append((user_id, None, []))
+                continue
+            fields = {k: v for k, v in encoded.items() if k != "machines"}
+            machines = [
+                (m["uuid"], pos, json.dumps(m, ensure_ascii=False))
+                for pos, m in enumerate(encoded.get("machines", []))
+            ]
+            payload.append((user_id, json.dumps(fields, ensure_ascii=False), machines))
+        return payload
+
+    def write(self, payload: list) -> int:
+        written = 0
+        with self.conn:
+            self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'rev'")
+            rev = self.conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0]
+            for user_id, user_json, machines in payload:
+                if user_json is None:
+                    self.conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+                    self.conn.execute("DELETE FROM machines WHERE user_id = ?", (user_id,))
+                    continue
+                self.conn.execute(
+                    "INSERT INTO users (user_id, data, rev, writer) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, rev = excluded.rev, writer = excluded.writer",
+                    (user_id, user_json, rev, self.writer_id),
+                )
+                existing = {row[0] for row in self.conn.execute("SELECT uuid FROM machines WHERE user_id = ?", (user_id,))}
+                removed = existing.difference(m[0] for m in machines)
+                if removed:
+                    self.conn.executemany("DELETE FROM machines WHERE uuid = ?", [(u,) for u in removed])
+                self.conn.executemany(
+                    self.UPSERT_MACHINE,
+                    [(m_uuid, user_id, pos, raw) for m_uuid, pos, raw in machines],
+                )
+                written += len(user_json) + sum(len(raw) for _, _, raw in machines)
+        return written
+
+    def write_fields(self, rows: list) -> int:
+        """写入 snapshot_owned_fields() 的结果（分片 worker 使用），不会覆盖前台进程修改的其它字段。"""
+        written = 0
+        with self.conn:
+            self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'rev'")
+            rev = self.conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0]
+            for user_id, fields in rows:
+                if fields is None:
+                    continue  # 用户只会由前台进程删除
+                blocked = json.dumps(bool(fields["is_blocked"]))
+                self.conn.execute(self.UPDATE_BLOCKED, (blocked, rev, user_id))
+                self.conn.executemany(
+                    self.UPDATE_REMINDER,
+                    [(last_sent, m_uuid, user_id, event_date, last_sent) for m_uuid, event_date, last_sent in fields["machines"]],
+                )
+                written += len(blocked) + sum(len(last_sent) for _, _, last_sent in fields["machines"])
+        return written
+
+    def close(self) -> None:
+        if self._read_conn is not None:
+            self._read_conn.close()
+        self.conn.close()
+
+
+class UserDataStore:
+    """
+    把存储后端包装成"调用方拍快照 + 单线程后台序列化并写入"的形式。
+    owned_fields_only=True 时（分片 worker）只写入 snapshot_owned_fields() 中的字段。
+    """
+
+    def __init__(self, backend, owned_fields_only: bool = False):
+        self.backend = backend
+        self.owned_fields_only = owned_fields_only
+        self.errors = 0  # 写盘失败次数，失败过的进程退出时不写状态快照
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+
+    def load(self) -> dict:
+        return self.backend.load()
+
+    @property
+    def supports_sync(self) -> bool:
+        return hasattr(self.backend, "load_changes")
+
+    def _is_full(self, user_ids) -> bool:
+        full = user_ids is None or getattr(self.backend, "needs_full_save", False)
+        if full and hasattr(self.backend, "needs_full_save"):
+            self.backend.needs_full_save = False
+        return full
+
+    def save(self, data: dict, user_ids=None) -> Future:
+        """保存全部用户（user_ids 为 None）或指定用户，返回写入任务的 Future。"""
+        full = self._is_full(user_ids)
+        with PREPARE_SECONDS.time():
+            rows = self._snapshot(data, data.keys() if full else user_ids)
+        return self._executor.submit(self._write, rows, full)
+
+    def _snapshot(self, data: dict, user_ids) -> list:
+        if self.owned_fields_only:
+            return snapshot_owned_fields(data, user_ids)
+        return snapshot_users(data, user_ids)
+
+    async def save_async(self, data: dict, user_ids=None, batch: int = SNAPSHOT_BATCH) -> Future:
+        """与 save() 相同，但每拍 batch 个用户的快照就让出一次事件循环；所有批次合并成一次写入。"""
+        full = self._is_full(user_ids)
+        user_ids = list(data) if full else list(user_ids)
+        rows = []
+        for start in range(0, len(user_ids), batch):
+            with PREPARE_SECONDS.time():
+                rows.extend(self._snapshot(data, user_ids[start:start + batch]))
+            if start + batch < len(user_ids):
+                await asyncio.sleep(0)
+        return self._executor.submit(self._write, rows, full)
+
+    def _write(self, rows, full: bool) -> int:
+        started = time.perf_counter()
+        try:
+            if self.owned_fields_only:
+                written = self.backend.write_fields(rows)
+            else:
+                written = self.backend.write(self.backend.prepare(rows, full))
+        except Exception as e:
+            self.errors += 1
+            FLUSH_ERRORS.inc()
+            logger.error(f"保存用户数据失败: {e}")
+            return 0
+        FLUSH_SECONDS.observe(time.perf_counter() - started)
+        FLUSH_BYTES.inc(written)
+        return written
+
+    def wait(self) -> None:
+        """等待所有排队中的写入完成，之后不能再提交写入。"""
+        self._executor.shutdown(wait=True)
+
+    def close(self) -> None:
+        """等待所有排队中的写入完成后关闭后端。"""
+        self.wait()
+        self.backend.close()
+
+
+# 状态快照文件: STATE_MAGIC + 头部 (格式版本, 元数据长度) + 元数据 JSON + pickle
+STATE_MAGIC = b"HWSTATE\n"
+STATE_VERSION = 1  # 修改 Machine 的字段或用户数据在内存中的结构时递增，旧的快照会被忽略
+_STATE_HEADER = struct.Struct("<HI")
+
+
+class StateSnapshot:
+    """
+    启动用的二进制状态快照（pickle 协议 5）。
+
+    正常退出时把内存中的全部用户数据连同存储后端的版本（JSON 文件的大小和修改时间，
+    或 SQLite 数据库的实例 id 和 rev）写入快照；下次启动时版本对得上就直接反序列化，
+    不再逐个解析 JSON、构造 Machine。SQLite 后端允许快照落后，只补读之后被修改的用户。
+    版本对不上、文件损坏或格式版本不同时忽略快照，从存储后端完整加载。
+    快照只应由本程序写出（pickle 可以执行任意代码），readonly=True 时只读不写（分片 worker 只持有部分用户）。
+    """
+
+    def __init__(self, path: str, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+
+    def load(self, backend) -> dict | None:
+        try:
+            with open(self.path, "rb") as f:
+                head = f.read(len(STATE_MAGIC) + _STATE_HEADER.size)
+                if not head.startswith(STATE_MAGIC) or len(head) < len(STATE_MAGIC) + _STATE_HEADER.size:
+                    logger.warning(f"{self.path} 不是状态快照，已忽略。")
+                    return None
+                version, meta_size = _STATE_HEADER.unpack(head[len(STATE_MAGIC):])
+                if version != STATE_VERSION:
+                    logger.info(f"状态快照的格式版本为 {version}（当前为 {STATE_VERSION}），从存储完整加载。")
+                    return None
+                meta = json.loads(f.read(meta_size))
+                if meta.get("backend") != backend.name or not backend.accepts_snapshot(meta["state"]):
+                    logger.info("状态快照与存储中的数据不一致，从存储完整加载。")
+                    return None
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取状态快照失败，从存储完整加载: {e}")
+            return None
+        return backend.catch_up(data, meta["state"])
+
+    def save(self, data: dict, backend, synced_rev: int | None = None) -> int:
+        """写出快照，返回字节数；存储后端还没有数据文件时不写。调用前必须等待所有写盘完成。"""
+        state = backend.state_version(synced_rev)
+        if state is None:
+            return 0
+        meta = json.dumps({"backend": backend.name, "state": state, "users": len(data), "saved_at": int(time.time())}).encode("utf-8")
+        payload = STATE_MAGIC + _STATE_HEADER.pack(STATE_VERSION, len(meta)) + meta + pickle.dumps(data, protocol=5)
+        return _atomic_write(self.path, payload)
+
+
+class WriteBehindCache:
+    """
+    写回缓存：save 只把用户标记为脏，按时间间隔或脏用户数量阈值合并成一次写入。
+
+    flush() 在调用方线程为脏用户拍快照，序列化和写盘交给 UserDataStore 的后台线程；
+    事件循环中使用 flush_async() / maybe_flush_async()，分批拍快照。
+    close() 在退出时同步写完所有数据，再写出状态快照（如果配置了 snapshot）。
+    """
+
+    def __init__(self, store: UserDataStore, flush_interval: float = 5.0, max_dirty: int = 500,
+                 snapshot: StateSnapshot | None = None):
+        self.store = store
+        self.snapshot = snapshot
+        self.loaded_from = None  # load() 之后为 "snapshot" 或后端名称
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self._data: dict | None = None
+        self._dirty: set[str] = set()
+        self._all_dirty = False
+        self._last_flush = time.monotonic()
+        self._synced_rev = 0
+        self._flushing = False  # flush_async() 分批拍快照期间为 True
+
+    def load(self) -> dict:
+        data = self.snapshot.load(self.store.backend) if self.snapshot is not None else None
+        self.loaded_from = "snapshot" if data is not None else self.store.backend.name
+        self._data = data if data is not None else self.store.load()
+        self._synced_rev = getattr(self.store.backend, "rev", 0)
+        return self._data
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def mark_dirty(self, data: dict, user_ids=None) -> None:
+        """标记指定用户（user_ids 为 None 时为全部用户）需要写盘。"""
+        self._data = data
+        if user_ids is None:
+            self._all_dirty = True
+        else:
+            self._dirty.update(user_ids)
+        # 正在分批拍快照时不能插入一次同步写入（否则它会被稍后提交、内容更旧的那次写入覆盖），等那次结束后再写
+        if not self._flushing and (self._all_dirty or len(self._dirty) >= self.max_dirty):
+            self.flush()
+
+    def maybe_flush(self) -> Future | None:
+        """距上次写入超过 flush_interval 时写盘，供定时任务调用。"""
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            return self.flush()
+        return None
+
+    async def maybe_flush_async(self) -> Future | None:
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            return await self.flush_async()
+        return None
+
+    def _take_dirty(self):
+        """取出本次要写入的用户（None 表示全部），返回 (是否有需要写入的, user_ids)。"""
+        self._last_flush = time.monotonic()
+        if self._data is None or not (self._all_dirty or self._dirty):
+            return False, None
+        user_ids = None if self._all_dirty else self._dirty
+        self._dirty = set()
+        self._all_dirty = False
+        return True, user_ids
+
+    def flush(self) -> Future | None:
+        pending, user_ids = self._take_dirty()
+        if not pending:
+            return None
+        return self.store.save(self._data, user_ids)
+
+    async def flush_async(self) -> Future | None:
+        if self._flushing:
+            return None
+        pending, user_ids = self._take_dirty()
+        if not pending:
+            return None
+        self._flushing = True
+        try:
+            return await self.store.save_async(self._data, user_ids)
+        finally:
+            self._flushing = False
+
+    def sync(self, data: dict, accept=None) -> list[str]:
+        """
+        读取其它进程写入的用户并替换到 data 中（仅 SQLite 后端），返回被更新的用户 id。
+        本进程还有未写盘修改的用户保持不变；accept(user_id) 返回 False 的用户会被忽略。
+        """
+        return self.apply_changes(data, *self.fetch_changes(), accept=accept)
+
+    async def sync_async(self, data: dict, accept=None) -> list[str]:
+        """与 sync() 相同，但查询数据库在 I/O 线程池中执行。"""
+        rev, changes = await run_blocking(self.fetch_changes, op="storage_sync")
+        return self.apply_changes(data, rev, changes, accept=accept)
+
+    def fetch_changes(self) -> tuple[int, dict]:
+        """只读数据库，可以在其它线程中调用。"""
+        return self.store.backend.load_changes(self._synced_rev)
+
+    def apply_changes(self, data: dict, rev: int, changes: dict, accept=None) -> list[str]:
+        self._synced_rev = max(self._synced_rev, rev)
+        updated = []
+        for user_id, u_data in changes.items():
+            if user_id in self._dirty or (accept is not None and not accept(user_id)):
+                continue
+            data[user_id] = u_data
+            updated.append(user_id)
+        return updated
+
+    def save_snapshot(self) -> None:
+        if self.store.errors:
+            logger.warning("本次运行有写盘失败，不写出状态快照。")
+            return
+        started = time.perf_counter()
+        try:
+            written = self.snapshot.save(self._data, self.store.backend, self._synced_rev)
+        except Exception as e:
+            logger.error(f"写出状态快照失败: {e}")
+            return
+        if written:
+            logger.info(f"已写出状态快照 {self.snapshot.path}（{len(self._data)} 个用户，{written / 1e6:.1f} MB，耗时 {time.perf_counter() - started:.2f}s）。")
+
+    def close(self) -> None:
+        self.flush()
+        self.store.wait()
+        if self.snapshot is not None and not self.snapshot.readonly and self._data is not None:
+            self.save_snapshot()
+        self.store.close()
+
+
+def open_storage(backend: str, json_path: str, db_path: str, writer_id: str = "main",
+                 owned_fields_only: bool = False) -> UserDataStore:
+    if backend == "json":
+        if owned_fields_only:
+            raise ValueError("只写部分字段（分片 worker）需要 sqlite 存储后端")
+        return UserDataStore(JsonStorage(json_path))
+    if backend == "sqlite":
+        return UserDataStore(
+            SqliteStorage(db_path, legacy_json_path=json_path, writer_id=writer_id),
+            owned_fields_only=owned_fields_only,
+        )
+    raise ValueError(f"未知的存储后端: {backend}")
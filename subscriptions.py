@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+数据中心订阅。
+
+用户可以订阅某个数据中心的数量变化，或者"低于 / 高于某个阈值"；
+开启 /monitor 相当于订阅所有服务商的总数变化。
+
+SubscriptionIndex 是 (服务商, 数据中心) -> {用户: [订阅]} 的倒排索引。
+每次快照变化时只与共享的上一份快照比较一次（diff_snapshots），
+再按发生变化的数据中心查找订阅者，不再遍历全部用户，也不用给每个用户单独保存上次的数量。
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+
+from datacenter import DatacenterSnapshot, provider_name
+
+ANY = "*"         # provider 为 "*" 表示任意服务商
+TOTAL = "*"       # name 为 "*" 表示服务商的服务器总数
+
+KIND_CHANGE = "change"
+KIND_BELOW = "below"
+KIND_ABOVE = "above"
+KIND_NAMES = {KIND_CHANGE: "数量变化", KIND_BELOW: "低于", KIND_ABOVE: "高于"}
+
+MAX_SUBSCRIPTIONS = 20
+
+
+@dataclass(frozen=True)
+class Subscription:
+    provider: str
+    name: str
+    kind: str = KIND_CHANGE
+    threshold: int | None = None
+
+    def triggered(self, old: int, new: int) -> bool:
+        """阈值订阅只在越过阈值的那一次触发，之后数量一直低于（高于）阈值时不再重复提醒。"""
+        if self.kind == KIND_BELOW:
+            return new < self.threshold <= old
+        if self.kind == KIND_ABOVE:
+            return old <= self.threshold < new
+        return old != new
+
+    @property
+    def target(self) -> str:
+        if self.name == TOTAL:
+            return f"{provider_name(self.provider)} 总数"
+        return f"{provider_name(self.provider)} {self.name}"
+
+    def describe(self) -> str:
+        if self.kind == KIND_CHANGE:
+            return f"{self.target}：数量变化"
+        return f"{self.target}：{KIND_NAMES[self.kind]} {self.threshold}"
+
+    def alert_line(self, old: int, new: int) -> str:
+        line = f"- {self.target}: **{old}** → **{new}**"
+        if self.kind != KIND_CHANGE:
+            line += f"（已{KIND_NAMES[self.kind]} {self.threshold}）"
+        return line
+
+    def to_dict(self) -> dict:
+        data = {"provider": self.provider, "name": self.name, "kind": self.kind}
+        if self.threshold is not None:
+            data["threshold"] = self.threshold
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Subscription":
+        return cls(data["provider"], data["name"], data.get("kind", KIND_CHANGE), data.get("threshold"))
+
+
+# /monitor 开启时的隐含订阅：任意服务商的总数变化
+MONITOR_ALL = Subscription(ANY, TOTAL)
+
+
+def user_subscriptions(u_data: dict) -> list[Subscription]:
+    subs = [Subscription.from_dict(d) for d in u_data.get("dc_subscriptions", [])]
+    if u_data.get("dc_monitor_enabled"):
+        subs.append(MONITOR_ALL)
+    return subs
+
+
+def parse_subscription(args: list[str], snapshot: DatacenterSnapshot | None) -> Subscription:
+    """
+    解析 /subscribe 的参数: <数据中心> [below|above N]。
+    数据中心可以写成 "US-1" 或 "hax/US-1"；"hax/*" 表示 Hax 的总数。参数有误时抛出 ValueError（消息可直接回复给用户）。
+    """
+    if not args:
+        raise ValueError("用法: /subscribe <数据中心> [below|above 数量]，例如 /subscribe US-1 below 50")
+    target = args[0]
+    if "/" in target:
+        provider, name = target.split("/", 1)
+        provider = provider.lower()
+    else:
+        provider, name = None, target
+    name = name.replace("./", "")
+
+    if provider is None:
+        if snapshot is None:
+            provider = "hax"
+        else:
+            matches = [p for p, stats in snapshot.providers.items() if name in stats]
+            if len(matches) > 1:
+                raise ValueError(f"有多个服务商都有 {name}，请写成 {matches[0]}/{name} 的形式。")
+            if not matches:
+                raise ValueError(f"当前数据中没有找到 {name}。")
+            provider = matches[0]
+    elif snapshot is not None and name != TOTAL and name not in snapshot.providers.get(provider, {}):
+        raise ValueError(f"当前数据中没有找到 {provider}/{name}。")
+
+    if len(args) == 1:
+        return Subscription(provider, name)
+    if len(args) != 3 or args[1].lower() not in (KIND_BELOW, KIND_ABOVE):
+        raise ValueError("阈值的写法为: below 数量 或 above 数量")
+    try:
+        threshold = int(args[2])
+    except ValueError:
+        raise ValueError("阈值必须是整数。")
+    return Subscription(provider, name, args[1].lower(), threshold)
+
+
+def diff_snapshots(previous: DatacenterSnapshot, current: DatacenterSnapshot) -> dict[tuple[str, str], tuple[int, int]]:
+    """
+    比较两份快照，返回 {(服务商, 数据中心或 "*"): (旧数量, 新数量)}，只包含发生变化的项。
+    只比较两份快照中都有的服务商；新出现或消失的数据中心按 0 计。
+    """
+    changes = {}
+    for provider, stats in current.providers.items():
+        old_stats = previous.providers.get(provider)
+        if old_stats is None or old_stats is stats:
+            continue
+        for name in stats.keys() | old_stats.keys():
+            old, new = old_stats.get(name, 0), stats.get(name, 0)
+            if old != new:
+                changes[(provider, name)] = (old, new)
+        old_total, new_total = previous.totals[provider], current.totals[provider]
+        if old_total != new_total:
+            changes[(provider, TOTAL)] = (old_total, new_total)
+    return changes
+
+
+class SubscriptionIndex:
+    """(服务商, 数据中心) -> {user_id: [Subscription]} 的倒排索引，随用户的订阅增量更新。"""
+
+    def __init__(self):
+        self._index: dict[tuple[str, str], dict[str, list[Subscription]]] = defaultdict(dict)
+        self._by_user: dict[str, list[Subscription]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(subs) for subs in self._by_user.values())
+
+    def set_user(self, user_id: str, subs: list[Subscription]) -> None:
+        self.remove_user(user_id)
+        if not subs:
+            return
+        self._by_user[user_id] = subs
+        for sub in subs:
+            self._index[(sub.provider, sub.name)].setdefault(user_id, []).append(sub)
+
+    def remove_user(self, user_id: str) -> None:
+        for sub in self._by_user.pop(user_id, ()):
+            key = (sub.provider, sub.name)
+            bucket = self._index.get(key)
+            if bucket is not None:
+                bucket.pop(user_id, None)
+                if not bucket:
+                    del self._index[key]
+
+    def rebuild(self, user_data: dict) -> None:
+        self._index.clear()
+        self._by_user.clear()
+        for user_id, u_data in user_data.items():
+            self.set_user(user_id, user_subscriptions(u_data))
+
+    def match(self, changes: dict[tuple[str, str], tuple[int, int]]) -> dict[str, list[tuple[Subscription, int, int]]]:
+        """按变化的数据中心查找被触发的订阅: {user_id: [(订阅, 旧数量, 新数量)]}。"""
+        hits = defaultdict(list)
+        for (provider, name), (old, new) in changes.items():
+            keys = [(provider, name)] + ([(ANY, TOTAL)] if name == TOTAL else [])
+            for key in keys:
+                for user_id, subs in self._index.get(key, {}).items():
+                    for sub in subs:
+                        if sub.triggered(old, new):
+                            hits[user_id].append((sub, old, new))
+        return hits
+
+
+def alert_text(snapshot: DatacenterSnapshot, hits: list[tuple[Subscription, int, int]], changes: dict) -> str:
+    """
+    一个用户本次被触发的订阅合成一条消息：开启了 /monitor 的部分复用快照渲染好的总数变化提醒，
+    其余订阅逐条列出。
+    """
+    parts = []
+    if any(sub == MONITOR_ALL for sub, _, _ in hits):
+        total_changes = tuple((p, old) for (p, name), (old, _) in changes.items() if name == TOTAL)
+        parts.append(snapshot.alert_text(total_changes))
+    lines = [sub.alert_line(old, new) for sub, old, new in hits if sub != MONITOR_ALL]
+    if lines:
+        parts.append("🔔 **数据中心订阅提醒**\n\n" + "\n".join(lines))
+    return "\n\n".join(parts)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 项目是根目录下的平铺模块，测试直接导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,63 @@
+import pytest
+
+import hax
+from http_fixture import FixtureServer, Page, fixture
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    hax._page_cache.clear()
+    yield
+    hax._page_cache.clear()
+
+
+@pytest.fixture
+def server():
+    with FixtureServer() as s:
+        yield s
+
+
+def test_etag_revalidation_returns_cached_result(server):
+    server.pages["/dc"] = Page(fixture("hax_data_center.html"), etag='"v1"')
+    first = hax.get_data_center_stats(server.url("/dc"))
+    assert first["fetched"] and not first["unchanged"] and first["error"] is None
+    assert first["datacenters"]
+
+    second = hax.get_data_center_stats(server.url("/dc"))
+    assert second["unchanged"] and second["datacenters"] == first["datacenters"]
+    assert server.requests[1][1].get("If-None-Match") == '"v1"'
+
+
+def test_identical_body_skips_parsing(server):
+    server.pages["/dc"] = Page(fixture("hax_data_center.html"))
+    calls = []
+
+    def parser(html):
+        calls.append(html)
+        return hax.parse_data_center_page(html)
+
+    hax.get_data_center_stats(server.url("/dc"), parser=parser)
+    result = hax.get_data_center_stats(server.url("/dc"), parser=parser)
+    assert result["unchanged"] and len(calls) == 1
+
+
+def test_changed_body_is_parsed_again(server):
+    server.pages["/dc"] = Page(fixture("hax_data_center.html"), etag='"v1"')
+    hax.get_data_center_stats(server.url("/dc"))
+    server.pages["/dc"] = Page(fixture("woiden_data_center.html"), etag='"v2"')
+    result = hax.get_data_center_stats(server.url("/dc"))
+    assert result["fetched"] and not result["unchanged"]
+
+
+def test_http_error_is_reported(server):
+    server.pages["/dc"] = Page(b"oops", status=500)
+    result = hax.get_data_center_stats(server.url("/dc"))
+    assert not result["fetched"] and "网络请求错误" in result["error"]
+
+
+def test_session_is_reused(server):
+    server.pages["/dc"] = Page(fixture("hax_data_center.html"))
+    hax.get_data_center_stats(server.url("/dc"))
+    session = hax.get_session()
+    hax.get_data_center_stats(server.url("/dc"))
+    assert hax.get_session() is session
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from info_pages import MAX_REMARK_CHARS, MachinePages
+from models import TZ_GMT7, Machine
+
+NOW = datetime(2026, 10, 1, 12, 0, tzinfo=TZ_GMT7)
+
+
+def machines(count, remark="m"):
+    return [Machine(f"uuid-{i}", f"{remark}{i}", "hax", 5 + i % 7, "2026-10-01", None, None) for i in range(count)]
+
+
+def format_left(delta: timedelta) -> str:
+    return f"{delta.days}天"
+
+
+def test_long_remarks_keep_page_under_telegram_limit():
+    pages = MachinePages(format_left)
+    text, page, total = pages.render("1", machines(25, remark="x" * 4000), 0, NOW)
+    assert len(text) < 4096
+    assert "x" * MAX_REMARK_CHARS not in text and "…" in text
+    assert (page, total) == (0, 3)
+
+
+def test_pages_sorted_by_expiry_and_clamped():
+    pages = MachinePages(format_left, page_size=3)
+    ms = machines(7)
+    text, page, total = pages.render("1", ms, 99, NOW)
+    assert (page, total) == (2, 3)
+    first, _, _ = pages.render("1", ms, 0, NOW)
+    assert first.index("「m0」") < first.index("「m1」") < first.index("「m2」")
+
+
+def test_cache_evicts_least_recently_used_user():
+    pages = MachinePages(format_left, max_users=2)
+    lists = {uid: machines(3) for uid in "abc"}
+    pages.render("a", lists["a"], 0, NOW)
+    pages.render("b", lists["b"], 0, NOW)
+    pages.render("a", lists["a"], 0, NOW)
+    pages.render("c", lists["c"], 0, NOW)
+    assert len(pages) == 2
+    assert set(pages._users) == {"a", "c"}
+
+
+def test_replaced_machine_list_is_not_served_from_cache():
+    pages = MachinePages(format_left)
+    pages.render("1", machines(2, remark="old"), 0, NOW)
+    text, _, _ = pages.render("1", machines(2, remark="new"), 0, NOW)
+    assert "「new0」" in text and "old" not in text
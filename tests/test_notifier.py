@@ -0,0 +1,190 @@
+import asyncio
+import time
+
+from telegram.error import Forbidden, NetworkError, RetryAfter
+
+from fake_bot import FakeBot
+from notifier import NotificationDispatcher, TokenBucket
+
+
+class ScriptedBot:
+    """按 chat_id 依次抛出预设的异常，用完后发送成功。"""
+
+    def __init__(self, errors=None):
+        self.errors = {k: list(v) for k, v in (errors or {}).items()}
+        self.sent = []
+        self.calls = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        pending = self.errors.get(str(chat_id))
+        if pending:
+            raise pending.pop(0)
+        self.sent.append((str(chat_id), text))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_delivers_every_message_concurrently():
+    async def scenario():
+        bot = FakeBot(latency=0.01)
+        d = NotificationDispatcher(workers=10, global_rate=1000, per_chat_rate=1000)
+        await d.start(bot)
+        started = time.perf_counter()
+        sent = []
+        for i in range(50):
+            assert d.enqueue(i, f"msg {i}", on_sent=lambda i=i: sent.append(i))
+        await d.join()
+        elapsed = time.perf_counter() - started
+        await d.stop()
+        return bot.sent, sorted(sent), elapsed
+
+    count, sent, elapsed = run(scenario())
+    assert count == 50 and sent == list(range(50))
+    assert elapsed < 50 * 0.01  # 10 个 worker 并发，远小于逐条发送的耗时
+
+
+def test_retry_after_and_network_errors_are_retried():
+    async def scenario():
+        bot = ScriptedBot({"1": [RetryAfter(0)], "2": [NetworkError("boom")]})
+        d = NotificationDispatcher(workers=2, global_rate=1000, per_chat_rate=1000, max_retries=2)
+        await d.start(bot)
+        d.enqueue(1, "a")
+        d.enqueue(2, "b")
+        await d.join()
+        await d.stop()
+        return bot
+
+    bot = run(scenario())
+    assert sorted(bot.sent) == [("1", "a"), ("2", "b")]
+    assert bot.calls == 4
+
+
+def test_gives_up_after_max_retries():
+    failures = []
+
+    async def scenario():
+        bot = ScriptedBot({"1": [RetryAfter(0)] * 5})
+        d = NotificationDispatcher(workers=1, global_rate=1000, per_chat_rate=1000, max_retries=2)
+        await d.start(bot)
+        d.enqueue(1, "a", on_failed=failures.append)
+        await d.join()
+        await d.stop()
+        return bot
+
+    bot = run(scenario())
+    assert bot.sent == [] and bot.calls == 3
+    assert len(failures) == 1 and isinstance(failures[0], RetryAfter)
+
+
+def test_forbidden_calls_on_forbidden_without_retry():
+    blocked, failures = [], []
+
+    async def scenario():
+        bot = ScriptedBot({"42": [Forbidden("bot was blocked by the user")]})
+        d = NotificationDispatcher(workers=1, global_rate=1000, per_chat_rate=1000, on_forbidden=blocked.append)
+        await d.start(bot)
+        d.enqueue(42, "a", on_failed=failures.append)
+        await d.join()
+        await d.stop()
+        return bot
+
+    bot = run(scenario())
+    assert blocked == ["42"] and bot.calls == 1
+    assert isinstance(failures[0], Forbidden)
+
+
+class BlockingBot(ScriptedBot):
+    """send_message 一直等到 release 被设置，用来让消息停留在发送中。"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.release.wait()
+        await super().send_message(chat_id, text, **kwargs)
+
+
+def test_enqueue_fails_when_not_started_or_full():
+    failures = []
+
+    async def scenario():
+        d = NotificationDispatcher(workers=1, queue_size=1)
+        assert not d.enqueue(1, "a", on_failed=failures.append)
+        bot = BlockingBot()
+        await d.start(bot)
+        assert d.enqueue(1, "a")
+        assert not d.enqueue(2, "b", on_failed=failures.append)  # 正在发送的消息也占用队列容量
+        bot.release.set()
+        await d.join()
+        assert d.pending == 0 and d.enqueue(2, "b")
+        await d.join()
+        await d.stop()
+        return bot
+
+    bot = run(scenario())
+    assert len(failures) == 2
+    assert bot.sent == [("1", "a"), ("2", "b")]
+
+
+def test_per_chat_rate_limit_spaces_messages():
+    async def scenario():
+        bot = ScriptedBot()
+        times = []
+        d = NotificationDispatcher(workers=4, global_rate=1000, per_chat_rate=20)
+        await d.start(bot)
+        for _ in range(3):
+            d.enqueue(7, "x", on_sent=lambda: times.append(time.perf_counter()))
+        await d.join()
+        await d.stop()
+        return times
+
+    times = run(scenario())
+    assert len(times) == 3
+    assert times[-1] - times[0] >= 2 / 20 * 0.9
+
+
+def test_token_bucket_reports_wait():
+    bucket = TokenBucket(rate=10, capacity=1)
+    assert bucket.try_acquire() == 0
+    assert 0 < bucket.try_acquire() <= 0.1
+
+
+def test_busy_chat_does_not_hold_up_other_chats():
+    async def scenario():
+        bot = ScriptedBot()
+        sent_at = {}
+        d = NotificationDispatcher(workers=8, global_rate=1000, per_chat_rate=1)
+        await d.start(bot)
+        started = time.perf_counter()
+        for i in range(20):
+            d.enqueue("busy", f"reminder {i}")
+        for chat in range(20):
+            d.enqueue(chat, "alert", on_sent=lambda chat=chat: sent_at.setdefault(chat, time.perf_counter() - started))
+        while len(sent_at) < 20 and time.perf_counter() - started < 3:
+            await asyncio.sleep(0.01)
+        busy_sent = sum(1 for chat, _ in bot.sent if chat == "busy")
+        await d.stop(timeout=0)
+        return sent_at, busy_sent
+
+    sent_at, busy_sent = run(scenario())
+    assert len(sent_at) == 20 and max(sent_at.values()) < 0.5
+    assert busy_sent <= 2  # 积压的聊天仍按每秒 1 条发送
+
+
+def test_messages_to_one_chat_keep_order():
+    async def scenario():
+        bot = ScriptedBot()
+        d = NotificationDispatcher(workers=4, global_rate=1000, per_chat_rate=200)
+        await d.start(bot)
+        for i in range(10):
+            d.enqueue(5, str(i))
+        await d.join()
+        await d.stop()
+        return bot
+
+    bot = run(scenario())
+    assert [text for _, text in bot.sent] == [str(i) for i in range(10)]
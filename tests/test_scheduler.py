@@ -0,0 +1,51 @@
+from scheduler import REMIND_INTERVAL, REMIND_WINDOW, ReminderScheduler, next_reminder_at
+
+NOW = 1_800_000_000
+
+
+def test_next_reminder_at_window_and_interval():
+    expires = NOW + 3 * 86400
+    assert next_reminder_at(expires, None, NOW) == expires - REMIND_WINDOW
+    last = expires - REMIND_WINDOW + 10
+    assert next_reminder_at(expires, last, NOW) == last + REMIND_INTERVAL
+
+
+def test_next_reminder_at_drops_expired_and_last_slot():
+    assert next_reminder_at(NOW - 1, None, NOW) is None
+    expires = NOW + 100
+    assert next_reminder_at(expires, expires - 50, NOW) is None
+
+
+def test_pop_due_in_order_and_only_due():
+    s = ReminderScheduler()
+    s.schedule("u1", "a", NOW + REMIND_WINDOW + 20, None, NOW)
+    s.schedule("u2", "b", NOW + REMIND_WINDOW + 10, None, NOW)
+    s.schedule("u3", "c", NOW + 10 * 86400, None, NOW)
+    assert s.pop_due(NOW + 30) == [("u2", "b"), ("u1", "a")]
+    assert len(s) == 1 and "c" in s
+    assert s.next_due() == NOW + 10 * 86400 - REMIND_WINDOW
+
+
+def test_reschedule_and_discard_use_lazy_deletion():
+    s = ReminderScheduler()
+    s.schedule("u1", "a", NOW + REMIND_WINDOW, None, NOW)
+    s.schedule("u1", "a", NOW + 5 * 86400, None, NOW)  # 续期后旧条目失效
+    s.schedule("u2", "b", NOW + REMIND_WINDOW, None, NOW)
+    s.discard("b")
+    assert s.pop_due(NOW + 1) == []
+    assert s.next_due() == NOW + 5 * 86400 - REMIND_WINDOW
+    assert len(s) == 1
+
+
+def test_expired_machine_is_not_requeued():
+    s = ReminderScheduler()
+    s.schedule("u1", "a", NOW - 60, None, NOW)
+    assert "a" not in s and s.next_due() is None
+
+
+def test_heap_is_compacted_after_many_reschedules():
+    s = ReminderScheduler()
+    for i in range(1000):
+        s.schedule("u1", "a", NOW + REMIND_WINDOW + i, None, NOW)
+    assert len(s._heap) <= 2 * len(s) + 64
+    assert s.pop_due(NOW + 10_000) == [("u1", "a")]
@@ -0,0 +1,82 @@
+import json
+import os
+
+from datacenter import SnapshotFileReader
+
+TEXT = (
+    "--- HAX.CO.ID 数据中心状态 (更新于: 2026-10-01 12:00:00) ---\n"
+    "✅ 数据中心: ./US-1,  VPS 数量: 12\n"
+    "✅ 数据中心: ./EU-1,  VPS 数量: 3\n"
+)
+
+
+def make_reader(tmp_path):
+    return SnapshotFileReader(str(tmp_path / "HaxDataCenter.json"), str(tmp_path / "HaxDataCenter.txt"))
+
+
+def write_json(reader, snapshot):
+    with open(reader.json_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+
+
+def write_text(reader, text=TEXT):
+    with open(reader.text_path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_v2_snapshot_groups_providers_and_keeps_stale(tmp_path):
+    reader = make_reader(tmp_path)
+    write_json(reader, {
+        "version": 2,
+        "seq": 7,
+        "ok": True,
+        "providers": {
+            "hax": {"ok": True, "datacenters": {"./US-1": 12, "Number of VPS Online": 99}},
+            "woiden": {"ok": False, "stale": True, "error": "timeout", "datacenters": {"./DE-1": 4}},
+            "broken": {"ok": False, "error": "HTTP 500", "datacenters": {}},
+        },
+    })
+    assert reader.read() == {"hax": {"US-1": 12}, "woiden": {"DE-1": 4}}
+    assert reader.seq == 7
+
+
+def test_v1_snapshot_is_hax_only(tmp_path):
+    reader = make_reader(tmp_path)
+    write_json(reader, {"version": 1, "seq": 1, "ok": True, "datacenters": {"./SG-1": 5}})
+    assert reader.read() == {"hax": {"SG-1": 5}}
+
+
+def test_failed_or_unknown_snapshot_returns_none(tmp_path):
+    reader = make_reader(tmp_path)
+    write_json(reader, {"version": 2, "seq": 1, "ok": False, "error": "all down", "providers": {}})
+    assert reader.read() is None
+    write_json(reader, {"version": 99, "seq": 2, "ok": True, "providers": {}})
+    assert reader.read() is None
+
+
+def test_corrupt_json_returns_none(tmp_path):
+    reader = make_reader(tmp_path)
+    write_text(reader)
+    with open(reader.json_path, "w", encoding="utf-8") as f:
+        f.write("{truncated")
+    assert reader.read() is None
+
+
+def test_text_fallback_when_json_missing(tmp_path):
+    reader = make_reader(tmp_path)
+    assert reader.read() is None
+    write_text(reader)
+    assert reader.read() == {"hax": {"US-1": 12, "EU-1": 3}}
+    assert reader.seq is None
+
+
+def test_unchanged_file_reuses_parsed_stats(tmp_path):
+    reader = make_reader(tmp_path)
+    write_json(reader, {"version": 2, "seq": 3, "ok": True, "providers": {"hax": {"ok": True, "datacenters": {"./US-1": 1}}}})
+    first = reader.read()
+    assert reader.read() is first
+
+    write_json(reader, {"version": 2, "seq": 4, "ok": True, "providers": {"hax": {"ok": True, "datacenters": {"./US-1": 2}}}})
+    stat = os.stat(reader.json_path)
+    os.utime(reader.json_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert reader.read() == {"hax": {"US-1": 2}}
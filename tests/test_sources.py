@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pytest
+
+import hax
+from datacenter import AsyncDataCenterScraper
+from http_fixture import FixtureServer, Page, fixture
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    hax._page_cache.clear()
+    yield
+    hax._page_cache.clear()
+
+
+@pytest.fixture
+def server():
+    with FixtureServer() as s:
+        s.pages["/hax"] = Page(fixture("hax_data_center.html"), etag='"h1"')
+        s.pages["/woiden"] = Page(fixture("woiden_data_center.html"), etag='"w1"')
+        s.pages["/broken"] = Page(b"oops", status=500)
+        yield s
+
+
+def make_source(server, name, path, threshold=3):
+    source = hax.Source(name, server.url(path), timeout=5, retries=1, backoff=0.0)
+    source.breaker = hax.CircuitBreaker(threshold=threshold, reset_timeout=60)
+    return source
+
+
+def test_fetch_all_sources_keeps_providers_apart(server):
+    sources = [make_source(server, "hax", "/hax"), make_source(server, "woiden", "/woiden")]
+    results = hax.fetch_all_sources(sources)
+    assert set(results) == {"hax", "woiden"}
+    assert results["hax"]["datacenters"]["./US-1"] == 112
+    assert results["woiden"]["datacenters"]["./DE-2"] == 87
+    assert "./DE-2" not in results["hax"]["datacenters"]
+
+
+def test_failing_source_does_not_block_others(server):
+    sources = [make_source(server, "hax", "/hax"), make_source(server, "bad", "/broken")]
+    results = hax.fetch_all_sources(sources)
+    assert results["hax"]["error"] is None and results["hax"]["fetched"]
+    assert not results["bad"]["fetched"] and "网络请求错误" in results["bad"]["error"]
+    # 失败的数据源重试了一次
+    assert [path for path, _ in server.requests].count("/broken") == 2
+
+
+def test_breaker_opens_after_repeated_failures(server):
+    source = make_source(server, "bad", "/broken", threshold=2)
+    hax.fetch_source(source)
+    hax.fetch_source(source)
+    assert source.breaker.state == "open"
+    before = len(server.requests)
+    result = hax.fetch_source(source)
+    assert len(server.requests) == before
+    assert "熔断" in result["error"] and not result["fetched"]
+
+
+def test_breaker_half_open_probe_recovers():
+    breaker = hax.CircuitBreaker(threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == "half-open" and breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_build_snapshot_marks_failed_provider_stale():
+    ok = {"datacenters": {"./US-1": 5}, "error": None, "fetched": True, "unchanged": False}
+    failed = {"datacenters": {}, "error": "timeout", "fetched": False, "unchanged": False}
+    first = hax.build_snapshot({"hax": ok, "woiden": {**ok, "datacenters": {"./DE-1": 7}}}, 1)
+    assert first["ok"] and first["error"] is None and first["version"] == hax.SNAPSHOT_VERSION
+
+    second = hax.build_snapshot({"hax": ok, "woiden": failed}, 2, first)
+    woiden = second["providers"]["woiden"]
+    assert not woiden["ok"] and woiden["stale"]
+    assert woiden["datacenters"] == {"./DE-1": 7}
+    assert second["ok"] and second["error"] == "woiden: timeout"
+    assert "stale" not in second["providers"]["hax"]
+
+
+def test_async_scraper_fetches_all_and_revalidates(server):
+    sources = [make_source(server, "hax", "/hax"), make_source(server, "woiden", "/woiden")]
+    scraper = AsyncDataCenterScraper(sources)
+
+    async def run():
+        try:
+            return await scraper.fetch(), await scraper.fetch()
+        finally:
+            await scraper.aclose()
+
+    first, second = asyncio.run(run())
+    assert first["hax"]["datacenters"]["./US-1"] == 112 and not first["hax"]["unchanged"]
+    assert first["woiden"]["datacenters"]["./DE-2"] == 87
+    assert all(r["unchanged"] for r in second.values())
+    assert second["hax"]["datacenters"] == first["hax"]["datacenters"]
+    etags = [headers.get("If-None-Match") for path, headers in server.requests if path == "/hax"]
+    assert etags == [None, '"h1"']
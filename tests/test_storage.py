@@ -0,0 +1,117 @@
+from sharding import shard_of
+from storage import SqliteStorage, snapshot_owned_fields, snapshot_users
+from models import Machine
+
+EVENT = "2026-10-01"
+
+
+def machine(last_sent=None, event=EVENT, remark="m1"):
+    return Machine.from_dict({
+        "uuid": "11111111-1111-4111-8111-111111111111",
+        "remark": remark,
+        "host_type": "hax",
+        "renewal_days": 5,
+        "last_event_date": event,
+        "last_hourly_reminder_sent": last_sent,
+    })
+
+
+def machine_with_uuid(machine_uuid):
+    m = machine()
+    m.uuid = machine_uuid
+    return m
+
+
+def write(store, user_id, m):
+    data = {user_id: {"machines": [m]}}
+    store.write(store.prepare(snapshot_users(data, [user_id])))
+
+
+def stored(store, user_id="1"):
+    return store.load()[user_id]["machines"][0]
+
+
+def test_upsert_keeps_later_reminder_for_same_event(tmp_path):
+    # worker 写入了更晚的提醒时间，前台随后写回旧的内存副本（例如改了备注）时不能覆盖它
+    worker = SqliteStorage(str(tmp_path / "users.db"), writer_id="shard-0")
+    front = SqliteStorage(str(tmp_path / "users.db"), writer_id="front")
+    write(worker, "1", machine(last_sent="2026-10-05T10:00:00+07:00"))
+    write(front, "1", machine(last_sent="2026-10-05T09:00:00+07:00", remark="renamed"))
+    m = stored(front)
+    assert m.remark == "renamed"
+    assert m.to_dict()["last_hourly_reminder_sent"] == "2026-10-05T10:00:00+07:00"
+
+    write(front, "1", machine(last_sent=None, remark="again"))
+    assert stored(front).to_dict()["last_hourly_reminder_sent"] == "2026-10-05T10:00:00+07:00"
+
+
+def test_upsert_renewal_resets_reminder(tmp_path):
+    store = SqliteStorage(str(tmp_path / "users.db"))
+    write(store, "1", machine(last_sent="2026-10-05T10:00:00+07:00"))
+    write(store, "1", machine(last_sent=None, event="2026-10-06"))
+    m = stored(store)
+    assert m.last_event_date == "2026-10-06"
+    assert m.last_reminder_at is None
+
+
+def test_upsert_later_reminder_wins(tmp_path):
+    store = SqliteStorage(str(tmp_path / "users.db"))
+    write(store, "1", machine(last_sent="2026-10-05T09:00:00+07:00"))
+    write(store, "1", machine(last_sent="2026-10-05T10:00:00+07:00"))
+    assert stored(store).to_dict()["last_hourly_reminder_sent"] == "2026-10-05T10:00:00+07:00"
+
+
+def test_load_changes_skips_own_writes(tmp_path):
+    worker = SqliteStorage(str(tmp_path / "users.db"), writer_id="shard-0")
+    front = SqliteStorage(str(tmp_path / "users.db"), writer_id="front")
+    write(front, "1", machine())
+    write(worker, "2", machine())
+    rev, changes = front.load_changes(0)
+    assert set(changes) == {"2"}
+    assert front.load_changes(rev) == (rev, {})
+    assert set(front.load_changes(0, include_own=True)[1]) == {"1", "2"}
+
+
+def test_shard_of_is_stable_and_in_range():
+    assert shard_of("123456789", 4) == shard_of(123456789, 4)
+    assert {shard_of(str(uid), 4) for uid in range(200)} == {0, 1, 2, 3}
+
+
+def test_worker_reminder_does_not_undo_front_renewal(tmp_path):
+    front = SqliteStorage(str(tmp_path / "users.db"), writer_id="front")
+    worker = SqliteStorage(str(tmp_path / "users.db"), writer_id="shard-0")
+    write(front, "1", machine())
+    stale = worker.load()  # worker 的内存副本
+    write(front, "1", machine(event="2026-10-05"))  # 用户在前台点了"我已续期"
+
+    stale["1"]["machines"][0].last_reminder_at = 1_790_000_000  # 同一轮里 worker 发出了旧到期时间的提醒
+    worker.write_fields(snapshot_owned_fields(stale, ["1"]))
+    m = stored(front)
+    assert m.last_event_date == "2026-10-05"
+    assert m.last_reminder_at is None
+
+
+def test_worker_reminder_does_not_restore_deleted_machine_or_settings(tmp_path):
+    front = SqliteStorage(str(tmp_path / "users.db"), writer_id="front")
+    worker = SqliteStorage(str(tmp_path / "users.db"), writer_id="shard-0")
+    data = {"1": {"dc_monitor_enabled": False, "machines": [machine(), machine_with_uuid("22222222-2222-4222-8222-222222222222")]}}
+    front.write(front.prepare(snapshot_users(data, ["1"])))
+    stale = worker.load()
+
+    data["1"]["machines"].pop(0)
+    data["1"]["dc_monitor_enabled"] = True
+    front.write(front.prepare(snapshot_users(data, ["1"])))
+
+    for m in stale["1"]["machines"]:
+        m.last_reminder_at = 1_790_000_000
+    stale["1"]["is_blocked"] = True
+    worker.write_fields(snapshot_owned_fields(stale, ["1"]))
+
+    u_data = front.load()["1"]
+    assert [m.uuid for m in u_data["machines"]] == ["22222222-2222-4222-8222-222222222222"]
+    assert u_data["machines"][0].last_reminder_at == 1_790_000_000
+    assert u_data["dc_monitor_enabled"] is True and u_data["is_blocked"] is True
+
+    # 合并后的整行对前台和 worker 自己都可见，worker 借此拿到前台的删除和设置
+    assert set(front.load_changes(0)[1]) == {"1"}
+    assert worker.load_changes(0)[1]["1"]["dc_monitor_enabled"] is True
@@ -0,0 +1,85 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from http_fixture import fixture
+from webhook import MAX_BODY, WebhookApp
+
+SECRET = "s3cret"
+UPDATE = fixture("updates/start.json")
+
+
+def call(app, method="POST", path="/telegram", body=b"", secret=SECRET, chunks=None):
+    """直接调用 ASGI 应用，返回 (状态码, 响应正文)。"""
+    headers = [(b"content-type", b"application/json")]
+    if secret is not None:
+        headers.append((b"x-telegram-bot-api-secret-token", secret.encode()))
+    scope = {"type": "http", "method": method, "path": path, "headers": headers}
+    messages = [{"type": "http.request", "body": c, "more_body": True} for c in (chunks or [])]
+    messages.append({"type": "http.request", "body": body, "more_body": False})
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent[0]["status"], sent[1]["body"].decode()
+
+
+def make_app(queue_size=10):
+    application = SimpleNamespace(update_queue=asyncio.Queue(maxsize=queue_size), bot=None)
+    return WebhookApp(application, "/telegram", SECRET)
+
+
+def test_valid_update_is_queued():
+    app = make_app()
+    assert call(app, body=UPDATE) == (200, "ok")
+    update = app.application.update_queue.get_nowait()
+    assert update.update_id == 100000001 and update.message.text == "/start"
+    assert app.received == 1
+
+
+def test_wrong_path_and_method():
+    app = make_app()
+    assert call(app, path="/other", body=UPDATE)[0] == 404
+    assert call(app, method="GET", body=b"")[0] == 405
+    assert app.application.update_queue.empty()
+
+
+def test_bad_or_missing_secret_is_forbidden():
+    app = make_app()
+    assert call(app, body=UPDATE, secret="wrong")[0] == 403
+    assert call(app, body=UPDATE, secret=None)[0] == 403
+    assert app.rejected == 2
+    assert app.application.update_queue.empty()
+
+
+def test_invalid_json_and_non_object_are_bad_request():
+    app = make_app()
+    assert call(app, body=b"{not json")[0] == 400
+    assert call(app, body=b"[1, 2, 3]")[0] == 400
+    assert call(app, body=b'"text"')[0] == 400
+    assert app.application.update_queue.empty()
+
+
+def test_oversized_body_is_rejected():
+    app = make_app()
+    assert call(app, body=b"x", chunks=[b" " * MAX_BODY])[0] == 413
+
+
+def test_full_queue_returns_503():
+    app = make_app(queue_size=1)
+    assert call(app, body=UPDATE)[0] == 200
+    assert call(app, body=UPDATE) == (503, "busy")
+    assert app.received == 1
+
+
+def test_healthz_reports_queue_length():
+    app = make_app()
+    call(app, body=UPDATE)
+    status, body = call(app, method="GET", path="/healthz", secret=None)
+    assert status == 200
+    assert json.loads(body) == {"queue": 1, "received": 1}
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Webhook 模式：用内嵌的 ASGI 服务（uvicorn）接收 Telegram 推送的更新，代替 run_polling。
+
+- 只接受 POST 到 BOT_WEBHOOK_PATH 的请求，并校验 X-Telegram-Bot-Api-Secret-Token；
+- 更新放入有界队列（application.update_queue），队列满时返回 503，Telegram 会稍后重发；
+- GET /healthz 返回队列长度，便于探活。
+
+本地调试：不设置 BOT_WEBHOOK_URL 时不会调用 setWebhook，可以直接把录制好的 Update JSON 投递到本地服务:
+    python webhook.py post benchmarks/fixtures/updates/start.json --secret <BOT_WEBHOOK_SECRET>
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hmac
+import json
+import logging
+import signal
+import urllib.request
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = b"x-telegram-bot-api-secret-token"
+MAX_BODY = 1 << 20  # Telegram 的单个更新远小于 1 MB
+
+
+class WebhookApp:
+    """最小的 ASGI 应用，把校验通过的更新交给 application.update_queue。"""
+
+    def __init__(self, application: Application, path: str, secret_token: str):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token.encode("utf-8")
+        self.received = 0
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            # 生命周期由 serve_webhook 自己管理，这里只应答
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        if scope["path"] == "/healthz" and scope["method"] == "GET":
+            body = json.dumps({"queue": self.application.update_queue.qsize(), "received": self.received})
+            await self._respond(send, 200, body)
+            return
+        if scope["path"] != self.path:
+            await self._respond(send, 404, "not found")
+            return
+        if scope["method"] != "POST":
+            await self._respond(send, 405, "method not allowed")
+            return
+
+        token = dict(scope["headers"]).get(SECRET_HEADER, b"")
+        if not hmac.compare_digest(token, self.secret_token):
+            self.rejected += 1
+            await self._respond(send, 403, "forbidden")
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._respond(send, 413, "payload too large")
+            return
+        try:
+            payload = json.loads(body)
+            if not isinstance(payload, dict):
+                raise ValueError(f"更新应为 JSON 对象，收到 {type(payload).__name__}")
+            update = Update.de_json(payload, self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"无法解析 webhook 更新: {e}")
+            await self._respond(send, 400, "bad request")
+            return
+
+        try:
+            self.application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # 返回非 2xx，Telegram 会稍后重新投递
+            logger.warning("更新队列已满，暂时拒绝新的 webhook 更新。")
+            await self._respond(send, 503, "busy")
+            return
+        self.received += 1
+        await self._respond(send, 200, "ok")
+
+    @staticmethod
+    async def _read_body(receive) -> bytes | None:
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    @staticmethod
+    async def _respond(send, status: int, text: str) -> None:
+        body = text.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _make_server(app: WebhookApp, listen: str, port: int):
+    import uvicorn
+
+    class Server(uvicorn.Server):
+        # uvicorn 默认在退出后重新抛出捕获到的 SIGINT/SIGTERM，会打断随后的 application.stop()；
+        # 这里只用信号停止 HTTP 服务，之后正常走完关闭流程
+        @contextlib.contextmanager
+        def capture_signals(self):
+            loop = asyncio.get_running_loop()
+            sigs = [s for s in (signal.SIGINT, signal.SIGTERM) if s is not None]
+            try:
+                for sig in sigs:
+                    loop.add_signal_handler(sig, self.handle_exit, sig, None)
+            except NotImplementedError:  # Windows
+                sigs = []
+            try:
+                yield
+            finally:
+                for sig in sigs:
+                    loop.remove_signal_handler(sig)
+
+    return Server(uvicorn.Config(app, host=listen, port=port, log_level="warning", lifespan="off"))
+
+
+async def serve_webhook(
+    application: Application,
+    *,
+    listen: str,
+    port: int,
+    path: str,
+    secret_token: str,
+    webhook_url: str | None = None,
+    drop_pending_updates: bool = True,
+) -> None:
+    """启动 application 和 uvicorn，直到收到 SIGINT/SIGTERM。等价于 run_webhook，但不依赖 Updater。"""
+    server = _make_server(WebhookApp(application, path, secret_token), listen, port)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip("/") + path,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=drop_pending_updates,
+            )
+            logger.info(f"已设置 webhook: {webhook_url.rstrip('/') + path}")
+        else:
+            logger.info("未设置 BOT_WEBHOOK_URL，跳过 setWebhook（本地调试模式）。")
+        await application.start()
+        logger.info(f"Webhook 服务已启动: http://{listen}:{port}{path}")
+        try:
+            await server.serve()
+        finally:
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+
+def post_update(file: str, url: str, secret: str) -> None:
+    """把录制好的 Update JSON（单个对象或数组）逐个投递到本地 webhook。"""
+    with open(file, "r", encoding="utf-8") as f:
+        updates = json.load(f)
+    for update in updates if isinstance(updates, list) else [updates]:
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(update).encode("utf-8"),
+            headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            print(f"update {update.get('update_id')}: HTTP {response.status}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    post = sub.add_parser("post", help="投递录制的 Update JSON")
+    post.add_argument("file")
+    post.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    post.add_argument("--secret", required=True)
+    args = parser.parse_args()
+    post_update(args.file, args.url, args.secret)